@@ -1,7 +1,10 @@
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from importlib import import_module
+from itertools import islice
 
 from django import forms
 from django.conf import settings
@@ -15,6 +18,34 @@ from tom_observations.models import ObservationRecord
 from tom_targets.models import Target
 
 
+def prefetch_map(func, items, max_workers=4):
+    """
+    Lazily yields ``func(item)`` for each of ``items``, in order, while up to ``max_workers`` of the following calls run
+    ahead on a pool of threads. Brokers can use this to fetch the details of each alert concurrently without fetching
+    more than a few alerts past the ones that the caller has consumed. If the caller stops early, the calls that have
+    not started yet are cancelled.
+
+    :param func: The function to call for each item, e.g. one that fetches the details of an alert
+    :type func: callable
+
+    :param items: The items to call ``func`` on
+    :type items: iterable
+
+    :param max_workers: The number of calls to run ahead of the caller
+    :type max_workers: int
+    """
+    items = iter(items)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        pending = deque(executor.submit(func, item) for item in islice(items, max_workers))
+        while pending:
+            result = pending.popleft().result()
+            pending.extend(executor.submit(func, item) for item in islice(items, 1))
+            yield result
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
 DEFAULT_ALERT_CLASSES = [
     'tom_alerts.brokers.lasair.LasairBroker',
     'tom_alerts.brokers.scout.ScoutBroker',
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import requests
 from urllib.parse import urlencode
@@ -10,13 +11,14 @@ from django.core.cache import cache
 
 from tom_alerts.alerts import GenericAlert, GenericBroker, GenericQueryForm
 from tom_targets.models import Target
-from tom_dataproducts.models import ReducedDatum
+from tom_dataproducts.data_processor import bulk_create_reduced_data
 
 logger = logging.getLogger(__name__)
 
 ALERCE_URL = 'https://alerce.online'
 ALERCE_SEARCH_URL = 'https://api.alerce.online/ztf/v1'
 ALERCE_CLASSES_URL = f'{ALERCE_SEARCH_URL}/classifiers'
+ALERCE_PAGE_SIZE = 20
 
 SORT_CHOICES = [(None, 'None'),
                 ('oid', 'Object ID'),
@@ -509,7 +511,7 @@ class ALeRCEBroker(GenericBroker):
 
         payload += [
             ('page', parameters.get('page', 1)),
-            ('page_size', 20),
+            ('page_size', ALERCE_PAGE_SIZE),
         ]
 
         payload += self._clean_classifier_parameters(parameters)
@@ -530,19 +532,27 @@ class ALeRCEBroker(GenericBroker):
 
     def fetch_alerts(self, parameters):
         """
-        Loop through pages of ALeRCE alerts until we reach the maximum pages requested.
-        This simply concatenates all alerts from n pages into a single iterable to be returned.
+        Lazily iterates through pages of ALeRCE alerts until we reach the maximum pages requested, or a page that is not
+        full. The first page is fetched straight away, and each following page is fetched in the background while the
+        alerts of the previous one are consumed, so that a caller that stops early never fetches the remaining pages.
         """
-        response = self._request_alerts(parameters)
-        alerts = response['items']
         broker_feedback = ''
-        current_page = parameters.get('page', 1)
-        if len(alerts) > 0 and current_page < parameters.get('max_pages', 1):
-            # make new request for the next page. (by recursion)
-            parameters['page'] = current_page + 1
-            alerts += self.fetch_alerts(parameters)[0]
-        # Bottom out of recursion and return accumulated alerts
-        return iter(alerts), broker_feedback
+        alerts = self._request_alerts(parameters)['items']
+        return self._paginate_alerts(alerts, parameters), broker_feedback
+
+    def _paginate_alerts(self, alerts, parameters):
+        page = parameters.get('page', 1)
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            while alerts:
+                next_page = None
+                if len(alerts) >= ALERCE_PAGE_SIZE and page < parameters.get('max_pages', 1):
+                    page += 1
+                    next_page = executor.submit(self._request_alerts, {**parameters, 'page': page})
+                yield from alerts
+                alerts = next_page.result()['items'] if next_page else []
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
     def fetch_alert(self, alert_id):
         """
@@ -571,6 +581,7 @@ class ALeRCEBroker(GenericBroker):
         oid = target.name
         lightcurve = self.fetch_lightcurve(oid)
 
+        data = []
         for detection in lightcurve['detections']:
             mjd = Time(detection['mjd'], format='mjd', scale='utc')
             value = {
@@ -579,14 +590,7 @@ class ALeRCEBroker(GenericBroker):
                 'error': detection['sigmapsf'],
                 'telescope': 'ZTF',
             }
-            ReducedDatum.objects.get_or_create(
-                timestamp=mjd.to_datetime(TimezoneInfo()),
-                value=value,
-                source_name=self.name,
-                source_location=oid,
-                data_type='photometry',
-                target=target
-            )
+            data.append((mjd.to_datetime(TimezoneInfo()), value, self.name))
 
         for non_detection in lightcurve['non_detections']:
             mjd = Time(non_detection['mjd'], format='mjd', scale='utc')
@@ -595,14 +599,9 @@ class ALeRCEBroker(GenericBroker):
                 'limit': non_detection['diffmaglim'],
                 'telescope': 'ZTF',
             }
-            ReducedDatum.objects.get_or_create(
-                timestamp=mjd.to_datetime(TimezoneInfo()),
-                value=value,
-                source_name=self.name,
-                source_location=oid,
-                data_type='photometry',
-                target=target
-            )
+            data.append((mjd.to_datetime(TimezoneInfo()), value, self.name))
+
+        bulk_create_reduced_data(target, data, data_type='photometry', source_location=oid)
 
     def to_target(self, alert):
         return Target.objects.create(
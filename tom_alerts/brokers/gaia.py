@@ -12,7 +12,7 @@ from crispy_forms.layout import Fieldset, HTML, Layout
 from django import forms
 
 from tom_alerts.alerts import GenericAlert, GenericBroker, GenericQueryForm
-from tom_dataproducts.models import ReducedDatum
+from tom_dataproducts.data_processor import bulk_create_reduced_data
 
 BASE_BROKER_URL = 'http://gsaweb.ast.cam.ac.uk'
 
@@ -173,25 +173,21 @@ class GaiaBroker(GenericBroker):
         response.raise_for_status()
         html_data = response.text.split('\n')
 
+        data = []
         for entry in html_data[2:]:
             phot_data = entry.split(',')
 
             if len(phot_data) == 3:
                 if 'untrusted' not in phot_data[2] and 'null' not in phot_data[2]:
                     jd = Time(float(phot_data[1]), format='jd', scale='utc')
-                    jd.to_datetime(timezone=TimezoneInfo())
 
                     value = {
                         'magnitude': float(phot_data[2]),
                         'filter': 'G'
                     }
 
-                    rd, _ = ReducedDatum.objects.get_or_create(
-                        timestamp=jd.to_datetime(timezone=TimezoneInfo()),
-                        value=value,
-                        source_name=self.name,
-                        source_location=alert_url,
-                        data_type='photometry',
-                        target=target)
+                    data.append((jd.to_datetime(timezone=TimezoneInfo()), value, self.name))
+
+        bulk_create_reduced_data(target, data, data_type='photometry', source_location=alert_url)
 
         return
@@ -1,4 +1,4 @@
-from tom_alerts.alerts import GenericQueryForm, GenericAlert, GenericBroker
+from tom_alerts.alerts import GenericQueryForm, GenericAlert, GenericBroker, prefetch_map
 from django import forms
 from django.conf import settings
 import requests
@@ -105,6 +105,7 @@ class TNSBroker(GenericBroker):
                 'bot_name': os.getenv('TNS_BOT_NAME', 'BestTOMBot'),
                 'tns_base_url': 'https://sandbox.wis-tns.org/api',  # Note this is the Sandbox URL
                 'group_name': os.getenv('TNS_GROUP_NAME', 'BestTOMGroup'),
+                'max_concurrent_requests': 2,  # Optional, the number of transients to fetch the details of at a time
             },
         }
 
@@ -127,15 +128,22 @@ class TNSBroker(GenericBroker):
 
     @classmethod
     def fetch_alerts(cls, parameters):
+        """
+        Searches the TNS for transients, and lazily yields the details of each one. The details of the following
+        transients are fetched concurrently, up to the ``max_concurrent_requests`` set for the TNS in ``BROKERS``
+        (default 2), so that a caller that stops early never fetches the details of the remaining transients.
+        """
         broker_feedback = ''
 
         transients = cls.fetch_tns_transients(parameters)
+        max_workers = settings.BROKERS['TNS'].get('max_concurrent_requests', 2)
+        alerts = prefetch_map(cls.get_tns_object_info, transients['data'], max_workers=max_workers)
 
-        alerts = []
-        for transient in transients['data']:
-
-            alert = cls.get_tns_object_info(transient)
+        return cls._filter_alerts(alerts, parameters), broker_feedback
 
+    @classmethod
+    def _filter_alerts(cls, alerts, parameters):
+        for alert in alerts:
             if parameters['days_from_nondet'] is not None:
                 last_nondet = 0.
                 first_det = 9999999.
@@ -145,11 +153,9 @@ class TNSBroker(GenericBroker):
                     else:
                         first_det = min(first_det, phot['jd'])
                 if first_det - last_nondet < parameters['days_from_nondet']:
-                    alerts.append(alert)
+                    yield alert
             else:
-                alerts.append(alert)
-
-        return iter(alerts), broker_feedback
+                yield alert
 
     @classmethod
     def to_generic_alert(cls, alert):
@@ -331,6 +331,15 @@ class TestALeRCEBrokerClass(TestCase):
                 alerts.append(alert)
             self.assertEqual(20, len(alerts))
 
+        # Test that the remaining pages are not fetched when the alerts are not all consumed
+        with self.subTest():
+            mock_requests_get.reset_mock()
+            mock_requests_get.side_effect = [first_mock_response, first_mock_response, first_mock_response]
+            alerts, _ = self.broker.fetch_alerts({'max_pages': 5})
+            self.assertEqual(len([alert for alert, _ in zip(alerts, range(30))]), 30)
+            alerts.close()
+            self.assertLessEqual(mock_requests_get.call_count, 3)
+
     @patch('tom_alerts.brokers.alerce.requests.get')
     def test_fetch_alert(self, mock_requests_post):
         """Test fetch_alert broker method."""
@@ -403,6 +412,10 @@ class TestALeRCEBrokerClass(TestCase):
         ALeRCEBroker().process_reduced_data(target)
         self.assertEqual(ReducedDatum.objects.count(), 2)
 
+        # Processing the same light curve again adds no duplicates
+        ALeRCEBroker().process_reduced_data(target)
+        self.assertEqual(ReducedDatum.objects.count(), 2)
+
     def test_to_generic_alert(self):
         """Test to_generic_alert broker method."""
 
@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from tom_alerts.brokers.tns import TNSBroker
+
+
+def create_tns_object(objname, last_nondet_jd, first_det_jd):
+    return {
+        'objname': objname,
+        'photometry': [
+            {'jd': last_nondet_jd, 'remarks': '[Last non detection]'},
+            {'jd': first_det_jd, 'remarks': ''},
+        ]
+    }
+
+
+@override_settings(BROKERS={'TNS': {'api_key': '', 'bot_id': '', 'bot_name': '', 'max_concurrent_requests': 2}})
+class TestTNSBroker(TestCase):
+    def setUp(self):
+        self.objects = {
+            f'2024a{i}': create_tns_object(f'2024a{i}', 2460000, 2460000 + i) for i in range(10)
+        }
+
+    @patch('tom_alerts.brokers.tns.TNSBroker.get_tns_object_info')
+    @patch('tom_alerts.brokers.tns.TNSBroker.fetch_tns_transients')
+    def test_fetch_alerts(self, mock_fetch_transients, mock_get_object_info):
+        mock_fetch_transients.return_value = {'data': [{'objname': name} for name in self.objects]}
+        mock_get_object_info.side_effect = lambda transient: self.objects[transient['objname']]
+
+        alerts, _ = TNSBroker.fetch_alerts({'days_from_nondet': 3})
+
+        self.assertEqual([alert['objname'] for alert in alerts], ['2024a0', '2024a1', '2024a2'])
+
+    @patch('tom_alerts.brokers.tns.TNSBroker.get_tns_object_info')
+    @patch('tom_alerts.brokers.tns.TNSBroker.fetch_tns_transients')
+    def test_fetch_alerts_stops_early(self, mock_fetch_transients, mock_get_object_info):
+        mock_fetch_transients.return_value = {'data': [{'objname': name} for name in self.objects]}
+        mock_get_object_info.side_effect = lambda transient: self.objects[transient['objname']]
+
+        alerts, _ = TNSBroker.fetch_alerts({'days_from_nondet': None})
+
+        self.assertEqual(next(alerts)['objname'], '2024a0')
+        alerts.close()
+        # Only the details of the first transient and the ones fetched ahead of it were requested
+        self.assertLessEqual(mock_get_object_info.call_count, 3)
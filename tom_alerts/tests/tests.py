@@ -10,7 +10,7 @@ from django.urls import reverse
 from guardian.shortcuts import get_perms
 
 from tom_alerts.alerts import GenericBroker, GenericQueryForm, GenericUpstreamSubmissionForm, GenericAlert
-from tom_alerts.alerts import get_service_class, get_service_classes
+from tom_alerts.alerts import get_service_class, get_service_classes, prefetch_map
 from tom_alerts.exceptions import AlertSubmissionException
 from tom_alerts.models import BrokerQuery
 from tom_observations.models import ObservationRecord
@@ -106,6 +106,20 @@ class TestBrokerClass(TestCase):
         self.assertFalse(isinstance(alerts, tuple))
         self.assertEqual(test_alerts[1], list(alerts)[0])
 
+    def test_prefetch_map(self):
+        calls = []
+
+        def fetch(i):
+            calls.append(i)
+            return i * 2
+
+        results = prefetch_map(fetch, range(100), max_workers=3)
+        self.assertEqual([next(results) for _ in range(5)], [0, 2, 4, 6, 8])
+        results.close()
+        # Only the consumed items and the ones running ahead of them were fetched
+        self.assertLessEqual(len(calls), 8)
+        self.assertEqual(list(prefetch_map(fetch, range(10), max_workers=3)), [i * 2 for i in range(10)])
+
     def test_to_generic_alert(self):
         ga = TestBroker().to_generic_alert(test_alerts[0])
         self.assertEqual(ga.name, test_alerts[0]['name'])
@@ -210,6 +224,24 @@ class TestBrokerViews(TestCase):
         # Assert that the HTTPError is handled as expected
         self.assertContains(response, "Issue fetching alerts, please try again.")
 
+    @patch('tom_alerts.tests.tests.TestBroker.fetch_alerts')
+    def test_handle_http_error_while_paginating(self, mock_fetch_alerts):
+        broker_query = BrokerQuery.objects.create(
+            name='find hoth',
+            broker='TEST',
+            parameters={'name': 'Hoth'},
+        )
+
+        def alerts():
+            yield test_alerts[1]
+            raise HTTPError("Test HTTP Error")
+        mock_fetch_alerts.return_value = (alerts(), '')
+
+        response = self.client.get(reverse('tom_alerts:run', kwargs={'pk': broker_query.id}))
+
+        self.assertContains(response, '66')
+        self.assertContains(response, "Issue fetching alerts, please try again.")
+
     def test_update_query(self):
         broker_query = BrokerQuery.objects.create(
             name='find hoth',
@@ -264,6 +264,7 @@ class RunQueryView(LoginRequiredMixin, TemplateView):
 
         context['alerts'] = []
         try:
+            # Brokers may fetch their alerts lazily, so only the alerts that are shown are fetched
             for (i, alert) in enumerate(alerts):
                 if i > 99:
                     # issue 1172 too many alerts causes the cache to overflow
@@ -274,6 +275,8 @@ class RunQueryView(LoginRequiredMixin, TemplateView):
                 context['alerts'].append(generic_alert)
         except StopIteration:
             pass
+        except HTTPError as e:
+            context['broker_feedback'] = f"Issue fetching alerts, please try again.</br>{e}"
 
         # allow the Broker to add to the context (besides the query_results)
         broker_context_additions = broker_class.get_broker_context_data(alerts)
@@ -1,11 +1,12 @@
-import json
 import logging
 import mimetypes
 
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Max
 from importlib import import_module
 
-from tom_dataproducts.models import ReducedDatum
+from tom_dataproducts.models import DATA_TYPE_CHOICES, ReducedDatum, reduced_datum_value_hash
 from tom_targets.sharing import continuous_share_data
 
 logger = logging.getLogger(__name__)
@@ -13,11 +14,19 @@ logger = logging.getLogger(__name__)
 
 DEFAULT_DATA_PROCESSOR_CLASS = 'tom_dataproducts.data_processor.DataProcessor'
 
+# Number of data that ``run_data_processor`` checks for duplicates and inserts at a time, unless the
+# DATA_PROCESSOR_BATCH_SIZE setting is set
+DEFAULT_DATA_PROCESSOR_BATCH_SIZE = 10000
 
-def run_data_processor(dp, dp_type_override=None):
+# Maximum number of value hashes sent to the database in a single duplicate check by ``run_data_processor``
+DUPLICATE_CHECK_BATCH_SIZE = 1000
+
+
+def run_data_processor(dp, dp_type_override=None, batch_size=None):
     """
     Reads the `data_product_type` from the dp parameter and imports the corresponding `DATA_PROCESSORS` specified in
-    `settings.py`, then runs `process_data` and inserts the returned values into the database.
+    `settings.py`, then runs `process_data_in_chunks` and inserts the returned values into the database one chunk at a
+    time, so that memory use is bounded by the batch size rather than the size of the file.
 
     :param dp: DataProduct which will be processed into a list
     :type dp: DataProduct
@@ -26,6 +35,10 @@ def run_data_processor(dp, dp_type_override=None):
     type from the `dp` object is used.
     :type dp_type_override: str, optional
 
+    :param batch_size: Optional. Number of data to check for duplicates and insert at a time. Defaults to the
+    `DATA_PROCESSOR_BATCH_SIZE` setting, or `DEFAULT_DATA_PROCESSOR_BATCH_SIZE`.
+    :type batch_size: int, optional
+
     :returns: QuerySet of `ReducedDatum` objects created by the `run_data_processor` call
     :rtype: `QuerySet` of `ReducedDatum`
     """
@@ -42,57 +55,137 @@ def run_data_processor(dp, dp_type_override=None):
     except (ImportError, AttributeError):
         raise ImportError('Could not import {}. Did you provide the correct path?'.format(processor_class))
 
+    if batch_size is None:
+        batch_size = getattr(settings, 'DATA_PROCESSOR_BATCH_SIZE', DEFAULT_DATA_PROCESSOR_BATCH_SIZE)
+
     data_processor = clazz()
-    # data returned by process_data is a list of 3-tuples: (timestamp, datum, source)
-    data = data_processor.process_data(dp)
+    # each chunk yielded by process_data_in_chunks is a list of 3-tuples: (timestamp, datum, source)
+    data_chunks = data_processor.process_data_in_chunks(dp, batch_size)
     data_type = data_processor.data_type_override() or data_type
 
-    # Add only the new (non-duplicate) ReducedDatum objects to the database
-
-    # 1. For quick O(1) lookup, create a hash table of existing ReducedDatum objects
-
-    # Extract exising ReducedDatums for this target, and create a hash table (dict)
-    # (We make the reduced_dataum.value JSONField dict hashable by converting it to a json string).
-    # This is so we can do O(1) lookups below as we check for duplicate data.
-    existing_reduced_datum_values = {json.dumps(rd.value, sort_keys=True, skipkeys=True): 1
-                                     for rd in ReducedDatum.objects.filter(target=dp.target)}
-
-    # 2. Create the list of new ReducedDatum objects (ready for bulk_create)
-    new_reduced_datums = []
-    skipped_data = []
-    for datum in data:
-        # Check if the value is already in the ReducedDatum table
-        # (via lookup in the hash table created above for this purpose)
-        if json.dumps(datum[1], sort_keys=True, skipkeys=True) in existing_reduced_datum_values:
-            skipped_data.append(datum)
-        else:
-            new_reduced_datums.append(
-                ReducedDatum(target=dp.target, data_product=dp, data_type=data_type,
-                             timestamp=datum[0], value=datum[1], source_name=datum[2]))
-
-    # prior to checking for duplicates, we created the (yet-to-be-inserted) ReducedDatum list like this:
-    # reduced_datums = [ReducedDatum(target=dp.target, data_product=dp, data_type=data_type,
-    #                                timestamp=datum[0], value=datum[1], source_name=datum[2]) for datum in data]
-
-    # 3. Finally, insert the new ReducedDatum objects into the database
-    reduced_datums = ReducedDatum.objects.bulk_create(new_reduced_datums)
+    # ReducedDatums created by this call are the ones with a primary key above any that this DataProduct already has,
+    # which lets them be shared afterwards without keeping every new ReducedDatum in memory
+    last_existing_pk = ReducedDatum.objects.filter(data_product=dp).aggregate(Max('pk'))['pk__max'] or 0
+
+    total_count = 0
+    skipped_count = 0
+    new_count = 0
+    for data in data_chunks:
+        total_count += len(data)
+        # Add only the new (non-duplicate) ReducedDatum objects to the database
+
+        # 1. Hash the value of each incoming datum, and find which of those hashes are already stored for this target.
+        # (ReducedDatum.value_hash is indexed together with the target, so this only reads the matching rows.)
+        # Data inserted from earlier chunks are already in the database, so duplicates across chunks are also found.
+        value_hashes = [reduced_datum_value_hash(datum[1]) for datum in data]
+        existing_value_hashes = set()
+        unique_value_hashes = list(set(value_hashes))
+        for start in range(0, len(unique_value_hashes), DUPLICATE_CHECK_BATCH_SIZE):
+            existing_value_hashes.update(ReducedDatum.objects.filter(
+                target=dp.target, value_hash__in=unique_value_hashes[start:start + DUPLICATE_CHECK_BATCH_SIZE]
+            ).values_list('value_hash', flat=True))
+
+        # 2. Create the list of new ReducedDatum objects (ready for bulk_create). Repeats within the chunk are skipped
+        # as well, so the result does not depend on where the chunk boundaries fall.
+        new_reduced_datums = []
+        for datum, value_hash in zip(data, value_hashes):
+            if value_hash in existing_value_hashes:
+                skipped_count += 1
+            else:
+                existing_value_hashes.add(value_hash)
+                new_reduced_datums.append(
+                    ReducedDatum(target=dp.target, data_product=dp, data_type=data_type,
+                                 timestamp=datum[0], value=datum[1], source_name=datum[2], value_hash=value_hash))
+
+        # 3. Insert the new ReducedDatum objects for this chunk into the database
+        new_count += len(ReducedDatum.objects.bulk_create(new_reduced_datums))
 
     # 4. Trigger any sharing you may have set to occur when new data comes in
     # Encapsulate this in a try/catch so sharing failure doesn't prevent dataproduct ingestion
     try:
-        continuous_share_data(dp.target, reduced_datums)
+        continuous_share_data(dp.target, ReducedDatum.objects.filter(data_product=dp, pk__gt=last_existing_pk))
     except Exception as e:
         logger.warning(f"Failed to share new dataproduct {dp.product_id}: {repr(e)}")
 
     # log what happened
-    if skipped_data:
-        logger.warning(f'{len(skipped_data)} of {len(data)} skipped as duplicates')
-    logger.info(f'{len(new_reduced_datums)} of {len(data)} new ReducedDatums '
+    if skipped_count:
+        logger.warning(f'{skipped_count} of {total_count} skipped as duplicates')
+    logger.info(f'{new_count} of {total_count} new ReducedDatums '
                 f'added for DataProduct: {dp.product_id}')
 
     return ReducedDatum.objects.filter(data_product=dp)
 
 
+def bulk_create_reduced_data(target, data, data_type='photometry', source_location='', batch_size=None):
+    """
+    Creates the ``ReducedDatum`` objects for a list of data that are not already stored for the target, e.g. the light
+    curve of a broker alert. Duplicates are found with one query per ``DUPLICATE_CHECK_BATCH_SIZE`` data and the new
+    data are inserted with ``bulk_create``, rather than issuing a ``get_or_create`` for every datum.
+
+    A datum is a duplicate if the target already has a datum of the same type with the same timestamp, value, source
+    name and source location, which are the fields that were matched by ``get_or_create``.
+
+    :param target: Target with which the data are associated
+    :type target: Target
+
+    :param data: 3-tuples of a timestamp, value and source name, like those returned by ``DataProcessor.process_data``
+    :type data: list
+
+    :param data_type: The data type of the new ``ReducedDatum`` objects
+    :type data_type: str
+
+    :param source_location: The source location of the new ``ReducedDatum`` objects, e.g. the URL of the alert
+    :type source_location: str
+
+    :param batch_size: Optional. Number of data to check for duplicates and insert at a time. Defaults to the
+    `DATA_PROCESSOR_BATCH_SIZE` setting, or `DEFAULT_DATA_PROCESSOR_BATCH_SIZE`.
+    :type batch_size: int, optional
+
+    :returns: The number of new ``ReducedDatum`` objects
+    :rtype: int
+    """
+    if data_type not in [dp_type for dp_type, _ in DATA_TYPE_CHOICES]:
+        raise ValidationError('Not a valid DataProduct type.')
+    if batch_size is None:
+        batch_size = getattr(settings, 'DATA_PROCESSOR_BATCH_SIZE', DEFAULT_DATA_PROCESSOR_BATCH_SIZE)
+
+    seen = set()
+    new_reduced_datums = []
+    for start in range(0, len(data), batch_size):
+        chunk = data[start:start + batch_size]
+        keyed_data = [((timestamp, reduced_datum_value_hash(value), source_name), value)
+                      for timestamp, value, source_name in chunk]
+
+        # Any duplicate must have the same value hash, which is indexed together with the target
+        unique_value_hashes = list({key[1] for key, _ in keyed_data})
+        for hash_start in range(0, len(unique_value_hashes), DUPLICATE_CHECK_BATCH_SIZE):
+            seen.update(ReducedDatum.objects.filter(
+                target=target, data_type=data_type, source_location=source_location,
+                value_hash__in=unique_value_hashes[hash_start:hash_start + DUPLICATE_CHECK_BATCH_SIZE]
+            ).values_list('timestamp', 'value_hash', 'source_name'))
+
+        chunk_reduced_datums = []
+        for key, value in keyed_data:
+            if key in seen:
+                continue
+            seen.add(key)
+            timestamp, value_hash, source_name = key
+            chunk_reduced_datums.append(
+                ReducedDatum(target=target, data_type=data_type, timestamp=timestamp, value=value,
+                             source_name=source_name, source_location=source_location, value_hash=value_hash))
+        new_reduced_datums.extend(ReducedDatum.objects.bulk_create(chunk_reduced_datums))
+
+    # Trigger any sharing you may have set to occur when new data comes in
+    # Encapsulate this in a try/catch so sharing failure doesn't prevent ingestion
+    try:
+        continuous_share_data(target, new_reduced_datums)
+    except Exception as e:
+        logger.warning(f"Failed to share new data for {target.name}: {repr(e)}")
+
+    logger.info(f'{len(new_reduced_datums)} of {len(data)} new ReducedDatums added for Target: {target.name}')
+    return len(new_reduced_datums)
+
+
 class DataProcessor():
 
     FITS_MIMETYPES = ['image/fits', 'application/fits']
@@ -116,6 +209,44 @@ class DataProcessor():
         """
         return []
 
+    def process_data_in_chunks(self, data_product, chunk_size):
+        """
+        Yields the data of a DataProduct in chunks, each in the same format as the list returned by ``process_data``.
+        ``run_data_processor`` checks for duplicates and inserts each chunk before requesting the next one.
+
+        The default implementation splits the list returned by ``process_data``. Subclasses that handle very large files
+        can override this method with a generator that reads or converts the file one chunk at a time, so that the
+        whole file is never held in memory as Python objects. Such an override should fall back to this implementation
+        when a further subclass overrides ``process_data``, see ``_overrides_processing``.
+
+        :param data_product: DataProduct which will be processed into chunks
+        :type data_product: DataProduct
+
+        :param chunk_size: Maximum number of data in each chunk
+        :type chunk_size: int
+
+        :returns: generator of lists of 3-tuples, each with a timestamp, corresponding data, and source
+        :rtype: generator
+        """
+        data = self.process_data(data_product)
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    def _overrides_processing(self, processor_class, method_names=('process_data',)):
+        """
+        Returns whether this processor is a subclass of ``processor_class`` that overrides any of the given methods, in
+        which case the chunks must be built from ``process_data`` rather than by ``processor_class`` reading the file.
+
+        :param processor_class: The class whose ``process_data_in_chunks`` is being run
+        :type processor_class: type
+
+        :param method_names: The names of the methods whose override takes precedence over reading in chunks
+        :type method_names: tuple
+
+        :rtype: bool
+        """
+        return any(getattr(type(self), name) is not getattr(processor_class, name) for name in method_names)
+
     def data_type_override(self):
         """
         Override for the ReducedDatum data type, if you want it to be different from the
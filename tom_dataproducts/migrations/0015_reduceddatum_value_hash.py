@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:58
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+def reduced_datum_value_hash(value):
+    # A copy of tom_dataproducts.models.reduced_datum_value_hash as it was when this migration was written, so that
+    # later changes to the model code do not change what this migration does.
+    return hashlib.sha256(json.dumps(value, sort_keys=True, skipkeys=True).encode('utf-8')).hexdigest()
+
+
+def populate_value_hashes(apps, schema_editor):
+    ReducedDatum = apps.get_model('tom_dataproducts', 'ReducedDatum')
+    # The batching is necessary to avoid memory issues with huge datasets
+    batch_size = 10000
+    batch = []
+    for reduced_datum in ReducedDatum.objects.only('pk', 'value').iterator(chunk_size=batch_size):
+        reduced_datum.value_hash = reduced_datum_value_hash(reduced_datum.value)
+        batch.append(reduced_datum)
+        if len(batch) >= batch_size:
+            ReducedDatum.objects.bulk_update(batch, ['value_hash'])
+            batch = []
+    ReducedDatum.objects.bulk_update(batch, ['value_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_dataproducts', '0014_alter_reduceddatum_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reduceddatum',
+            name='value_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='reduceddatum',
+            index=models.Index(fields=['target', 'value_hash'], name='reduceddatum_value_hash_idx'),
+        ),
+        # The lambda is a noop so this migration remains reversible.
+        migrations.RunPython(populate_value_hashes, lambda *args, **kwargs: None),
+    ]
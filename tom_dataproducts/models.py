@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 import os
 import tempfile
@@ -33,6 +35,20 @@ except AttributeError:
     DATA_TYPE_CHOICES = DEFAULT_DATA_TYPE_CHOICES
 
 
+def reduced_datum_value_hash(value):
+    """
+    Returns a hash of the value of a ``ReducedDatum``, used to detect duplicate data. Values that are equal, regardless
+    of the order of their keys, have the same hash.
+
+    :param value: The value of a ``ReducedDatum``
+    :type value: dict
+
+    :returns: Hexadecimal SHA-256 digest of the canonical JSON representation of the value
+    :rtype: str
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True, skipkeys=True).encode('utf-8')).hexdigest()
+
+
 def find_fits_img_size(filename):
     """
     Returns the size of a FITS image, given a valid FITS image file
@@ -364,6 +380,10 @@ class ReducedDatum(models.Model):
     :param message: Set of ``AlertStreamMessage`` objects this object is associated with.
     :type message: ManyRelatedManager object
 
+    :param value_hash: Hash of ``value``, used to detect duplicate data. Set automatically on save; objects created with
+                       ``bulk_create`` should set it with ``reduced_datum_value_hash``.
+    :type value_hash: str
+
     """
 
     target = models.ForeignKey(BaseTarget, null=False, on_delete=models.CASCADE)
@@ -376,10 +396,14 @@ class ReducedDatum(models.Model):
     source_location = models.CharField(max_length=200, default='', blank=True)
     timestamp = models.DateTimeField(null=False, blank=False, default=timezone.now, db_index=True)
     value = models.JSONField(null=False, blank=False)
+    value_hash = models.CharField(max_length=64, default='', blank=True, editable=False)
     message = models.ManyToManyField(AlertStreamMessage, blank=True)
 
     class Meta:
         get_latest_by = ('timestamp',)
+        indexes = [
+            models.Index(fields=['target', 'value_hash'], name='reduceddatum_value_hash_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         # Validate data_type based on options in settings.py or default types: (type, display)
@@ -389,6 +413,8 @@ class ReducedDatum(models.Model):
         else:
             raise ValidationError('Not a valid DataProduct type.')
 
+        self.value_hash = reduced_datum_value_hash(self.value)
+
         # because we have a custom way of validating the uniqueness of the ReducedDatum,
         #  we need to call full_clean() here to invoke our validate_unique() method.
         self.full_clean()
@@ -0,0 +1,248 @@
+"""
+Helpers for plotting the photometry of a target, shared by the ``photometry_for_target`` template tag and the
+``PhotometryDataView`` that serves the light curve to the plot when the user zooms in.
+
+Light curves with more points per filter than ``max_points`` are binned in time before being sent to the browser, with
+each bin showing the mean magnitude and the full range of the magnitudes and their errors in the bin.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from guardian.shortcuts import get_objects_for_user
+import numpy as np
+import plotly.graph_objs as go
+
+from tom_dataproducts.models import ReducedDatum
+
+PHOTOMETRY_COLOR_MAP = {
+    'r': 'red',
+    'g': 'green',
+    'i': 'black'
+}
+
+
+def get_photometry_datums(user, target):
+    """
+    Returns the photometry ``ReducedDatum`` objects of a target that a user is allowed to see.
+
+    :param user: The user viewing the photometry
+    :type user: User
+
+    :param target: The target whose photometry is returned
+    :type target: Target
+
+    :rtype: QuerySet
+    """
+    try:
+        photometry_data_type = settings.DATA_PRODUCT_TYPES['photometry'][0]
+    except (AttributeError, KeyError):
+        photometry_data_type = 'photometry'
+    datums = ReducedDatum.objects.filter(target=target, data_type=photometry_data_type)
+    if not settings.TARGET_PERMISSIONS_ONLY:
+        datums = get_objects_for_user(user, 'tom_dataproducts.view_reduceddatum', klass=datums)
+    return datums
+
+
+def photometry_series(datums, start=None, end=None):
+    """
+    Reads the photometry of a queryset of ``ReducedDatum`` objects into arrays for each filter. Only the timestamp and
+    value of each datum are fetched from the database. Datums must have a float magnitude and error, or a float limit.
+
+    :param datums: Queryset of photometry ReducedDatums
+    :type datums: QuerySet
+
+    :param start: Optional. Earliest timestamp to include.
+    :type start: datetime
+
+    :param end: Optional. Latest timestamp to include.
+    :type end: datetime
+
+    :returns: Dictionary of filter names to dictionaries of ``time``, ``magnitude``, ``error`` and ``limit`` arrays,
+        with NaN where a datum has no value.
+    :rtype: dict
+    """
+    if start is not None:
+        datums = datums.filter(timestamp__gte=start)
+    if end is not None:
+        datums = datums.filter(timestamp__lte=end)
+
+    rows = {}
+    for timestamp, value in datums.order_by('timestamp').values_list('timestamp', 'value'):
+        if (isinstance(value.get('magnitude', 0), float) and isinstance(value.get('error', 0), float)) \
+                or isinstance(value.get('limit', 0), float):
+            # numpy datetimes have no timezone, so timestamps are stored as naive UTC
+            timestamp = timestamp.astimezone(dt_timezone.utc).replace(tzinfo=None)
+            rows.setdefault(value['filter'], []).append(
+                (timestamp, value.get('magnitude'), value.get('error'), value.get('limit'))
+            )
+
+    series = {}
+    for filter_name, filter_rows in rows.items():
+        times, magnitudes, errors, limits = zip(*filter_rows)
+        series[filter_name] = {
+            'time': np.array(times, dtype='datetime64[us]'),
+            'magnitude': np.array(magnitudes, dtype=float),  # converts None --> nan
+            'error': np.array(errors, dtype=float),
+            'limit': np.array(limits, dtype=float),
+        }
+    return series
+
+
+def bin_photometry(times, magnitudes, errors, n_bins):
+    """
+    Bins detections into ``n_bins`` equal intervals of time. Each non-empty bin is represented by its mean time and
+    mean magnitude, with an envelope from the brightest to the faintest magnitude in the bin, including errors.
+
+    :param times: Times of the detections
+    :type times: numpy.ndarray of datetime64
+
+    :param magnitudes: Magnitudes of the detections
+    :type magnitudes: numpy.ndarray
+
+    :param errors: Errors of the magnitudes, or NaN where there is no error
+    :type errors: numpy.ndarray
+
+    :param n_bins: Number of time bins
+    :type n_bins: int
+
+    :returns: Arrays of the times, mean magnitudes, minimum and maximum magnitudes of each non-empty bin
+    :rtype: tuple
+    """
+    errors = np.nan_to_num(errors)  # missing errors treated as zero
+    bin_indices, counts, filled, mean_times = _time_bins(times, n_bins)
+    mean_magnitudes = np.bincount(bin_indices, magnitudes, n_bins)[filled] / counts[filled]
+    brightest = np.full(n_bins, np.inf)
+    np.minimum.at(brightest, bin_indices, magnitudes - errors)
+    faintest = np.full(n_bins, -np.inf)
+    np.maximum.at(faintest, bin_indices, magnitudes + errors)
+    return mean_times, mean_magnitudes, brightest[filled], faintest[filled]
+
+
+def bin_limits(times, limits, n_bins):
+    """
+    Bins non-detections into ``n_bins`` equal intervals of time. Each non-empty bin is represented by its mean time and
+    its deepest limit.
+
+    :param times: Times of the non-detections
+    :type times: numpy.ndarray of datetime64
+
+    :param limits: Limiting magnitudes of the non-detections
+    :type limits: numpy.ndarray
+
+    :param n_bins: Number of time bins
+    :type n_bins: int
+
+    :returns: Arrays of the times and deepest limits of each non-empty bin
+    :rtype: tuple
+    """
+    bin_indices, counts, filled, mean_times = _time_bins(times, n_bins)
+    deepest = np.full(n_bins, -np.inf)
+    np.maximum.at(deepest, bin_indices, limits)
+    return mean_times, deepest[filled]
+
+
+def _time_bins(times, n_bins):
+    """
+    Returns the bin index of each time, the number of times in each bin, which bins are not empty, and the mean time of
+    each non-empty bin.
+    """
+    start = times.min()
+    offsets = (times - start).astype(np.int64)
+    span = max(int(offsets.max()), 1)
+    bin_indices = np.minimum(np.floor(offsets / span * n_bins).astype(np.int64), n_bins - 1)
+    counts = np.bincount(bin_indices, minlength=n_bins)
+    filled = counts > 0
+    mean_offsets = np.bincount(bin_indices, offsets, n_bins)[filled] / counts[filled]
+    return bin_indices, counts, filled, start + mean_offsets.astype(np.int64).astype('timedelta64[us]')
+
+
+def photometry_plot_data(series, max_points=None):
+    """
+    Creates the Plotly traces for the photometry of a target. The detections and non-detections of a filter are each
+    binned in time if there are more than ``max_points`` of them.
+
+    :param series: Photometry arrays for each filter, as returned by ``photometry_series``
+    :type series: dict
+
+    :param max_points: Optional. Maximum number of points to plot for the detections or non-detections of a filter.
+        If None, every point is plotted.
+    :type max_points: int
+
+    :returns: The list of traces, the list of arrays of y values the plot should show, and whether any data were binned
+    :rtype: tuple
+    """
+    plot_data = []
+    all_ydata = []
+    binned = False
+    for filter_name, filter_values in series.items():
+        detected = ~np.isnan(filter_values['magnitude'])
+        if detected.any():
+            times = filter_values['time'][detected]
+            mags = filter_values['magnitude'][detected]
+            errs = filter_values['error'][detected]
+            if max_points and len(times) > max_points:
+                binned = True
+                times, mags, brightest, faintest = bin_photometry(times, mags, errs, max_points)
+                error_y = dict(type='data', array=faintest - mags, arrayminus=mags - brightest, visible=True)
+                all_ydata.extend([brightest, faintest])
+                name = f'{filter_name} (binned)'
+            else:
+                error_y = dict(type='data', array=errs, visible=True)
+                errs = np.nan_to_num(errs)  # missing errors treated as zero
+                all_ydata.extend([mags + errs, mags - errs])
+                name = filter_name
+            plot_data.append(go.Scatter(
+                x=times.astype(object),
+                y=mags,
+                mode='markers',
+                marker=dict(color=PHOTOMETRY_COLOR_MAP.get(filter_name)),
+                name=name,
+                error_y=error_y
+            ))
+
+        not_detected = ~np.isnan(filter_values['limit'])
+        if not_detected.any():
+            times = filter_values['time'][not_detected]
+            limits = filter_values['limit'][not_detected]
+            name = filter_name + ' non-detection'
+            if max_points and len(times) > max_points:
+                binned = True
+                times, limits = bin_limits(times, limits, max_points)
+                name += ' (binned)'
+            plot_data.append(go.Scatter(
+                x=times.astype(object),
+                y=limits,
+                mode='markers',
+                opacity=0.5,
+                marker=dict(color=PHOTOMETRY_COLOR_MAP.get(filter_name)),
+                marker_symbol=6,  # upside down triangle
+                name=name,
+            ))
+            all_ydata.append(limits)
+    return plot_data, all_ydata, binned
+
+
+def parse_plot_time(value):
+    """
+    Parses a time sent by Plotly, such as the limit of a zoomed axis, which is UTC without a timezone and may be a date
+    alone or have any number of decimal places in the seconds.
+
+    :param value: Time string, e.g. ``2012-02-03 01:40:47.9999``
+    :type value: str
+
+    :returns: Timezone aware datetime
+    :rtype: datetime
+
+    :raises ValueError: If the value is not a valid time
+    """
+    time = parse_datetime(value)
+    if time is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f'Invalid time: {value}')
+        time = datetime.combine(date, datetime.min.time())
+    if timezone.is_naive(time):
+        time = timezone.make_aware(time, dt_timezone.utc)
+    return time
@@ -1,9 +1,9 @@
 import logging
+from datetime import timezone
 import mimetypes
 
-from astropy import units
 import astropy.io.ascii
-from astropy.time import Time, TimezoneInfo
+from astropy.time import Time
 import numpy as np
 from django.core.files.storage import default_storage
 
@@ -30,17 +30,50 @@ class AtlasProcessor(DataProcessor):
         :rtype: list
         """
 
+        if self._guess_mimetype(data_product) in self.PLAINTEXT_MIMETYPES:
+            photometry = self._process_photometry_from_plaintext(data_product)
+            return [(datum.pop('timestamp'), datum, datum.pop('source', 'ATLAS')) for datum in photometry]
+        else:
+            raise InvalidFileFormatException('Unsupported file type')
+
+    def process_data_in_chunks(self, data_product, chunk_size):
+        """
+        Reads an atlas file once and yields its data in chunks, so that only one chunk of datums is held in memory as
+        Python objects at a time.
+
+        :param data_product: Photometric DataProduct which will be processed into the specified format for database
+        ingestion
+        :type data_product: DataProduct
+
+        :param chunk_size: Maximum number of datums in each chunk
+        :type chunk_size: int
+
+        :returns: generator of lists of 3-tuples, each with a timestamp, corresponding data, and source
+        :rtype: generator
+        """
+        if self._overrides_processing(AtlasProcessor, ('process_data', '_process_photometry_from_plaintext')):
+            # A subclass customises the processing, so split the list that it returns instead
+            yield from super().process_data_in_chunks(data_product, chunk_size)
+            return
+
+        if self._guess_mimetype(data_product) not in self.PLAINTEXT_MIMETYPES:
+            raise InvalidFileFormatException('Unsupported file type')
+
+        data = self._read_atlas_table(data_product)
+        for start in range(0, len(data), chunk_size):
+            photometry = self._photometry_from_table(data[start:start + chunk_size])
+            yield [(datum.pop('timestamp'), datum, datum.pop('source', 'ATLAS')) for datum in photometry]
+
+    def _guess_mimetype(self, data_product):
+        """
+        Returns the mimetype of the data product file, assuming plain text if the storage backend has no local path.
+        """
         try:
             mimetype = mimetypes.guess_type(data_product.data.path)[0]
         except NotImplementedError:
             mimetype = 'text/plain'
         logger.debug(f'Processing Atlas data with mimetype {mimetype}')
-
-        if mimetype in self.PLAINTEXT_MIMETYPES:
-            photometry = self._process_photometry_from_plaintext(data_product)
-            return [(datum.pop('timestamp'), datum, datum.pop('source', 'ATLAS')) for datum in photometry]
-        else:
-            raise InvalidFileFormatException('Unsupported file type')
+        return mimetype
 
     def _process_photometry_from_plaintext(self, data_product):
         """
@@ -58,35 +91,70 @@ class AtlasProcessor(DataProcessor):
         :returns: python list containing the photometric data from the DataProduct
         :rtype: list
         """
-        photometry = []
-        signal_to_noise_cutoff = 3.0  # cutoff to turn magnitudes into non-detection limits
+        return self._photometry_from_table(self._read_atlas_table(data_product))
+
+    def _read_atlas_table(self, data_product):
+        """
+        Reads an ATLAS forced photometry file into an astropy ``Table``.
+
+        :param data_product: ATLAS Photometric DataProduct to read
+        :type data_product: DataProduct
 
+        :rtype: Table
+        """
         data_file = default_storage.open(data_product.data.name, 'r')
         data = astropy.io.ascii.read(data_file.read())
         if len(data) < 1:
             raise InvalidFileFormatException('Empty table or invalid file type')
+        return data
+
+    def _photometry_from_table(self, data):
+        """
+        Converts the rows of an ATLAS forced photometry ``Table`` into a list of dicts, one per row. Magnitudes with a
+        flux signal to noise ratio at or below the cutoff become non-detection limits.
+
+        :param data: Table of ATLAS forced photometry
+        :type data: Table
+
+        :returns: python list containing the photometric data from the table
+        :rtype: list
+        """
+        signal_to_noise_cutoff = 3.0  # cutoff to turn magnitudes into non-detection limits
 
+        # Each quantity is calculated for the whole table at once, then the list of data is built in one pass
         try:
-            for datum in data:
-                time = Time(float(datum['##MJD']), format='mjd')
-                utc = TimezoneInfo(utc_offset=0*units.hour)
-                time.format = 'datetime'
-                value = {
-                    'timestamp': time.to_datetime(timezone=utc),
-                    'filter': str(datum['F']),
-                    'telescope': 'ATLAS',
-                }
-                # If the signal is in the noise, calculate the non-detection limit from the reported flux uncertainty.
-                # see https://fallingstar-data.com/forcedphot/resultdesc/
-                signal_to_noise = float(datum['uJy']) / float(datum['duJy'])
-                if signal_to_noise <= signal_to_noise_cutoff:
-                    value['limit'] = 23.9 - 2.5 * np.log10(signal_to_noise_cutoff * float(datum['duJy']))
-                else:
-                    value['magnitude'] = float(datum['m'])
-                    value['error'] = float(datum['dm'])
-
-                photometry.append(value)
+            # Passing a timezone to to_datetime() converts every element separately, so UTC is attached afterwards
+            timestamps = [timestamp.replace(tzinfo=timezone.utc)
+                          for timestamp in Time(np.asarray(data['##MJD'], dtype=float), format='mjd').to_datetime()]
+            filters = np.asarray(data['F']).astype(str).tolist()
+            flux = np.asarray(data['uJy'], dtype=float)
+            flux_error = np.asarray(data['duJy'], dtype=float)
+            if not np.all(flux_error):
+                raise ValueError('Flux uncertainty (duJy) of zero')
+
+            # If the signal is in the noise, calculate the non-detection limit from the reported flux uncertainty.
+            # see https://fallingstar-data.com/forcedphot/resultdesc/
+            with np.errstate(invalid='ignore'):
+                non_detections = (flux / flux_error <= signal_to_noise_cutoff).tolist()
+                limits = (23.9 - 2.5 * np.log10(signal_to_noise_cutoff * flux_error)).tolist()
+            magnitudes = np.asarray(data['m'], dtype=float).tolist()
+            errors = np.asarray(data['dm'], dtype=float).tolist()
         except Exception as e:
             raise InvalidFileFormatException(e)
 
+        photometry = []
+        rows = zip(timestamps, filters, non_detections, limits, magnitudes, errors)
+        for timestamp, filter_name, non_detection, limit, magnitude, error in rows:
+            value = {
+                'timestamp': timestamp,
+                'filter': filter_name,
+                'telescope': 'ATLAS',
+            }
+            if non_detection:
+                value['limit'] = limit
+            else:
+                value['magnitude'] = magnitude
+                value['error'] = error
+            photometry.append(value)
+
         return photometry
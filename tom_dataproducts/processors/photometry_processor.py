@@ -1,8 +1,8 @@
+from datetime import timezone
 import mimetypes
 
-from astropy import units
 from astropy.io import ascii as astropy_ascii
-from astropy.time import Time, TimezoneInfo
+from astropy.time import Time
 import numpy as np
 
 from tom_dataproducts.data_processor import DataProcessor
@@ -30,6 +30,35 @@ class PhotometryProcessor(DataProcessor):
         else:
             raise InvalidFileFormatException('Unsupported file type')
 
+    def process_data_in_chunks(self, data_product, chunk_size):
+        """
+        Reads a photometry file once and yields its data in chunks, so that only one chunk of datums is held in memory
+        as Python objects at a time.
+
+        :param data_product: Photometric DataProduct which will be processed into the specified format for database
+        ingestion
+        :type data_product: DataProduct
+
+        :param chunk_size: Maximum number of datums in each chunk
+        :type chunk_size: int
+
+        :returns: generator of lists of 3-tuples, each with a timestamp, corresponding data, and source
+        :rtype: generator
+        """
+        if self._overrides_processing(PhotometryProcessor, ('process_data', '_process_photometry_from_plaintext')):
+            # A subclass customises the processing, so split the list that it returns instead
+            yield from super().process_data_in_chunks(data_product, chunk_size)
+            return
+
+        mimetype = mimetypes.guess_type(data_product.data.path)[0]
+        if mimetype not in self.PLAINTEXT_MIMETYPES:
+            raise InvalidFileFormatException('Unsupported file type')
+
+        data = self._read_photometry_table(data_product)
+        for start in range(0, len(data), chunk_size):
+            photometry = self._photometry_from_table(data[start:start + chunk_size])
+            yield [(datum.pop('timestamp'), datum, datum.pop('source', '')) for datum in photometry]
+
     def _process_photometry_from_plaintext(self, data_product):
         """
         Processes the photometric data from a plaintext file into a list of dicts. File is read using astropy as
@@ -43,23 +72,43 @@ class PhotometryProcessor(DataProcessor):
         :returns: python list containing the photometric data from the DataProduct
         :rtype: list
         """
+        return self._photometry_from_table(self._read_photometry_table(data_product))
+
+    def _read_photometry_table(self, data_product):
+        """
+        Reads a plaintext photometry file into an astropy ``Table``.
 
-        photometry = []
+        :param data_product: Photometric DataProduct to read
+        :type data_product: DataProduct
 
+        :rtype: Table
+        """
         data = astropy_ascii.read(data_product.data.path)
         if len(data) < 1:
             raise InvalidFileFormatException('Empty table or invalid file type')
+        return data
+
+    def _photometry_from_table(self, data):
+        """
+        Converts the rows of a photometry ``Table`` into a list of dicts, one per row.
+
+        :param data: Table of photometry with a ``time`` column of MJDs
+        :type data: Table
+
+        :returns: python list containing the photometric data from the table
+        :rtype: list
+        """
+        # Convert whole columns at once rather than creating a Time and checking masks for every datum
+        # Passing a timezone to to_datetime() converts every element separately, so UTC is attached afterwards
+        timestamps = [timestamp.replace(tzinfo=timezone.utc)
+                      for timestamp in Time(np.asarray(data['time'], dtype=float), format='mjd').to_datetime()]
+        columns = [np.asarray(data[column_name]).tolist() for column_name in data.colnames]
+        photometry = [dict(zip(['timestamp', *data.colnames], row)) for row in zip(timestamps, *columns)]
 
-        for datum in data:
-            time = Time(float(datum['time']), format='mjd')
-            utc = TimezoneInfo(utc_offset=0*units.hour)
-            time.format = 'datetime'
-            value = {
-                'timestamp': time.to_datetime(timezone=utc),
-            }
-            for column_name in datum.colnames:
-                if not np.ma.is_masked(datum[column_name]):
-                    value[column_name] = datum[column_name]
-            photometry.append(value)
+        # Masked (missing) values are left out of the datum they belong to
+        for column_name in data.colnames:
+            if np.ma.is_masked(data[column_name]):
+                for index in np.flatnonzero(np.ma.getmaskarray(data[column_name])):
+                    del photometry[index][column_name]
 
         return photometry
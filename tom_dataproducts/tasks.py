@@ -13,6 +13,7 @@ from tom_targets.models import Target
 from tom_dataproducts.models import DataProduct
 from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.data_processor import run_data_processor
+from tom_dataproducts.utils import create_image_dataproduct
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -101,3 +102,17 @@ def atlas_query(min_date_mjd, max_date_mjd, target_id, data_product_type, use_re
         return False
 
     return True
+
+
+@task
+def create_image_dataproducts(data_product_ids):
+    """
+    Creates the image data products and the thumbnails of the data products with the given ids, so that saving data
+    products from a facility does not have to wait for them.
+    """
+    for dp in DataProduct.objects.filter(pk__in=data_product_ids):
+        try:
+            create_image_dataproduct(dp)
+            dp.get_preview()
+        except Exception as e:
+            logger.error(f"Unable to create thumbnail for data product {dp.product_id}: {repr(e)}")
@@ -19,6 +19,7 @@ import numpy as np
 
 from tom_dataproducts.forms import DataProductUploadForm, DataShareForm
 from tom_dataproducts.models import DataProduct, ReducedDatum
+from tom_dataproducts.photometry import get_photometry_datums, photometry_plot_data, photometry_series
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
 from tom_dataproducts.single_target_data_service.single_target_data_service import get_service_classes, \
     get_service_class
@@ -219,7 +220,8 @@ def get_photometry_data(context, target, target_share=False):
 
 
 @register.inclusion_tag('tom_dataproducts/partials/photometry_for_target.html', takes_context=True)
-def photometry_for_target(context, target, width=700, height=600, background=None, label_color=None, grid=True):
+def photometry_for_target(context, target, width=700, height=600, background=None, label_color=None, grid=True,
+                          max_points=None):
     """
     Renders a photometric plot for a target.
 
@@ -240,71 +242,17 @@ def photometry_for_target(context, target, width=700, height=600, background=Non
 
     :param grid: Whether to show grid lines.
     :type grid: bool
-    """
-
-    color_map = {
-        'r': 'red',
-        'g': 'green',
-        'i': 'black'
-    }
 
-    try:
-        photometry_data_type = settings.DATA_PRODUCT_TYPES['photometry'][0]
-    except (AttributeError, KeyError):
-        photometry_data_type = 'photometry'
-    photometry_data = {}
-    if settings.TARGET_PERMISSIONS_ONLY:
-        datums = ReducedDatum.objects.filter(target=target, data_type=photometry_data_type)
-    else:
-        datums = get_objects_for_user(context['request'].user,
-                                      'tom_dataproducts.view_reduceddatum',
-                                      klass=ReducedDatum.objects.filter(
-                                        target=target,
-                                        data_type=photometry_data_type))
-
-    for datum in datums:
-        if (isinstance(datum.value.get('magnitude', 0), float) and isinstance(datum.value.get('error', 0), float)) \
-                or isinstance(datum.value.get('limit', 0), float):
-            photometry_data.setdefault(datum.value['filter'], {})
-            photometry_data[datum.value['filter']].setdefault('time', []).append(datum.timestamp)
-            photometry_data[datum.value['filter']].setdefault('magnitude', []).append(datum.value.get('magnitude'))
-            photometry_data[datum.value['filter']].setdefault('error', []).append(datum.value.get('error'))
-            photometry_data[datum.value['filter']].setdefault('limit', []).append(datum.value.get('limit'))
+    :param max_points: Maximum number of points to plot for the detections or non-detections of each filter. Filters
+        with more points are binned in time, and the plot loads the full resolution data for the visible time range
+        when zoomed in. Defaults to the ``PHOTOMETRY_PLOT_MAX_POINTS`` setting, or no binning if that is not set.
+    :type max_points: int
+    """
+    if max_points is None:
+        max_points = getattr(settings, 'PHOTOMETRY_PLOT_MAX_POINTS', None)
 
-    plot_data = []
-    all_ydata = []
-    for filter_name, filter_values in photometry_data.items():
-        if filter_values['magnitude']:
-            series = go.Scatter(
-                x=filter_values['time'],
-                y=filter_values['magnitude'],
-                mode='markers',
-                marker=dict(color=color_map.get(filter_name)),
-                name=filter_name,
-                error_y=dict(
-                    type='data',
-                    array=filter_values['error'],
-                    visible=True
-                )
-            )
-            plot_data.append(series)
-            mags = np.array(filter_values['magnitude'], float)  # converts None --> nan (as well as any strings)
-            errs = np.array(filter_values['error'], float)
-            errs[np.isnan(errs)] = 0.  # missing errors treated as zero
-            all_ydata.append(mags + errs)
-            all_ydata.append(mags - errs)
-        if filter_values['limit']:
-            series = go.Scatter(
-                x=filter_values['time'],
-                y=filter_values['limit'],
-                mode='markers',
-                opacity=0.5,
-                marker=dict(color=color_map.get(filter_name)),
-                marker_symbol=6,  # upside down triangle
-                name=filter_name + ' non-detection',
-            )
-            plot_data.append(series)
-            all_ydata.append(np.array(filter_values['limit'], float))
+    datums = get_photometry_datums(context['request'].user, target)
+    plot_data, all_ydata, binned = photometry_plot_data(photometry_series(datums), max_points)
 
     # scale the y-axis manually so that we know the range ahead of time and can scale the secondary y-axis to match
     if all_ydata:
@@ -370,6 +318,8 @@ def photometry_for_target(context, target, width=700, height=600, background=Non
     return {
         'target': target,
         'plot': offline.plot(fig, output_type='div', show_link=False),
+        'binned': binned,
+        'max_points': max_points,
     }
 
 
@@ -1,6 +1,9 @@
+import datetime
 from unittest.mock import patch
 import logging
 
+from astropy.time import Time
+import numpy as np
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase  # , override_settings
 
@@ -50,3 +53,27 @@ class TestAtlasProcessor(TestCase):
         expected_non_detection_count = 17  # known a priori from test data in test_atlas_fp.csv
         self.assertEqual(expected_non_detection_count,
                          len([datum for datum in photometry if 'limit' in datum.keys()]))
+
+    def test_process_photometry_from_plaintext_keeps_row_order(self):
+        """Test that each row of an ATLAS forced photometry file becomes the datum at the same position, with
+        detections and non-detections mixed.
+        """
+        lines = [
+            '###MJD m dm uJy duJy F\n',
+            '60316.000000 17.349 0.089 400 37 o\n',
+            '60316.010000 17.5 0.1 30 37 c\n',
+            '60316.020000 17.2 0.08 450 37 c\n',
+        ]
+        self.data_product.data.save('test_data.csv', SimpleUploadedFile('test_data.csv', ''.join(lines).encode()))
+
+        photometry = AtlasProcessor()._process_photometry_from_plaintext(self.data_product)
+
+        self.assertEqual(['o', 'c', 'c'], [datum['filter'] for datum in photometry])
+        self.assertEqual([Time(mjd, format='mjd').to_datetime(timezone=datetime.timezone.utc)
+                          for mjd in (60316, 60316.01, 60316.02)],
+                         [datum['timestamp'] for datum in photometry])
+        self.assertEqual({'magnitude': 17.349, 'error': 0.089},
+                         {key: photometry[0][key] for key in ('magnitude', 'error')})
+        self.assertNotIn('magnitude', photometry[1])
+        self.assertAlmostEqual(23.9 - 2.5 * np.log10(3 * 37), photometry[1]['limit'])
+        self.assertEqual(17.2, photometry[2]['magnitude'])
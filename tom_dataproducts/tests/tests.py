@@ -8,6 +8,7 @@ import responses
 from astropy import units
 from astropy.io import fits
 from astropy.table import Table
+from astropy.time import Time
 from datetime import date, time
 from django.test import TestCase, override_settings
 from django.conf import settings
@@ -23,13 +24,17 @@ from unittest.mock import patch
 
 from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.forms import DataProductUploadForm
-from tom_dataproducts.models import DataProduct, is_fits_image_file, ReducedDatum, data_product_path
+from tom_dataproducts.data_processor import DataProcessor, bulk_create_reduced_data, run_data_processor
+from tom_dataproducts.models import (DataProduct, is_fits_image_file, ReducedDatum, data_product_path,
+                                     reduced_datum_value_hash)
+from tom_dataproducts.photometry import bin_photometry, photometry_plot_data, photometry_series
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
 from tom_dataproducts.processors.photometry_processor import PhotometryProcessor
 from tom_dataproducts.processors.spectroscopy_processor import SpectroscopyProcessor
 from tom_dataproducts.utils import create_image_dataproduct
 from tom_observations.tests.utils import FakeRoboticFacility
 from tom_observations.tests.factories import SiderealTargetFactory, ObservingRecordFactory
+from tom_targets.models import PersistentShare, QueuedShare
 
 
 def mock_fits2image(file1, file2, width, height):
@@ -520,6 +525,206 @@ class TestDataProcessor(TestCase):
             self.assertTrue(isinstance(lightcurve, list))
             self.assertEqual(len(lightcurve), 3)
 
+    def test_process_photometry_from_plaintext_with_masked_values(self):
+        lightcurve = b'time,filter,magnitude,error,limit\n55959.07,r,15.582,0.005,\n55960.07,r,,,19.1\n'
+        self.data_product.data.save('lightcurve.csv', SimpleUploadedFile('lightcurve.csv', lightcurve))
+        detection, non_detection = self.photometry_data_processor._process_photometry_from_plaintext(self.data_product)
+        self.assertEqual(detection['magnitude'], 15.582)
+        self.assertNotIn('limit', detection)
+        self.assertEqual(non_detection['limit'], 19.1)
+        self.assertNotIn('magnitude', non_detection)
+        self.assertEqual(non_detection['timestamp'],
+                         Time(55960.07, format='mjd').to_datetime(timezone=datetime.timezone.utc))
+
+    def test_process_photometry_from_plaintext_keeps_row_order(self):
+        lightcurve = (b'time,filter,magnitude,error\n'
+                      b'55959.07,r,15.582,0.005\n55960.07,g,16.2,0.01\n55961.57,r,15.6,0.006\n')
+        self.data_product.data.save('lightcurve.csv', SimpleUploadedFile('lightcurve.csv', lightcurve))
+        photometry = self.photometry_data_processor._process_photometry_from_plaintext(self.data_product)
+        expected_rows = [(55959.07, 'r', 15.582, 0.005), (55960.07, 'g', 16.2, 0.01), (55961.57, 'r', 15.6, 0.006)]
+        self.assertEqual(photometry, [
+            {'timestamp': Time(mjd, format='mjd').to_datetime(timezone=datetime.timezone.utc),
+             'time': mjd, 'filter': filter_name, 'magnitude': magnitude, 'error': error}
+            for mjd, filter_name, magnitude, error in expected_rows
+        ])
+
+    def test_run_data_processor_in_batches(self):
+        with open('tom_dataproducts/tests/test_data/test_lightcurve.csv', 'rb') as lightcurve_file:
+            self.data_product.data.save('lightcurve.csv', lightcurve_file)
+        self.data_product.data_product_type = 'photometry'
+        self.data_product.save()
+        with patch.object(ReducedDatum.objects, 'bulk_create', wraps=ReducedDatum.objects.bulk_create) as bulk_create:
+            reduced_datums = run_data_processor(self.data_product, batch_size=2)
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [2, 1])
+        self.assertEqual(reduced_datums.count(), 3)
+
+    def test_default_process_data_in_chunks(self):
+        data = [(timezone.now(), {'magnitude': i}, '') for i in range(5)]
+        with patch('tom_dataproducts.data_processor.DataProcessor.process_data', return_value=data):
+            chunks = list(DataProcessor().process_data_in_chunks(self.data_product, 2))
+        self.assertEqual(chunks, [data[:2], data[2:4], data[4:]])
+
+    def test_process_data_in_chunks_uses_overridden_process_data(self):
+        data = [(timezone.now(), {'magnitude': i}, 'custom') for i in range(3)]
+
+        class CustomPhotometryProcessor(PhotometryProcessor):
+            def process_data(self, data_product):
+                return data
+
+        self.data_product.data.save('lightcurve.csv', self.test_file)
+        chunks = list(CustomPhotometryProcessor().process_data_in_chunks(self.data_product, 2))
+        self.assertEqual(chunks, [data[:2], data[2:]])
+
+    def test_run_data_processor_skips_duplicates_within_chunk(self):
+        timestamp = timezone.now()
+        data = [(timestamp, {'magnitude': 15}, ''), (timestamp, {'magnitude': 16}, ''),
+                (timestamp, {'magnitude': 15}, '')]
+        with patch('tom_dataproducts.data_processor.DataProcessor.process_data', return_value=data):
+            reduced_datums = run_data_processor(self.data_product, batch_size=10)
+        self.assertEqual(sorted(rd.value['magnitude'] for rd in reduced_datums), [15, 16])
+
+    def test_run_data_processor_skips_duplicates(self):
+        with open('tom_dataproducts/tests/test_data/test_lightcurve.csv', 'rb') as lightcurve_file:
+            self.data_product.data.save('lightcurve.csv', lightcurve_file)
+        self.data_product.data_product_type = 'photometry'
+        self.data_product.save()
+        reduced_datums = run_data_processor(self.data_product)
+        self.assertEqual(reduced_datums.count(), 3)
+        for reduced_datum in reduced_datums:
+            self.assertEqual(reduced_datum.value_hash, reduced_datum_value_hash(reduced_datum.value))
+
+        # Processing the same file again only checks the hashes of the incoming data and adds nothing
+        with self.assertNumQueries(3):
+            run_data_processor(self.data_product)
+        self.assertEqual(ReducedDatum.objects.filter(target=self.target).count(), 3)
+
+    def test_bulk_create_reduced_data(self):
+        timestamp = timezone.now()
+        existing = ReducedDatum.objects.create(target=self.target, data_type='photometry', timestamp=timestamp,
+                                               value={'magnitude': 15, 'filter': 'r'}, source_name='ALeRCE',
+                                               source_location='ZTF1')
+        data = [
+            (timestamp, {'filter': 'r', 'magnitude': 15}, 'ALeRCE'),  # already stored
+            (timestamp + datetime.timedelta(days=1), {'magnitude': 15, 'filter': 'r'}, 'ALeRCE'),
+            (timestamp + datetime.timedelta(days=2), {'magnitude': 16, 'filter': 'r'}, 'ALeRCE'),
+            (timestamp + datetime.timedelta(days=2), {'magnitude': 16, 'filter': 'r'}, 'ALeRCE'),  # repeated
+        ]
+
+        # One query to check for duplicates, one to insert and one to check for continuous sharing
+        with self.assertNumQueries(3):
+            new_count = bulk_create_reduced_data(self.target, data, source_location='ZTF1')
+
+        self.assertEqual(new_count, 2)
+        reduced_datums = ReducedDatum.objects.filter(target=self.target).exclude(pk=existing.pk).order_by('timestamp')
+        self.assertEqual([rd.timestamp for rd in reduced_datums], [data[1][0], data[2][0]])
+        for reduced_datum in reduced_datums:
+            self.assertEqual(reduced_datum.value_hash, reduced_datum_value_hash(reduced_datum.value))
+            self.assertEqual(reduced_datum.source_location, 'ZTF1')
+
+        # Ingesting the same data again adds nothing
+        self.assertEqual(bulk_create_reduced_data(self.target, data, source_location='ZTF1', batch_size=2), 0)
+        self.assertEqual(ReducedDatum.objects.filter(target=self.target).count(), 3)
+
+    @patch('tom_dataproducts.data_processor.continuous_share_data')
+    def test_bulk_create_reduced_data_shares_new_data(self, mock_share):
+        timestamp = timezone.now()
+        ReducedDatum.objects.create(target=self.target, data_type='photometry', timestamp=timestamp,
+                                    value={'magnitude': 15})
+        data = [(timestamp, {'magnitude': 15}, ''), (timestamp, {'magnitude': 16}, '')]
+        bulk_create_reduced_data(self.target, data)
+
+        mock_share.assert_called_once()
+        target, reduced_datums = mock_share.call_args.args
+        self.assertEqual(target, self.target)
+        self.assertEqual([reduced_datum.value for reduced_datum in reduced_datums], [{'magnitude': 16}])
+
+    def test_bulk_create_reduced_data_queued_for_sharing(self):
+        PersistentShare.objects.create(target=self.target, destination='local_host')
+        data = [(timezone.now() + datetime.timedelta(days=i), {'magnitude': 15 + i}, 'ALeRCE') for i in range(3)]
+        bulk_create_reduced_data(self.target, data)
+        queued_shares = QueuedShare.objects.filter(reduced_datum__target=self.target, destination='local_host')
+        self.assertEqual(queued_shares.count(), 3)
+
+    def test_bulk_create_reduced_data_invalid_type(self):
+        with self.assertRaises(ValidationError):
+            bulk_create_reduced_data(self.target, [(timezone.now(), {'magnitude': 15}, '')], data_type='nonsense')
+
+
+class TestPhotometryPlot(TestCase):
+    def setUp(self):
+        self.target = SiderealTargetFactory.create()
+        self.user = User.objects.create_user(username='test', email='test@example.com')
+        assign_perm(f'{get_target_model_app_label()}.view_target', self.user, self.target)
+        self.client.force_login(self.user)
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        ReducedDatum.objects.bulk_create([
+            ReducedDatum(target=self.target, data_type='photometry', timestamp=start + datetime.timedelta(days=i),
+                         value={'filter': 'r', 'magnitude': 15.0 + i, 'error': 0.1})
+            for i in range(10)
+        ] + [
+            ReducedDatum(target=self.target, data_type='photometry', timestamp=start + datetime.timedelta(days=i),
+                         value={'filter': 'g', 'limit': 19.0 + i})
+            for i in range(4)
+        ])
+
+    def test_bin_photometry(self):
+        times = np.array(['2024-01-01', '2024-01-02', '2024-01-09', '2024-01-11'], dtype='datetime64[us]')
+        magnitudes = np.array([15., 16., 17., 18.])
+        errors = np.array([0.1, np.nan, 0.2, 0.2])
+        bin_times, means, brightest, faintest = bin_photometry(times, magnitudes, errors, 2)
+        np.testing.assert_array_equal(bin_times, np.array(['2024-01-01T12', '2024-01-10'], dtype='datetime64[us]'))
+        np.testing.assert_allclose(means, [15.5, 17.5])
+        np.testing.assert_allclose(brightest, [14.9, 16.8])
+        np.testing.assert_allclose(faintest, [16., 18.2])
+
+    def test_photometry_plot_data_binned(self):
+        series = photometry_series(ReducedDatum.objects.filter(target=self.target))
+        self.assertEqual(len(series['r']['time']), 10)
+
+        plot_data, _, binned = photometry_plot_data(series)
+        self.assertFalse(binned)
+        self.assertEqual([len(trace.x) for trace in plot_data], [10, 4])
+
+        plot_data, _, binned = photometry_plot_data(series, max_points=5)
+        self.assertTrue(binned)
+        self.assertEqual([trace.name for trace in plot_data], ['r (binned)', 'g non-detection'])
+        self.assertEqual(len(plot_data[0].x), 5)
+        self.assertEqual(list(plot_data[0].y), [15.5, 17.5, 19.5, 21.5, 23.5])
+
+    def test_photometry_for_target_binned(self):
+        response = self.client.get(reverse('tom_targets:detail', kwargs={'pk': self.target.id}))
+        self.assertNotContains(response, 'This light curve has been binned')
+
+        with self.settings(PHOTOMETRY_PLOT_MAX_POINTS=5):
+            response = self.client.get(reverse('tom_targets:detail', kwargs={'pk': self.target.id}))
+        self.assertContains(response, 'This light curve has been binned')
+        self.assertContains(response, reverse('dataproducts:photometry-data', kwargs={'pk': self.target.id}))
+
+    def test_photometry_data_view(self):
+        url = reverse('dataproducts:photometry-data', kwargs={'pk': self.target.id})
+        response = self.client.get(url, {'max_points': 5})
+        self.assertTrue(response.json()['binned'])
+
+        response = self.client.get(url, {'max_points': 5, 'start': '2024-01-02 12:00:00.5', 'end': '2024-01-05'})
+        self.assertFalse(response.json()['binned'])
+        self.assertEqual([trace['y'] for trace in response.json()['data']], [[17.0, 18.0, 19.0], [21.0, 22.0]])
+
+    def test_photometry_data_view_invalid_time(self):
+        response = self.client.get(reverse('dataproducts:photometry-data', kwargs={'pk': self.target.id}),
+                                   {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_photometry_data_view_invalid_max_points(self):
+        url = reverse('dataproducts:photometry-data', kwargs={'pk': self.target.id})
+        for max_points in ['-5', '0', 'many']:
+            response = self.client.get(url, {'max_points': max_points})
+            self.assertEqual(response.status_code, 400)
+
+    def test_photometry_data_view_unauthorized(self):
+        self.client.force_login(User.objects.create_user(username='other', email='other@example.com'))
+        response = self.client.get(reverse('dataproducts:photometry-data', kwargs={'pk': self.target.id}))
+        self.assertEqual(response.status_code, 404)
+
 
 class TestDataProductModel(TestCase):
     def setUp(self):
@@ -621,6 +826,11 @@ class TestReducedDatumModel(TestCase):
         # (this is a duplicate ReducedDatum that we are trying to add here
         ReducedDatum.objects.bulk_create([unsaved_reduced_datum])
 
+    def test_value_hash_ignores_key_order(self):
+        reordered_value = dict(reversed(list(self.existing_reduced_datum_value.items())))
+        self.assertEqual(self.existing_reduced_datum.value_hash, reduced_datum_value_hash(reordered_value))
+        self.assertNotEqual(self.existing_reduced_datum.value_hash, reduced_datum_value_hash({'magnitude': 1}))
+
 
 @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'],
                    TARGET_PERMISSIONS_ONLY=True,
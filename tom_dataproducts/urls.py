@@ -4,7 +4,7 @@ from tom_dataproducts.views import DataProductListView, DataProductSaveView, Dat
 from tom_dataproducts.views import DataProductDeleteView, DataProductGroupCreateView
 from tom_dataproducts.views import DataProductGroupDetailView, DataProductGroupDataView, DataProductGroupDeleteView
 from tom_dataproducts.views import DataProductUploadView, DataProductFeatureView, UpdateReducedDataView
-from tom_dataproducts.views import DataShareView, SingleTargetDataServiceQueryView
+from tom_dataproducts.views import DataShareView, SingleTargetDataServiceQueryView, PhotometryDataView
 
 from tom_common.api_router import SharedAPIRootRouter
 from tom_dataproducts.api_views import DataProductViewSet, ReducedDatumViewSet
@@ -24,6 +24,7 @@ urlpatterns = [
     path('data/group/<int:pk>/delete/', DataProductGroupDeleteView.as_view(), name='group-delete'),
     path('data/upload/', DataProductUploadView.as_view(), name='upload'),
     path('data/reduced/update/', UpdateReducedDataView.as_view(), name='update-reduced-data'),
+    path('data/photometry/<int:pk>/', PhotometryDataView.as_view(), name='photometry-data'),
     path('data/single_target_data_service/<str:service>/query/', SingleTargetDataServiceQueryView.as_view(),
          name='single-target-data-service-query'),
     path('data/<int:pk>/delete/', DataProductDeleteView.as_view(), name='delete'),
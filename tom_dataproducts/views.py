@@ -9,8 +9,8 @@ from django.contrib.auth.models import Group
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
 from django.core.management import call_command
-from django.http import HttpResponseRedirect
-from django.shortcuts import redirect
+from django.http import HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
 from django.utils.safestring import mark_safe
 from django.views.generic import View, ListView
@@ -19,6 +19,7 @@ from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, DeleteView, FormView
 from django_filters.views import FilterView
 from guardian.shortcuts import assign_perm, get_objects_for_user
+from plotly.utils import PlotlyJSONEncoder
 
 from tom_common.hooks import run_hook
 from tom_common.hints import add_hint
@@ -28,12 +29,14 @@ from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.forms import AddProductToGroupForm, DataProductUploadForm, DataShareForm
 from tom_dataproducts.filters import DataProductFilter
 from tom_dataproducts.data_processor import run_data_processor
+from tom_dataproducts.photometry import get_photometry_datums, parse_plot_time, photometry_plot_data, photometry_series
 from tom_observations.models import ObservationRecord
 from tom_observations.facility import get_service_class
 from tom_dataproducts.sharing import (share_data_with_hermes, share_data_with_tom, sharing_feedback_handler,
                                       download_data)
 import tom_dataproducts.single_target_data_service.single_target_data_service as stds
 from tom_targets.models import Target
+from tom_targets.permissions import targets_for_user
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -534,3 +537,28 @@ class UpdateReducedDataView(LoginRequiredMixin, RedirectView):
         """
         referer = self.request.META.get('HTTP_REFERER', '/')
         return referer
+
+
+class PhotometryDataView(View):
+    """
+    View that returns the photometry plot traces of a ``Target`` as JSON, optionally limited to the time range given by
+    the ``start`` and ``end`` query parameters. The photometry plot uses this view to load the data at full resolution
+    when it is zoomed in, binning it again only if the visible range still has more than ``max_points`` points.
+    """
+    def get(self, request, *args, **kwargs):
+        target = get_object_or_404(targets_for_user(request.user, Target.objects.all(), 'view_target'), pk=kwargs['pk'])
+        try:
+            start = parse_plot_time(request.GET['start']) if request.GET.get('start') else None
+            end = parse_plot_time(request.GET['end']) if request.GET.get('end') else None
+            if request.GET.get('max_points'):
+                max_points = int(request.GET['max_points'])
+                if max_points < 1:
+                    raise ValueError('max_points must be at least 1')
+            else:
+                max_points = getattr(settings, 'PHOTOMETRY_PLOT_MAX_POINTS', 0)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        datums = get_photometry_datums(request.user, target)
+        plot_data, _, binned = photometry_plot_data(photometry_series(datums, start=start, end=end), max_points)
+        return JsonResponse({'data': plot_data, 'binned': binned}, encoder=PlotlyJSONEncoder)
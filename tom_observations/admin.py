@@ -5,6 +5,7 @@ from tom_observations.models import DynamicCadence, ObservationGroup, Observatio
 
 class DynamicCadenceAdmin(admin.ModelAdmin):
     model = DynamicCadence
+    list_display = ('__str__', 'active', 'last_run_start', 'last_run_duration', 'last_run_status')
 
 
 class ObservationGroupAdmin(admin.ModelAdmin):
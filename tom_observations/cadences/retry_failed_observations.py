@@ -23,9 +23,7 @@ class RetryFailedObservationsStrategy(CadenceStrategy):
     form = RetryFailedObservationsForm
 
     def run(self):
-        failed_observations = [obsr for obsr
-                               in self.dynamic_cadence.observation_group.observation_records.all()
-                               if obsr.failed]
+        failed_observations = self.dynamic_cadence.observation_group.observation_records.failed()
         new_observations = []
         for obs in failed_observations:
             observation_payload = obs.parameters
@@ -1,10 +1,8 @@
-import requests
-
 from django import forms
 from crispy_forms.layout import Div, HTML
 
 from tom_observations.facilities.ocs import (OCSInstrumentConfigLayout, OCSConfigurationLayout,
-                                             OCSFullObservationForm, OCSAdvancedExpansionsLayout)
+                                             OCSFullObservationForm, OCSAdvancedExpansionsLayout, send_request)
 from tom_observations.facilities.lco import LCOFacility, LCOSettings
 from tom_common.exceptions import ImproperCredentialsException
 
@@ -52,7 +50,7 @@ class BLANCOSettings(LCOSettings):
 
 
 def make_request(*args, **kwargs):
-    response = requests.request(*args, **kwargs)
+    response = send_request(*args, **kwargs)
     if 400 <= response.status_code < 500:
         raise ImproperCredentialsException('BLANCO: ' + str(response.content))
     response.raise_for_status()
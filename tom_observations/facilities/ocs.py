@@ -1,7 +1,14 @@
+from collections import defaultdict
 from datetime import datetime
+import functools
 import logging
+import re
 import requests
-from urllib.parse import urlencode, urljoin
+from requests.adapters import HTTPAdapter
+import threading
+import time
+from urllib.parse import urlencode, urljoin, urlsplit
+from urllib3.util.retry import Retry
 
 from astropy import units as u
 from crispy_forms.bootstrap import Accordion, AccordionGroup, TabHolder, Tab, Alert
@@ -10,11 +17,15 @@ from dateutil.parser import parse
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django_tasks.backends.immediate import ImmediateBackend
 
 from tom_common.exceptions import ImproperCredentialsException
 from tom_observations.cadence import CadenceForm
 from tom_observations.facility import BaseRoboticObservationFacility, BaseRoboticObservationForm, get_service_class
 from tom_observations.observation_template import GenericTemplateForm
+from tom_observations.tasks import refresh_ocs_portal_data
 from tom_targets.models import Target
 from tom_targets.base_models import REQUIRED_NON_SIDEREAL_FIELDS, REQUIRED_NON_SIDEREAL_FIELDS_PER_SCHEME
 
@@ -92,6 +103,9 @@ class OCSSettings():
         A plane-parallel atmosphere is assumed.
     """
 
+    # The number of seconds for which the instruments and proposals fetched from the portal are considered up to date
+    portal_data_freshness = {'instruments': 60, 'proposals': 3600}
+
     def __init__(self, facility_name):
         self.facility_name = facility_name
 
@@ -104,6 +118,78 @@ class OCSSettings():
         """
         return [key for key in self.default_settings.keys() if not self.get_setting(key)]
 
+    def get_portal_data(self, kind):
+        """
+        Returns the instruments or proposals of this facility from the cache. Once they are older than
+        ``portal_data_freshness``, they are still returned, but a background task is enqueued to refresh them, so that
+        rendering a form only waits on the portal when nothing has been cached yet. The cache can be kept warm with
+        the ``refreshocsportaldata`` management command.
+
+        The immediate task backend would run the refresh while the form is rendered, so with that backend stale data
+        are only refreshed by the management command, or once they expire from the cache.
+
+        :param kind: Either ``instruments`` or ``proposals``
+        :type kind: str
+
+        :returns: The instruments of this facility, keyed by instrument type, or a list of choices of its current
+            proposals. None if the proposals could not be fetched.
+        """
+        data = cache.get(f'{self.facility_name}_{kind}')
+        if data is None:
+            logger.warning(f'{self.facility_name} {kind} not cached, getting them from the portal')
+            return self.refresh_portal_data(kind)
+        if isinstance(refresh_ocs_portal_data.get_backend(), ImmediateBackend):
+            return data
+        if cache.get(f'{self.facility_name}_{kind}_fresh') is None and \
+                cache.add(f'{self.facility_name}_{kind}_refreshing', True, 300):
+            settings_class = f'{type(self).__module__}.{type(self).__qualname__}'
+            refresh_ocs_portal_data.enqueue(settings_class, self.facility_name, kind)
+        return data
+
+    def refresh_portal_data(self, kind):
+        """
+        Fetches the instruments or proposals of this facility from the portal and stores them in the cache, where they
+        are kept for ``OCS_PORTAL_DATA_CACHE_TIMEOUT`` seconds.
+
+        :param kind: Either ``instruments`` or ``proposals``
+        :type kind: str
+
+        :returns: The fetched instruments or proposals, as returned by ``get_portal_data``
+        """
+        try:
+            data = self.fetch_instruments() if kind == 'instruments' else self.fetch_proposals()
+            if data is not None:
+                cache.set(f'{self.facility_name}_{kind}', data,
+                          getattr(settings, 'OCS_PORTAL_DATA_CACHE_TIMEOUT', 86400))
+                # The freshness marker expires before the data does, so that stale data is refreshed rather than dropped
+                cache.set(f'{self.facility_name}_{kind}_fresh', True, self.portal_data_freshness[kind])
+        finally:
+            # Let the next request enqueue another refresh, even if this one failed
+            cache.delete(f'{self.facility_name}_{kind}_refreshing')
+        return data
+
+    def fetch_instruments(self):
+        try:
+            response = make_request(
+                'GET',
+                urljoin(self.get_setting('portal_url'), '/api/instruments/'),
+                headers={'Authorization': 'Token {0}'.format(self.get_setting('api_key'))}
+            )
+            return {k: v for k, v in response.json().items()}
+        except ImproperCredentialsException:
+            return self.default_instrument_config
+
+    def fetch_proposals(self):
+        try:
+            response = make_request(
+                'GET',
+                urljoin(self.get_setting('portal_url'), '/api/profile/'),
+                headers={'Authorization': 'Token {0}'.format(self.get_setting('api_key'))}
+            )
+        except ImproperCredentialsException:
+            return None
+        return [(p['id'], '{} ({})'.format(p['title'], p['id'])) for p in response.json()['proposals'] if p['current']]
+
     def get_observing_states(self):
         return [
             'PENDING', 'COMPLETED', 'WINDOW_EXPIRED', 'CANCELED', 'FAILURE_LIMIT_REACHED', 'NOT_ATTEMPTED'
@@ -177,8 +263,91 @@ class OCSSettings():
         }
 
 
+_request_stats = defaultdict(lambda: {'count': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0})
+_request_stats_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_session(host):
+    """
+    Returns the keep-alive session used for every request to an OCS host, so that the facilities sharing a portal also
+    share its pool of connections. Requests that fail with a connection error, a 429 or a 5xx response are retried
+    with an exponential backoff, up to ``OCS_REQUEST_RETRIES`` times. Requests that are not idempotent, such as
+    submissions, are not retried.
+
+    :param host: The network location of the OCS portal or archive, e.g. ``observe.lco.global``
+    :type host: str
+
+    :returns: The session for the host
+    :rtype: requests.Session
+    """
+    retries = Retry(total=getattr(settings, 'OCS_REQUEST_RETRIES', 3), backoff_factor=0.5,
+                    status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+    adapter = HTTPAdapter(pool_maxsize=getattr(settings, 'OCS_REQUEST_POOL_SIZE', 10), max_retries=retries)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+@receiver(setting_changed)
+def clear_sessions(setting, **kwargs):
+    if setting in ['OCS_REQUEST_RETRIES', 'OCS_REQUEST_POOL_SIZE']:
+        get_session.cache_clear()
+
+
+def get_request_stats():
+    """
+    Returns the number of requests made to each OCS endpoint by this process, with the number of them that failed and
+    their total and maximum latency in seconds. Endpoints are identified by the method, host and path of the request,
+    with the ids in the path replaced by ``{id}``.
+
+    :returns: A dictionary of endpoints to their statistics
+    :rtype: dict
+    """
+    with _request_stats_lock:
+        return {endpoint: dict(stats) for endpoint, stats in _request_stats.items()}
+
+
+def reset_request_stats():
+    with _request_stats_lock:
+        _request_stats.clear()
+
+
+def _record_request(method, url, elapsed, error):
+    parts = urlsplit(url)
+    path = re.sub(r'/\d+(?=/|$)', '/{id}', parts.path)
+    endpoint = f'{method.upper()} {parts.netloc}{path}'
+    with _request_stats_lock:
+        stats = _request_stats[endpoint]
+        stats['count'] += 1
+        stats['errors'] += int(error)
+        stats['total_time'] += elapsed
+        stats['max_time'] = max(stats['max_time'], elapsed)
+    logger.debug(f'{endpoint} took {elapsed:.3f}s')
+
+
+def send_request(method, url, **kwargs):
+    """
+    Sends a request to an OCS portal or archive on the session for its host, with a timeout of
+    ``OCS_REQUEST_TIMEOUT`` seconds unless one is given, and records its latency in the request statistics.
+
+    :returns: The response to the request
+    :rtype: requests.Response
+    """
+    kwargs.setdefault('timeout', getattr(settings, 'OCS_REQUEST_TIMEOUT', 30))
+    start = time.monotonic()
+    try:
+        response = get_session(urlsplit(url).netloc).request(method, url, **kwargs)
+    except requests.RequestException:
+        _record_request(method, url, time.monotonic() - start, error=True)
+        raise
+    _record_request(method, url, time.monotonic() - start, error=response.status_code >= 400)
+    return response
+
+
 def make_request(*args, **kwargs):
-    response = requests.request(*args, **kwargs)
+    response = send_request(*args, **kwargs)
     if 401 <= response.status_code <= 403:
         raise ImproperCredentialsException('OCS: ' + str(response.content))
     elif 400 == response.status_code:
@@ -213,20 +382,7 @@ class OCSBaseForm(forms.Form):
             return []
 
     def _get_instruments(self):
-        cached_instruments = cache.get(f'{self.facility_settings.facility_name}_instruments')
-        if not cached_instruments:
-            logger.warning("Instruments not cached, getting them again!!!")
-            try:
-                response = make_request(
-                    'GET',
-                    urljoin(self.facility_settings.get_setting('portal_url'), '/api/instruments/'),
-                    headers={'Authorization': 'Token {0}'.format(self.facility_settings.get_setting('api_key'))}
-                )
-                cached_instruments = {k: v for k, v in response.json().items()}
-            except ImproperCredentialsException:
-                cached_instruments = self.facility_settings.default_instrument_config
-            cache.set(f'{self.facility_settings.facility_name}_instruments', cached_instruments, 60)
-        return cached_instruments
+        return self.facility_settings.get_portal_data('instruments')
 
     def get_instruments(self):
         return self._get_instruments()
@@ -276,22 +432,10 @@ class OCSBaseForm(forms.Form):
         return sorted(all_config_types, key=lambda config_type: config_type[1])
 
     def proposal_choices(self):
-        cached_proposals = cache.get(f'{self.facility_settings.facility_name}_proposals')
-        if not cached_proposals:
-            try:
-                response = make_request(
-                    'GET',
-                    urljoin(self.facility_settings.get_setting('portal_url'), '/api/profile/'),
-                    headers={'Authorization': 'Token {0}'.format(self.facility_settings.get_setting('api_key'))}
-                )
-            except ImproperCredentialsException:
-                return [(0, 'No proposals found')]
-            cached_proposals = []
-            for p in response.json()['proposals']:
-                if p['current']:
-                    cached_proposals.append((p['id'], '{} ({})'.format(p['title'], p['id'])))
-            cache.set(f'{self.facility_settings.facility_name}_proposals', cached_proposals, 3600)
-        return cached_proposals
+        proposals = self.facility_settings.get_portal_data('proposals')
+        if proposals is None:
+            return [(0, 'No proposals found')]
+        return proposals
 
 
 class OCSTemplateBaseForm(GenericTemplateForm, OCSBaseForm):
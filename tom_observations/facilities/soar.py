@@ -1,5 +1,3 @@
-import requests
-
 from django import forms
 from crispy_forms.bootstrap import Tab, Alert
 from crispy_forms.layout import Div
@@ -8,6 +6,7 @@ from django.forms.widgets import HiddenInput
 from tom_observations.facilities.lco import LCOFacility, LCOSettings, SpectralInstrumentConfigLayout
 from tom_observations.facilities.lco import LCOImagingObservationForm, LCOSpectroscopyObservationForm
 from tom_observations.facilities.lco import SpectralConfigurationLayout
+from tom_observations.facilities.ocs import send_request
 from tom_common.exceptions import ImproperCredentialsException
 
 
@@ -55,7 +54,7 @@ class SOARSettings(LCOSettings):
 
 
 def make_request(*args, **kwargs):
-    response = requests.request(*args, **kwargs)
+    response = send_request(*args, **kwargs)
     if 400 <= response.status_code < 500:
         raise ImproperCredentialsException('SOAR: ' + str(response.content))
     response.raise_for_status()
@@ -1,8 +1,13 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import copy
+import functools
 from enum import Enum
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+import tempfile
+from urllib3.util.retry import Retry
 
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import ButtonHolder, Layout, Submit, Div, HTML
@@ -10,9 +15,14 @@ from django import forms
 from django.conf import settings
 from django.contrib.auth.models import Group
 from django.core.exceptions import ImproperlyConfigured
-from django.core.files.base import ContentFile
+from django.core.files.base import File
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.module_loading import import_string
 
+from tom_common.hooks import run_hook
 from tom_targets.models import Target
 
 logger = logging.getLogger(__name__)
@@ -48,14 +58,71 @@ except AttributeError:
     AUTO_THUMBNAILS = False
 
 
+def get_download_session():
+    """
+    Returns a ``requests.Session`` for downloading data products. The session keeps a pool of connections to reuse
+    across downloads, sized by the ``DATA_PRODUCT_DOWNLOAD_WORKERS`` setting, and retries requests that fail with a
+    connection error or a transient server error.
+    """
+    pool_size = getattr(settings, 'DATA_PRODUCT_DOWNLOAD_WORKERS', 4)
+    retries = Retry(total=3, backoff_factor=0.5,
+                    status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def run_in_worker_thread(func, *args):
+    """
+    Calls ``func`` with ``args`` on a thread of a pool, then closes the database connections the thread opened, as
+    Django only closes the connections of the threads that handle requests.
+    """
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+def download_to_tempfile(session, url, chunk_size=1024 * 1024):
+    """
+    Streams the file at ``url`` to a temporary file in chunks of ``chunk_size`` bytes, so that large files are never
+    held in memory. The temporary file is deleted when it is closed.
+
+    :returns: The downloaded file, positioned at its start
+    :rtype: file
+    """
+    with session.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        product_file = tempfile.TemporaryFile()
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                product_file.write(chunk)
+        except Exception:
+            product_file.close()
+            raise
+    product_file.seek(0)
+    return product_file
+
+
 def get_service_classes():
+    """
+    Returns a dictionary of the names of the facilities in ``TOM_FACILITY_CLASSES`` to their classes. The classes are
+    imported once per process, so this is cheap to call repeatedly.
+    """
     try:
         TOM_FACILITY_CLASSES = settings.TOM_FACILITY_CLASSES
     except AttributeError:
         TOM_FACILITY_CLASSES = DEFAULT_FACILITY_CLASSES
 
+    return dict(_import_service_classes(tuple(TOM_FACILITY_CLASSES)))
+
+
+@functools.lru_cache(maxsize=None)
+def _import_service_classes(facility_classes):
     service_choices = {}
-    for service in TOM_FACILITY_CLASSES:
+    for service in facility_classes:
         try:
             clazz = import_string(service)
         except (ImportError, AttributeError) as e:
@@ -72,6 +139,51 @@ def get_service_class(name):
         raise ImportError('Could not a find a facility with that name. Did you add it to TOM_FACILITY_CLASSES?')
 
 
+@functools.lru_cache(maxsize=None)
+def _get_service_instance(clazz):
+    return clazz()
+
+
+def get_service_instance(name):
+    """
+    Returns a shared instance of the facility with the given name, created once per process. The instance has no
+    user set, so it should only be used for lookups that do not call the facility's API on behalf of a user, such as
+    ``get_observation_url``.
+    """
+    return _get_service_instance(get_service_class(name))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_observing_states(clazz, method_name):
+    return frozenset(getattr(_get_service_instance(clazz), method_name)())
+
+
+def get_terminal_observing_states(name):
+    """
+    Returns the set of terminal observing states of the facility with the given name, cached per process.
+    """
+    return _get_observing_states(get_service_class(name), 'get_terminal_observing_states')
+
+
+def get_failed_observing_states(name):
+    """
+    Returns the set of failed observing states of the facility with the given name, cached per process.
+    """
+    return _get_observing_states(get_service_class(name), 'get_failed_observing_states')
+
+
+@receiver(setting_changed)
+def clear_facility_caches(setting, **kwargs):
+    """
+    Clears the cached facility classes, instances and observing states when the facility settings are changed, e.g.
+    by ``override_settings`` in tests.
+    """
+    if setting in ('TOM_FACILITY_CLASSES', 'FACILITIES'):
+        _import_service_classes.cache_clear()
+        _get_service_instance.cache_clear()
+        _get_observing_states.cache_clear()
+
+
 class BaseObservationForm(forms.Form):
     """
     This is the class that is responsible for displaying the observation request form.
@@ -530,24 +642,131 @@ class BaseRoboticObservationFacility(BaseObservationFacility):
             record.scheduled_end = status['scheduled_end']
             record.save()
 
-    def update_all_observation_statuses(self, target=None):
-        from tom_observations.models import ObservationRecord
+    def get_observation_statuses(self, observation_ids, max_workers=None):
+        """
+        Return the statuses of many observations at once. By default, this calls ``get_observation_status`` for each
+        observation, using a pool of ``max_workers`` threads to make the requests concurrently. Facilities whose API
+        can return the statuses of many observations in one request should override this method.
+
+        :param observation_ids: The ids of the observations
+        :type observation_ids: list
+
+        :param max_workers: Optional. The number of threads to use. Defaults to the
+            ``OBSERVATION_STATUS_UPDATE_WORKERS`` setting, or 1, which makes the requests one at a time.
+        :type max_workers: int
+
+        :returns: A dictionary of observation ids to the statuses returned by ``get_observation_status``, and a list
+            of ``(observation_id, error message)`` tuples for the observations whose status could not be retrieved
+        :rtype: tuple
+        """
+        if max_workers is None:
+            max_workers = getattr(settings, 'OBSERVATION_STATUS_UPDATE_WORKERS', 1)
+
+        def get_status(observation_id):
+            try:
+                return observation_id, self.get_observation_status(observation_id), None
+            except Exception as e:
+                return observation_id, None, e
+
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(functools.partial(run_in_worker_thread, get_status), observation_ids))
+        else:
+            results = map(get_status, observation_ids)
+
+        statuses = {}
         failed_records = []
+        for observation_id, status, error in results:
+            if error is None:
+                statuses[observation_id] = status
+            else:
+                failed_records.append((observation_id, str(error)))
+        return statuses, failed_records
+
+    def update_all_observation_statuses(self, target=None, max_workers=None):
+        """
+        Updates the status of every ``ObservationRecord`` of this facility that is not in a terminal state, fetching
+        the statuses with ``get_observation_statuses`` and saving the records in bulk.
+
+        Facilities that override ``update_observation_status`` keep their own update logic: the override is called
+        for each record instead, one at a time.
+
+        :param target: Optional. Only update the observations of this target.
+        :type target: Target
+
+        :param max_workers: Optional. The number of threads used to fetch the statuses, passed on to
+            ``get_observation_statuses``.
+        :type max_workers: int
+
+        :returns: A list of ``(observation_id, error message)`` tuples for the observations that failed to update
+        :rtype: list
+        """
+        from tom_observations.models import ObservationRecord
         records = ObservationRecord.objects.filter(facility=self.name)
         if target:
             records = records.filter(target=target)
-        records = records.exclude(status__in=self.get_terminal_observing_states())
+        records = list(records.exclude(status__in=self.get_terminal_observing_states()))
+        if type(self).update_observation_status is not BaseRoboticObservationFacility.update_observation_status:
+            failed_records = []
+            for record in records:
+                try:
+                    self.update_observation_status(record.observation_id)
+                except Exception as e:
+                    failed_records.append((record.observation_id, str(e)))
+            return failed_records
+
+        observation_ids = list(dict.fromkeys(record.observation_id for record in records))
+        statuses, failed_records = self.get_observation_statuses(observation_ids, max_workers=max_workers)
+
+        updated_records = []
+        previous_states = []
+        now = timezone.now()
         for record in records:
-            try:
-                self.update_observation_status(record.observation_id)
-            except Exception as e:
-                failed_records.append((record.observation_id, str(e)))
+            status = statuses.get(record.observation_id)
+            if status is None:
+                continue
+            previous_states.append(record.status)
+            record.status = status['state']
+            record.scheduled_start = status['scheduled_start']
+            record.scheduled_end = status['scheduled_end']
+            # bulk_update does not set auto_now fields
+            record.modified = now
+            updated_records.append(record)
+        ObservationRecord.objects.bulk_update(updated_records,
+                                              ['status', 'scheduled_start', 'scheduled_end', 'modified'],
+                                              batch_size=1000)
+
+        # bulk_update does not call ObservationRecord.save(), so run the hook that save() runs on a change of state
+        for record, previous_state in zip(updated_records, previous_states):
+            if record.status != previous_state:
+                run_hook('observation_change_state', record, previous_state)
         return failed_records
 
-    def save_data_products(self, observation_record, product_id=None):
+    def save_data_products(self, observation_record, product_id=None, max_workers=None):
+        """
+        Saves the data products of an observation that are not already in the TOM. The new data products are downloaded
+        concurrently, and streamed to temporary files in chunks rather than read into memory, before being saved to
+        storage. A data product whose download fails is logged and removed, so that it is downloaded again next time
+        rather than left without data. When ``AUTO_THUMBNAILS`` is set, their thumbnails are created by a background
+        task.
+
+        :param observation_record: The observation to save the data products of
+        :type observation_record: ObservationRecord
+
+        :param product_id: The id of a single data product to save, or None to save all of them
+        :type product_id: str
+
+        :param max_workers: The number of data products to download at a time. Defaults to the
+            ``DATA_PRODUCT_DOWNLOAD_WORKERS`` setting.
+        :type max_workers: int
+
+        :returns: The data products of the observation
+        :rtype: list
+        """
         from tom_dataproducts.models import DataProduct
-        from tom_dataproducts.utils import create_image_dataproduct
+        from tom_dataproducts.tasks import create_image_dataproducts
         final_products = []
+        new_products = {}
         products = self.data_products(observation_record.observation_id, product_id)
 
         for product in products:
@@ -557,15 +776,32 @@ class BaseRoboticObservationFacility(BaseObservationFacility):
                 observation_record=observation_record,
             )
             if created:
-                product_data = requests.get(product['url']).content
-                dfile = ContentFile(product_data)
-                dp.data.save(product['filename'], dfile)
-                dp.save()
-                logger.info('Saved new dataproduct: {}'.format(dp.data))
-            if AUTO_THUMBNAILS:
-                create_image_dataproduct(dp)
-                dp.get_preview()
+                new_products[dp.pk] = (dp, product)
             final_products.append(dp)
+
+        if new_products:
+            if max_workers is None:
+                max_workers = getattr(settings, 'DATA_PRODUCT_DOWNLOAD_WORKERS', 4)
+            with get_download_session() as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(run_in_worker_thread, download_to_tempfile, session, product['url']): dp
+                    for dp, product in new_products.values()
+                }
+                # Only the downloads happen on the pool; each file is saved to storage here as soon as it is ready
+                for future in as_completed(futures):
+                    dp, product = new_products[futures[future].pk]
+                    try:
+                        with future.result() as product_file:
+                            dp.data.save(product['filename'], File(product_file, name=product['filename']))
+                    except Exception as e:
+                        logger.error('Failed to save dataproduct {}: {}'.format(product['id'], repr(e)))
+                        final_products.remove(dp)
+                        dp.delete()
+                        continue
+                    logger.info('Saved new dataproduct: {}'.format(dp.data))
+
+        if AUTO_THUMBNAILS and final_products:
+            create_image_dataproducts.enqueue([dp.pk for dp in final_products])
         return final_products
 
     @abstractmethod
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from tom_observations.utils import get_facility_statuses
+
+
+class Command(BaseCommand):
+    """
+    Fetches the status of every facility and stores it in the cache, so that the facility status page can be served
+    from the cache. It is intended to be run by a cron job more often than ``FACILITY_STATUS_CACHE_TIMEOUT``.
+    """
+
+    help = 'Refreshes the cached status of every facility'
+
+    def handle(self, *args, **options):
+        statuses = get_facility_statuses(refresh=True)
+        return f'Refreshed the status of {len(statuses)} facilities.'
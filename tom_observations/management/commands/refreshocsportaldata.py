@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from tom_observations.facilities.ocs import OCSFacility
+from tom_observations.facility import get_service_classes
+
+
+class Command(BaseCommand):
+    """
+    Fetches the instruments and proposals of every OCS facility and stores them in the cache, so that the observation
+    forms of these facilities never have to wait on the portal. It is intended to be run by a cron job.
+    """
+
+    help = 'Refreshes the cached instruments and proposals of every OCS facility'
+
+    def handle(self, *args, **options):
+        refreshed = []
+        for facility_class in get_service_classes().values():
+            if not issubclass(facility_class, OCSFacility):
+                continue
+            facility_settings = facility_class().facility_settings
+            for kind in ['instruments', 'proposals']:
+                facility_settings.refresh_portal_data(kind)
+            refreshed.append(facility_settings.facility_name)
+        return f'Refreshed the instruments and proposals of {len(refreshed)} OCS facilities.'
@@ -1,10 +1,18 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
 import logging
+import threading
+import time
 import traceback
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
 
 from tom_observations.cadence import get_cadence_strategy
-from tom_observations.models import DynamicCadence
+from tom_observations.models import DynamicCadence, ObservationRecord
 
 
 logger = logging.getLogger(__name__)
@@ -15,37 +23,169 @@ class Command(BaseCommand):
     This management command ensures that all cadences are kept up to date. It is intended to be run
     by a cron job, and the frequency should be whatever is determined to be the desired frequency
     by the PI.
+
+    By default, the cadences are run one at a time. With ``--max_workers_per_facility``, the cadences of each facility
+    are run on their own pool of threads, so that a slow facility does not hold up the others. The start, duration and
+    outcome of each run are stored on the ``DynamicCadence``, and cadences whose last run is still in flight are
+    skipped.
+
+    ``--timeout`` only stops the command waiting for a cadence and marks it as timed out. Threads cannot be stopped, so
+    the cadence keeps running and the process does not exit until it finishes; use a cron wrapper such as ``timeout``
+    to bound the process itself.
     """
 
     help = 'Entry point for running cadence strategies.'
 
-    def handle(self, *args, **kwargs):
-        cadenced_groups = DynamicCadence.objects.filter(active=True)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max_workers_per_facility',
+            type=int,
+            default=getattr(settings, 'CADENCE_MAX_WORKERS_PER_FACILITY', None),
+            help='Run the cadences of each facility concurrently, with at most this many at a time per facility.'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=None,
+            help='Mark a concurrently run cadence as timed out and stop waiting for it after this many seconds. The '
+                 'cadence keeps running until it finishes, so this does not bound how long the process runs.'
+        )
+        parser.add_argument(
+            '--stale_after',
+            type=float,
+            default=60,
+            help='Minutes after which a cadence that is still marked as running is assumed to have died, and is run '
+                 'again.'
+        )
 
-        updated_cadences = []
+    def handle(self, *args, **options):
+        now = timezone.now()
+        in_flight = Q(last_run_status__in=[DynamicCadence.RUNNING, DynamicCadence.TIMED_OUT],
+                      last_run_start__gt=now - timedelta(minutes=options['stale_after']))
+        latest_facility = ObservationRecord.objects.filter(
+            observationgroup=OuterRef('observation_group')
+        ).order_by('-created').values('facility')[:1]
+        cadenced_groups = DynamicCadence.objects.filter(active=True).annotate(facility=Subquery(latest_facility))
 
+        cadences = []
         for cg in cadenced_groups:
-            try:
-                strategy = get_cadence_strategy(cg.cadence_strategy)(cg)
-                try:
-                    new_observations = strategy.run()
-                except Exception as e:
-                    logger.error((f'Unable to run cadence_group: {cg}; strategy {strategy};'
-                                  f' with id {cg.id} due to error: {e}'))
-                    logger.error(f'{traceback.format_exc()}')
-                    continue
-                if not new_observations:
-                    logger.log(msg=f'No changes from dynamic cadence {cg}', level=logging.INFO)
-                else:
-                    logger.log(msg=f'''Cadence update completed for dynamic cadence {cg},
-                                       {len(new_observations)} new observations created.''',
-                               level=logging.INFO)
+            # Claim the cadence, unless another run of this command is still running it
+            claimed = DynamicCadence.objects.filter(pk=cg.pk).exclude(in_flight).update(
+                last_run_status=DynamicCadence.RUNNING, last_run_start=now, last_run_duration=None
+            )
+            if claimed:
+                cadences.append(cg)
+            else:
+                logger.info(f'Skipping dynamic cadence {cg} with id {cg.id}, as its last run is still in flight')
+
+        if options['max_workers_per_facility']:
+            updated_cadences = self.run_concurrently(cadences, options['max_workers_per_facility'], options['timeout'])
+        else:
+            updated_cadences = []
+            for cg in cadences:
+                new_observations, error, duration = self.run_strategy(cg)
+                if self.record_run(cg, new_observations, error, duration):
                     updated_cadences.append(cg.observation_group)
-            except Exception as e:
-                logger.error(msg=f'Unable to run strategy {cg} with id {cg.id} due to error: {e}')
 
         if updated_cadences:
             msg = 'Created new observations for dynamic cadences with observation groups: {0}.'
             return msg.format(', '.join([str(cg) for cg in updated_cadences]))
         else:
             return 'No new observations for any dynamic cadences.'
+
+    def run_concurrently(self, cadences, max_workers_per_facility, timeout=None):
+        """
+        Runs the cadences on a pool of threads for each facility, recording the outcome of each one as it finishes.
+        Cadences that are still running after ``timeout`` seconds are recorded as timed out and no longer waited for.
+        Their threads keep running until the cadence finishes, but its outcome does not replace the timed out status.
+
+        :returns: The observation groups of the cadences that created new observations
+        :rtype: list
+        """
+        started = {}
+        finished = set()
+        lock = threading.Lock()
+
+        def run_in_thread(cg):
+            started[cg.id] = time.monotonic()
+            try:
+                result = self.run_strategy(cg)
+                with lock:
+                    finished.add(cg.id)
+                return result
+            finally:
+                connections.close_all()
+
+        executors = {}
+        futures = {}
+        for cg in cadences:
+            if cg.facility not in executors:
+                executors[cg.facility] = ThreadPoolExecutor(max_workers=max_workers_per_facility,
+                                                            thread_name_prefix=f'cadence-{cg.facility}')
+            futures[executors[cg.facility].submit(run_in_thread, cg)] = cg
+
+        updated_cadences = []
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=1 if timeout else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                cg = futures[future]
+                if self.record_run(cg, *future.result()):
+                    updated_cadences.append(cg.observation_group)
+            if timeout:
+                with lock:
+                    timed_out = [future for future in pending
+                                 if futures[future].id in started and futures[future].id not in finished
+                                 and time.monotonic() - started[futures[future].id] > timeout]
+                for future in timed_out:
+                    cg = futures[future]
+                    logger.error(f'Timed out running dynamic cadence {cg} with id {cg.id} after {timeout}s')
+                    DynamicCadence.objects.filter(pk=cg.pk, last_run_status=DynamicCadence.RUNNING).update(
+                        last_run_status=DynamicCadence.TIMED_OUT, last_run_duration=timeout
+                    )
+                    pending.remove(future)
+
+        # Do not wait for timed out cadences, which keep running in the background
+        for executor in executors.values():
+            executor.shutdown(wait=False)
+        return updated_cadences
+
+    def run_strategy(self, cg):
+        """
+        Runs the cadence strategy of a ``DynamicCadence``.
+
+        :returns: The new observations, the exception raised by the strategy if it failed, and the duration in seconds
+        :rtype: tuple
+        """
+        start = time.monotonic()
+        try:
+            strategy = get_cadence_strategy(cg.cadence_strategy)(cg)
+            new_observations = strategy.run()
+        except Exception as e:
+            logger.error((f'Unable to run cadence_group: {cg}; strategy {cg.cadence_strategy};'
+                          f' with id {cg.id} due to error: {e}'))
+            logger.error(f'{traceback.format_exc()}')
+            return None, e, time.monotonic() - start
+        return new_observations, None, time.monotonic() - start
+
+    def record_run(self, cg, new_observations, error, duration):
+        """
+        Stores the outcome and duration of a run of a ``DynamicCadence``, unless the run is no longer marked as running,
+        such as after it timed out.
+
+        :returns: Whether the run created new observations
+        :rtype: bool
+        """
+        status = DynamicCadence.FAILED if error else DynamicCadence.SUCCEEDED
+        DynamicCadence.objects.filter(pk=cg.pk, last_run_status=DynamicCadence.RUNNING).update(
+            last_run_status=status, last_run_duration=duration
+        )
+        if error:
+            return False
+        if not new_observations:
+            logger.log(msg=f'No changes from dynamic cadence {cg}', level=logging.INFO)
+            return False
+        logger.log(msg=f'''Cadence update completed for dynamic cadence {cg},
+                           {len(new_observations)} new observations created.''',
+                   level=logging.INFO)
+        return True
@@ -1,3 +1,6 @@
+import logging
+import time
+
 from django.core.management.base import BaseCommand
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.models import User
@@ -5,6 +8,8 @@ from django.contrib.auth.models import User
 from tom_targets.models import Target
 from tom_observations import facility
 
+logger = logging.getLogger(__name__)
+
 
 class Command(BaseCommand):
     """
@@ -24,6 +29,13 @@ class Command(BaseCommand):
             required=False,
             help='The username of a user to use if the facility uses per user-based authentication for its API calls'
         )
+        parser.add_argument(
+            '--max_workers',
+            type=int,
+            required=False,
+            help='Number of observation statuses to fetch concurrently from each facility. Defaults to the '
+                 'OBSERVATION_STATUS_UPDATE_WORKERS setting, or 1.'
+        )
 
     def handle(self, *args, **options):
         target = None
@@ -43,7 +55,16 @@ class Command(BaseCommand):
         for facility_name in facility.get_service_classes():
             instance = facility.get_service_class(facility_name)()
             instance.set_user(user)
-            failed_records[facility_name] = instance.update_all_observation_statuses(target=target)
+            kwargs = {'target': target}
+            if options.get('max_workers'):
+                # Only passed when given, as facilities may override update_all_observation_statuses without it
+                kwargs['max_workers'] = options['max_workers']
+            start = time.perf_counter()
+            failed_records[facility_name] = instance.update_all_observation_statuses(**kwargs)
+            msg = f'Updated observation statuses for {facility_name} in {time.perf_counter() - start:.2f}s'
+            logger.info(msg)
+            if options.get('verbosity', 1) > 1:
+                self.stdout.write(msg)
         success = True
         for facility_name, errors in failed_records.items():
             if len(errors) > 0:
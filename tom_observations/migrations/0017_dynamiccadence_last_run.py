@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_observations', '0016_alter_facility_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dynamiccadence',
+            name='last_run_duration',
+            field=models.FloatField(blank=True, help_text='How long the last run of this DynamicCadence took, in seconds.', null=True),
+        ),
+        migrations.AddField(
+            model_name='dynamiccadence',
+            name='last_run_start',
+            field=models.DateTimeField(blank=True, help_text='The time at which this DynamicCadence was last run.', null=True),
+        ),
+        migrations.AddField(
+            model_name='dynamiccadence',
+            name='last_run_status',
+            field=models.CharField(blank=True, choices=[('RUNNING', 'Running'), ('SUCCEEDED', 'Succeeded'), ('FAILED', 'Failed'), ('TIMED_OUT', 'Timed out')], default='', help_text='The outcome of the last run of this DynamicCadence.', max_length=20),
+        ),
+    ]
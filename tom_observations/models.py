@@ -3,11 +3,64 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
 
 
-from tom_observations.facility import get_service_class
+from tom_observations.facility import (get_service_class, get_service_classes, get_service_instance,
+                                       get_terminal_observing_states, get_failed_observing_states)
 from tom_common.hooks import run_hook
 from tom_targets.base_models import BaseTarget
 
 
+def _observing_states_condition(get_states):
+    """
+    Builds a condition matching the records whose status is one of the states returned by ``get_states`` for the
+    record's facility, for every facility in ``TOM_FACILITY_CLASSES``. Facilities that do not define the states are
+    skipped.
+    """
+    condition = models.Q(pk__in=[])
+    for facility_name in get_service_classes():
+        try:
+            states = get_states(facility_name)
+        except AttributeError:
+            continue
+        if states:
+            condition |= models.Q(facility=facility_name, status__in=states)
+    return condition
+
+
+class ObservationRecordQuerySet(models.QuerySet):
+    """
+    QuerySet of ``ObservationRecord`` objects that can filter on the terminal and failed states of each record's
+    facility in the database, rather than reading the ``terminal`` and ``failed`` properties of every record.
+    """
+    def terminal(self):
+        """
+        Returns the records whose status is terminal for their facility.
+        """
+        return self.filter(_observing_states_condition(get_terminal_observing_states))
+
+    def non_terminal(self):
+        """
+        Returns the records whose status is not terminal for their facility, including those of facilities that are
+        not in ``TOM_FACILITY_CLASSES``.
+        """
+        return self.exclude(_observing_states_condition(get_terminal_observing_states))
+
+    def failed(self):
+        """
+        Returns the records whose status is a failed state for their facility.
+        """
+        return self.filter(_observing_states_condition(get_failed_observing_states))
+
+    def annotate_terminal(self):
+        """
+        Annotates each record with ``is_terminal``, whether its status is terminal for its facility.
+        """
+        return self.annotate(is_terminal=models.Case(
+            models.When(_observing_states_condition(get_terminal_observing_states), then=models.Value(True)),
+            default=models.Value(False),
+            output_field=models.BooleanField()
+        ))
+
+
 class ObservationRecord(models.Model):
     """
     Class representing an observation in a TOM.
@@ -52,6 +105,8 @@ class ObservationRecord(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
+    objects = ObservationRecordQuerySet.as_manager()
+
     class Meta:
         ordering = ('-created',)
 
@@ -67,18 +122,15 @@ class ObservationRecord(models.Model):
 
     @property
     def terminal(self):
-        facility = get_service_class(self.facility)
-        return self.status in facility().get_terminal_observing_states()
+        return self.status in get_terminal_observing_states(self.facility)
 
     @property
     def failed(self):
-        facility = get_service_class(self.facility)
-        return self.status in facility().get_failed_observing_states()
+        return self.status in get_failed_observing_states(self.facility)
 
     @property
     def url(self):
-        facility = get_service_class(self.facility)
-        return facility().get_observation_url(self.observation_id)
+        return get_service_instance(self.facility).get_observation_url(self.observation_id)
 
     def update_status(self):
         facility = get_service_class(self.facility)
@@ -141,7 +193,22 @@ class DynamicCadence(models.Model):
 
     :param modified: The time at which this ``DynamicCadence`` was modified.
     :type modified: datetime
+
+    :param last_run_start: The time at which the ``runcadencestrategies`` command last started running this cadence.
+    :type last_run_start: datetime
+
+    :param last_run_duration: How long the last run of this cadence took, in seconds.
+    :type last_run_duration: float
+
+    :param last_run_status: The outcome of the last run of this cadence, or ``RUNNING`` while it is in flight.
+    :type last_run_status: str
     """
+    RUNNING = 'RUNNING'
+    SUCCEEDED = 'SUCCEEDED'
+    FAILED = 'FAILED'
+    TIMED_OUT = 'TIMED_OUT'
+    RUN_STATUSES = ((RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed'), (TIMED_OUT, 'Timed out'))
+
     observation_group = models.ForeignKey(ObservationGroup, null=False, default=None, on_delete=models.CASCADE)
     cadence_strategy = models.CharField(max_length=100, blank=False, default=None,
                                         verbose_name='Cadence strategy used for this DynamicCadence')
@@ -151,6 +218,12 @@ class DynamicCadence(models.Model):
                                            continue to submit observations.''')
     created = models.DateTimeField(auto_now_add=True, help_text='The time which this DynamicCadence was created.')
     modified = models.DateTimeField(auto_now=True, help_text='The time which this DynamicCadence was modified.')
+    last_run_start = models.DateTimeField(null=True, blank=True,
+                                          help_text='The time at which this DynamicCadence was last run.')
+    last_run_duration = models.FloatField(null=True, blank=True,
+                                          help_text='How long the last run of this DynamicCadence took, in seconds.')
+    last_run_status = models.CharField(max_length=20, choices=RUN_STATUSES, blank=True, default='',
+                                       help_text='The outcome of the last run of this DynamicCadence.')
 
     def __str__(self):
         return f'{self.cadence_strategy} with parameters {self.cadence_parameters}'
@@ -0,0 +1,20 @@
+from django.utils.module_loading import import_string
+from django_tasks import task
+
+
+@task
+def refresh_ocs_portal_data(settings_class, facility_name, kind):
+    """
+    Refreshes the cached instruments or proposals of an OCS facility in the background, so that the forms which use
+    them can keep being rendered from the stale cache in the meantime.
+
+    :param settings_class: The import path of the ``OCSSettings`` class of the facility
+    :type settings_class: str
+
+    :param facility_name: The name of the facility in ``FACILITIES``
+    :type facility_name: str
+
+    :param kind: Either ``instruments`` or ``proposals``
+    :type kind: str
+    """
+    import_string(settings_class)(facility_name).refresh_portal_data(kind)
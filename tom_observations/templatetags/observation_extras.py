@@ -184,10 +184,11 @@ def observation_distribution(observations):
     """
 
     # "distinct" query is not supported, must manually find distinct observation per target
-    sorted_observations = observations.order_by('scheduled_end')  # ascending so that only the max is preserved
+    # ascending so that only the max is preserved
+    sorted_observations = observations.annotate_terminal().order_by('scheduled_end')
     observation_targets = {}
-    for obs in sorted_observations:
-        observation_targets[obs.target_id] = (obs.status, obs.terminal)
+    for target_id, status, is_terminal in sorted_observations.values_list('target_id', 'status', 'is_terminal'):
+        observation_targets[target_id] = (status, is_terminal)
 
     observation_no_status = [t for t in observation_targets.keys()
                              if not observation_targets[t][0]]  # status==""
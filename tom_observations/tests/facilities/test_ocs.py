@@ -1,9 +1,14 @@
-from requests import Response
+from io import StringIO
+from requests import HTTPError, Response
 from unittest.mock import patch
 import json
 
-from django.test import TestCase
-from tom_observations.facilities.ocs import (make_request, OCSBaseForm, OCSFacility, OCSTemplateBaseForm)
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from tom_observations.facilities.ocs import (get_request_stats, get_session, make_request, OCSBaseForm, OCSFacility,
+                                             OCSSettings, OCSTemplateBaseForm, reset_request_stats)
+from tom_observations.tasks import refresh_ocs_portal_data
 from tom_common.exceptions import ImproperCredentialsException
 
 
@@ -126,7 +131,7 @@ def generate_ocs_proposal_choices():
 
 class TestMakeRequest(TestCase):
 
-    @patch('tom_observations.facilities.ocs.requests.request')
+    @patch('tom_observations.facilities.ocs.requests.Session.request')
     def test_make_request(self, mock_request):
         mock_response = Response()
         mock_response._content = str.encode(json.dumps({'test': 'test'}))
@@ -140,6 +145,38 @@ class TestMakeRequest(TestCase):
         with self.assertRaises(ImproperCredentialsException):
             make_request('GET', 'google.com', headers={'test': 'test'})
 
+    @patch('tom_observations.facilities.ocs.requests.Session.request')
+    def test_make_request_reuses_session(self, mock_request):
+        mock_response = Response()
+        mock_response.status_code = 200
+        mock_request.return_value = mock_response
+
+        make_request('GET', 'https://observe.lco.global/api/requestgroups/1/')
+        make_request('GET', 'https://observe.lco.global/api/requestgroups/2/', timeout=5)
+        make_request('GET', 'https://archive-api.lco.global/frames/')
+
+        self.assertIs(get_session('observe.lco.global'), get_session('observe.lco.global'))
+        self.assertIsNot(get_session('observe.lco.global'), get_session('archive-api.lco.global'))
+        self.assertEqual([call.kwargs['timeout'] for call in mock_request.call_args_list], [30, 5, 30])
+
+    @patch('tom_observations.facilities.ocs.requests.Session.request')
+    def test_make_request_records_stats(self, mock_request):
+        mock_response = Response()
+        mock_response.status_code = 200
+        mock_request.return_value = mock_response
+        reset_request_stats()
+
+        make_request('GET', 'https://observe.lco.global/api/requestgroups/1/')
+        make_request('GET', 'https://observe.lco.global/api/requestgroups/2/')
+        mock_response.status_code = 404
+        with self.assertRaises(HTTPError):
+            make_request('POST', 'https://observe.lco.global/api/requestgroups/validate/')
+
+        stats = get_request_stats()
+        self.assertEqual(stats['GET observe.lco.global/api/requestgroups/{id}/']['count'], 2)
+        self.assertEqual(stats['GET observe.lco.global/api/requestgroups/{id}/']['errors'], 0)
+        self.assertEqual(stats['POST observe.lco.global/api/requestgroups/validate/']['errors'], 1)
+
 
 class TestOCSBaseForm(TestCase):
     @patch('tom_observations.facilities.ocs.OCSBaseForm.proposal_choices')
@@ -220,6 +257,80 @@ class TestOCSBaseForm(TestCase):
         self.assertNotIn(('InactiveProposal', 'Inactive (InactiveProposal)'), proposal_choices)
 
 
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'ocs-portal-data'}})
+class TestOCSPortalData(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.facility_settings = OCSSettings('OCS')
+        self.instruments = generate_ocs_instrument_choices()
+
+    @patch('tom_observations.facilities.ocs.refresh_ocs_portal_data')
+    @patch('tom_observations.facilities.ocs.OCSSettings.fetch_instruments')
+    def test_get_portal_data_stale_while_revalidate(self, mock_fetch_instruments, mock_refresh):
+        mock_fetch_instruments.return_value = self.instruments
+
+        # Nothing is cached yet, so the instruments are fetched straight away
+        self.assertEqual(self.facility_settings.get_portal_data('instruments'), self.instruments)
+        self.assertEqual(mock_fetch_instruments.call_count, 1)
+
+        # Fresh instruments are served from the cache
+        self.assertEqual(self.facility_settings.get_portal_data('instruments'), self.instruments)
+        self.assertEqual(mock_fetch_instruments.call_count, 1)
+        mock_refresh.enqueue.assert_not_called()
+
+        # Stale instruments are still served from the cache, while a single refresh is enqueued
+        cache.delete('OCS_instruments_fresh')
+        self.assertEqual(self.facility_settings.get_portal_data('instruments'), self.instruments)
+        self.assertEqual(self.facility_settings.get_portal_data('instruments'), self.instruments)
+        self.assertEqual(mock_fetch_instruments.call_count, 1)
+        mock_refresh.enqueue.assert_called_once_with('tom_observations.facilities.ocs.OCSSettings', 'OCS',
+                                                     'instruments')
+
+    @patch('tom_observations.facilities.ocs.OCSSettings.fetch_instruments')
+    def test_get_portal_data_stale_with_immediate_backend(self, mock_fetch_instruments):
+        # The immediate backend would refresh the instruments while the form is rendered, so no refresh is enqueued
+        cache.set('OCS_instruments', self.instruments)
+        self.assertEqual(self.facility_settings.get_portal_data('instruments'), self.instruments)
+        mock_fetch_instruments.assert_not_called()
+        self.assertIsNone(cache.get('OCS_instruments_refreshing'))
+
+    @patch('tom_observations.facilities.ocs.OCSSettings.fetch_instruments', side_effect=HTTPError)
+    def test_refresh_failed(self, mock_fetch_instruments):
+        cache.add('OCS_instruments_refreshing', True)
+        with self.assertRaises(HTTPError):
+            self.facility_settings.refresh_portal_data('instruments')
+        # A failed refresh does not stop the next one from being enqueued
+        self.assertIsNone(cache.get('OCS_instruments_refreshing'))
+
+    @patch('tom_observations.facilities.ocs.OCSSettings.fetch_proposals', return_value=[('prop', 'Proposal (prop)')])
+    @patch('tom_observations.facilities.ocs.OCSSettings.fetch_instruments')
+    def test_refresh_task(self, mock_fetch_instruments, mock_fetch_proposals):
+        mock_fetch_instruments.return_value = self.instruments
+        cache.set('OCS_instruments', {'old': {}})
+        cache.add('OCS_instruments_refreshing', True)
+
+        refresh_ocs_portal_data.call('tom_observations.facilities.ocs.OCSSettings', 'OCS', 'instruments')
+
+        self.assertEqual(cache.get('OCS_instruments'), self.instruments)
+        self.assertTrue(cache.get('OCS_instruments_fresh'))
+        self.assertIsNone(cache.get('OCS_instruments_refreshing'))
+        mock_fetch_proposals.assert_not_called()
+
+    @override_settings(TOM_FACILITY_CLASSES=['tom_observations.facilities.ocs.OCSFacility',
+                                             'tom_observations.tests.utils.FakeRoboticFacility'])
+    @patch('tom_observations.facilities.ocs.OCSSettings.fetch_proposals', return_value=[('prop', 'Proposal (prop)')])
+    @patch('tom_observations.facilities.ocs.OCSSettings.fetch_instruments')
+    def test_refreshocsportaldata_command(self, mock_fetch_instruments, mock_fetch_proposals):
+        mock_fetch_instruments.return_value = self.instruments
+
+        result = call_command('refreshocsportaldata', stdout=StringIO())
+
+        self.assertEqual(result, 'Refreshed the instruments and proposals of 1 OCS facilities.')
+        self.assertEqual(cache.get('OCS_instruments'), self.instruments)
+        self.assertEqual(cache.get('OCS_proposals'), [('prop', 'Proposal (prop)')])
+
+
 class TestOCSFacility(TestCase):
     def setUp(self):
         self.lco = OCSFacility()
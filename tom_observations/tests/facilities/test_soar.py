@@ -75,7 +75,7 @@ instrument_response = {
 
 class TestMakeRequest(TestCase):
 
-    @patch('tom_observations.facilities.soar.requests.request')
+    @patch('tom_observations.facilities.ocs.requests.Session.request')
     def test_make_request(self, mock_request):
         mock_response = Response()
         mock_response._content = str.encode(json.dumps({'test': 'test'}))
@@ -1,12 +1,17 @@
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
 from unittest.mock import patch
 from datetime import datetime, timedelta
+from io import StringIO
+import threading
 from dateutil.parser import parse
 
 from .factories import ObservingRecordFactory, SiderealTargetFactory
 from tom_observations.models import ObservationGroup, DynamicCadence
 from tom_observations.cadences.resume_cadence_after_failure import ResumeCadenceAfterFailureStrategy
 from tom_observations.cadences.retry_failed_observations import RetryFailedObservationsStrategy
+from tom_observations.management.commands.runcadencestrategies import Command
 
 
 mock_instruments = {
@@ -140,3 +145,97 @@ class TestReactiveCadencing(TestCase):
         strategy = ResumeCadenceAfterFailureStrategy(self.dynamic_cadence)
         with self.assertRaises(Exception):
             strategy.run()
+
+
+class TestRunCadenceStrategies(TestCase):
+    def setUp(self):
+        target = SiderealTargetFactory.create()
+        self.cadences = []
+        for facility in ['LCO', 'LCO', 'Gemini']:
+            group = ObservationGroup.objects.create()
+            group.observation_records.add(ObservingRecordFactory.create(target_id=target.id, facility=facility))
+            self.cadences.append(DynamicCadence.objects.create(
+                cadence_strategy='Test Strategy', cadence_parameters={}, active=True, observation_group=group
+            ))
+
+    def run_command(self, strategy_run, **options):
+        class TestStrategy:
+            def __init__(self, dynamic_cadence):
+                self.dynamic_cadence = dynamic_cadence
+
+            def run(self):
+                return strategy_run(self.dynamic_cadence)
+
+        with patch('tom_observations.management.commands.runcadencestrategies.get_cadence_strategy',
+                   return_value=TestStrategy):
+            return call_command('runcadencestrategies', stdout=StringIO(), **options)
+
+    def test_run_records_outcome(self):
+        def strategy_run(dynamic_cadence):
+            if dynamic_cadence == self.cadences[2]:
+                raise Exception('Facility unavailable')
+            return ['new observation'] if dynamic_cadence == self.cadences[0] else []
+
+        result = self.run_command(strategy_run)
+        self.assertEqual(result, 'Created new observations for dynamic cadences with observation groups: '
+                                 f'{self.cadences[0].observation_group}.')
+        for cadence, status in zip(self.cadences, ['SUCCEEDED', 'SUCCEEDED', 'FAILED']):
+            cadence.refresh_from_db()
+            self.assertEqual(cadence.last_run_status, status)
+            self.assertIsNotNone(cadence.last_run_start)
+            self.assertIsNotNone(cadence.last_run_duration)
+
+    def test_skips_cadences_in_flight(self):
+        DynamicCadence.objects.filter(pk=self.cadences[0].pk).update(last_run_status='RUNNING',
+                                                                     last_run_start=timezone.now())
+        DynamicCadence.objects.filter(pk=self.cadences[1].pk).update(
+            last_run_status='RUNNING', last_run_start=timezone.now() - timedelta(hours=2)
+        )
+        ran = []
+        self.run_command(lambda dynamic_cadence: ran.append(dynamic_cadence.id))
+        self.assertCountEqual(ran, [self.cadences[1].id, self.cadences[2].id])
+        self.cadences[0].refresh_from_db()
+        self.assertEqual(self.cadences[0].last_run_status, 'RUNNING')
+
+    def test_run_concurrently(self):
+        ran = []
+        result = self.run_command(lambda dynamic_cadence: ran.append(threading.current_thread().name),
+                                  max_workers_per_facility=2)
+        self.assertEqual(result, 'No new observations for any dynamic cadences.')
+        self.assertEqual(len(ran), 3)
+        self.assertTrue(all(name.startswith('cadence-') for name in ran))
+        self.assertEqual(DynamicCadence.objects.filter(last_run_status='SUCCEEDED').count(), 3)
+
+    def test_run_concurrently_timeout(self):
+        release = threading.Event()
+        finished = threading.Event()
+
+        def strategy_run(dynamic_cadence):
+            if dynamic_cadence == self.cadences[2]:
+                release.wait(10)
+                finished.set()
+            return []
+
+        with patch('tom_observations.management.commands.runcadencestrategies.Command.record_run',
+                   wraps=Command().record_run) as record_run:
+            self.run_command(strategy_run, max_workers_per_facility=1, timeout=0.1)
+            self.assertEqual(record_run.call_count, 2)
+            self.assertEqual(
+                list(DynamicCadence.objects.order_by('id').values_list('last_run_status', flat=True)),
+                ['SUCCEEDED', 'SUCCEEDED', 'TIMED_OUT']
+            )
+
+            # The outcome of the timed out cadence does not replace its timed out status once it finishes
+            release.set()
+            self.assertTrue(finished.wait(10))
+            self.assertEqual(record_run.call_count, 2)
+            self.cadences[2].refresh_from_db()
+            self.assertEqual(self.cadences[2].last_run_status, 'TIMED_OUT')
+
+    def test_record_run_keeps_timed_out_status(self):
+        DynamicCadence.objects.filter(pk=self.cadences[0].pk).update(last_run_status='TIMED_OUT',
+                                                                     last_run_duration=300)
+        Command().record_run(self.cadences[0], ['new observation'], None, 400)
+        self.cadences[0].refresh_from_db()
+        self.assertEqual(self.cadences[0].last_run_status, 'TIMED_OUT')
+        self.assertEqual(self.cadences[0].last_run_duration, 300)
@@ -1,21 +1,31 @@
 from tom_targets.base_models import get_target_model_app_label
 from datetime import datetime, timedelta
 from http import HTTPStatus
+from io import StringIO
+import tempfile
 from unittest import mock
 
 from django.contrib.auth.models import User
 from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
 from django.forms import ValidationError
 from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.module_loading import import_string
 
 from astroplan import FixedTarget
 from astropy.coordinates import get_sun, SkyCoord
 from astropy.time import Time
+import numpy as np
+import responses
 
 from .factories import ObservingRecordFactory, ObservationTemplateFactory, SiderealTargetFactory, TargetNameFactory
-from tom_observations.utils import get_astroplan_sun_and_time, get_sidereal_visibility
+from tom_observations.utils import (get_astroplan_sun_and_time, get_facility_statuses, get_sidereal_visibility,
+                                    get_sidereal_visibilities)
+from tom_dataproducts.models import DataProduct
+from tom_observations import facility
 from tom_observations.tests.utils import FakeRoboticFacility
 from tom_observations.models import ObservationRecord, ObservationGroup, ObservationTemplate
 from tom_targets.models import Target
@@ -316,16 +326,68 @@ class TestCallbackView(TestCase):
         self.assertRedirects(response, reverse('tom_observations:list') + f"?observationgroup={group.id}")
 
 
-@override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'])
+@override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'],
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'facility-status'}})
 class TestFacilityStatusView(TestCase):
     def setUp(self):
-        pass
+        cache.clear()
 
     def test_facility_status(self):
         response = self.client.get(
             reverse('tom_observations:render-facility-status-list'))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'coj.domb.1m0a', status_code=HTTPStatus.OK)
+        self.assertContains(response, 'https://example.com/#/coj')
+
+    def test_facility_status_cached(self):
+        with mock.patch.object(FakeRoboticFacility, 'get_facility_status',
+                               wraps=FakeRoboticFacility().get_facility_status) as mock_status:
+            for _ in range(3):
+                response = self.client.get(reverse('tom_observations:render-facility-status-list'),
+                                           {'hx_trigger': 'load'})
+                self.assertContains(response, 'coj.domb.1m0a')
+            self.assertEqual(mock_status.call_count, 1)
+
+            # Requests without the refresh trigger are served from the cache
+            self.client.get(reverse('tom_observations:render-facility-status-list'))
+            self.assertEqual(mock_status.call_count, 1)
+
+            # Refreshing from the page fetches the status again
+            self.client.get(reverse('tom_observations:render-facility-status-list'), {'hx_trigger': 'refresh'})
+            self.assertEqual(mock_status.call_count, 2)
+
+    def test_facility_status_shared_by_users(self):
+        user = User.objects.create_user(username='test', password='test')
+        with mock.patch.object(FakeRoboticFacility, 'get_facility_status',
+                               wraps=FakeRoboticFacility().get_facility_status) as mock_status:
+            self.client.get(reverse('tom_observations:render-facility-status-list'), {'hx_trigger': 'load'})
+            self.client.force_login(user)
+            self.client.get(reverse('tom_observations:render-facility-status-list'), {'hx_trigger': 'load'})
+            # The facility does not use the user's credentials, so its status is fetched once for everyone
+            self.assertEqual(mock_status.call_count, 1)
+
+    def test_facility_status_cached_per_user(self):
+        user = User.objects.create_user(username='test', password='test')
+        with mock.patch.object(FakeRoboticFacility, 'get_facility_status',
+                               wraps=FakeRoboticFacility().get_facility_status) as mock_status, \
+                mock.patch.object(FakeRoboticFacility, 'set_user', autospec=True):
+            self.client.get(reverse('tom_observations:render-facility-status-list'), {'hx_trigger': 'load'})
+            self.client.force_login(user)
+            for _ in range(2):
+                self.client.get(reverse('tom_observations:render-facility-status-list'), {'hx_trigger': 'load'})
+            # The status fetched with the user's credentials is not shared with other users
+            self.assertEqual(mock_status.call_count, 2)
+
+    @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility',
+                                             'tom_observations.tests.utils.FakeManualFacility'])
+    def test_refreshfacilitystatus(self):
+        result = call_command('refreshfacilitystatus', stdout=StringIO())
+        self.assertEqual(result, 'Refreshed the status of 2 facilities.')
+        with mock.patch.object(FakeRoboticFacility, 'get_facility_status') as mock_status:
+            statuses = get_facility_statuses()
+        mock_status.assert_not_called()
+        self.assertEqual(statuses[0]['sites'][0]['weather_url'], 'https://example.com/#/coj')
 
 
 @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'],
@@ -412,6 +474,8 @@ class TestObservationTemplateViews(TestCase):
 
 
 class TestUpdatingObservations(TestCase):
+    status = {'state': 'COMPLETED', 'scheduled_start': None, 'scheduled_end': None}
+
     def setUp(self):
         self.t1 = SiderealTargetFactory.create()
         self.or1 = ObservingRecordFactory.create(target_id=self.t1.id, facility='FakeRoboticFacility', status='PENDING')
@@ -433,6 +497,177 @@ class TestUpdatingObservations(TestCase):
             FakeRoboticFacility().update_all_observation_statuses(target=self.t1)
             self.assertEqual(uos_mock.call_count, 2)
 
+    def test_update_all_observations_fetches_statuses(self):
+        with mock.patch.object(FakeRoboticFacility, 'get_observation_status', return_value=self.status) as gos_mock:
+            FakeRoboticFacility().update_all_observation_statuses(target=self.t1)
+            self.assertEqual(gos_mock.call_count, 2)
+
+    @mock.patch('tom_observations.facility.run_hook')
+    def test_update_all_observations_saves_statuses(self, mock_run_hook):
+        failed_records = FakeRoboticFacility().update_all_observation_statuses(max_workers=4)
+        self.assertEqual(failed_records, [])
+        for record in [self.or1, self.or3]:
+            previous_modified = record.modified
+            record.refresh_from_db()
+            self.assertEqual(record.status, 'COMPLETED')
+            self.assertIsNotNone(record.scheduled_start)
+            self.assertGreater(record.modified, previous_modified)
+        self.assertCountEqual([call.args for call in mock_run_hook.call_args_list], [
+            ('observation_change_state', self.or1, 'PENDING'), ('observation_change_state', self.or3, 'PENDING')
+        ])
+
+    def test_update_all_observations_failed(self):
+        def get_observation_status(observation_id):
+            if observation_id == self.or1.observation_id:
+                raise Exception('Observation not found')
+            return self.status
+
+        self.or1.refresh_from_db()
+        with mock.patch.object(FakeRoboticFacility, 'get_observation_status', side_effect=get_observation_status), \
+                mock.patch('tom_observations.facility.connections') as mock_connections:
+            failed_records = FakeRoboticFacility().update_all_observation_statuses(max_workers=2)
+        self.assertEqual(failed_records, [(self.or1.observation_id, 'Observation not found')])
+        # Each worker thread closes its database connections, even when the status could not be retrieved
+        self.assertEqual(mock_connections.close_all.call_count, 2)
+        self.or1.refresh_from_db()
+        self.or3.refresh_from_db()
+        self.assertEqual(self.or1.status, 'PENDING')
+        self.assertEqual(self.or3.status, 'COMPLETED')
+
+    @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'])
+    def test_updatestatus_command(self):
+        out = StringIO()
+        result = call_command('updatestatus', max_workers=2, verbosity=2, stdout=out)
+        self.assertIn('Updated observation statuses for FakeRoboticFacility in', out.getvalue())
+        self.assertIn('Update completed successfully', result)
+        self.or1.refresh_from_db()
+        self.assertEqual(self.or1.status, 'COMPLETED')
+
+
+class TestSavingDataProducts(TestCase):
+    products = [
+        {'id': 'product1', 'url': 'https://archive.example.com/product1.fits', 'filename': 'product1.fits'},
+        {'id': 'product2', 'url': 'https://archive.example.com/product2.fits', 'filename': 'product2.fits'},
+    ]
+
+    def setUp(self):
+        self.target = SiderealTargetFactory.create()
+        self.observation_record = ObservingRecordFactory.create(target_id=self.target.id,
+                                                                facility='FakeRoboticFacility')
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @responses.activate
+    @mock.patch('tom_observations.facility.AUTO_THUMBNAILS', True)
+    @mock.patch('tom_dataproducts.tasks.create_image_dataproducts')
+    def test_save_data_products(self, mock_task):
+        for i, product in enumerate(self.products):
+            responses.get(product['url'], body=f'data{i}' * 1000)
+        DataProduct.objects.create(product_id='product1', target=self.target,
+                                   observation_record=self.observation_record)
+
+        with mock.patch.object(FakeRoboticFacility, 'data_products', return_value=self.products), \
+                mock.patch('tom_observations.facility.connections') as mock_connections:
+            saved = FakeRoboticFacility().save_data_products(self.observation_record, max_workers=2)
+
+        self.assertEqual([dp.product_id for dp in saved], ['product1', 'product2'])
+        # The worker thread that downloaded the new data product closes its database connections
+        mock_connections.close_all.assert_called_once()
+        # Only the data product that was not already in the TOM is downloaded
+        self.assertEqual([call.request.url for call in responses.calls], [self.products[1]['url']])
+        saved[1].refresh_from_db()
+        with saved[1].data.open('rb') as f:
+            self.assertEqual(f.read(), b'data1' * 1000)
+        mock_task.enqueue.assert_called_once_with([dp.pk for dp in saved])
+
+    @responses.activate
+    def test_save_data_products_download_failed(self):
+        responses.get(self.products[0]['url'], body='data')
+        responses.get(self.products[1]['url'], status=404)
+
+        with mock.patch.object(FakeRoboticFacility, 'data_products', return_value=self.products):
+            with self.assertLogs('tom_observations.facility', level='ERROR'):
+                saved = FakeRoboticFacility().save_data_products(self.observation_record)
+
+        # The data product that failed to download is not left behind without data
+        self.assertEqual([dp.product_id for dp in saved], ['product1'])
+        self.assertEqual(list(DataProduct.objects.values_list('product_id', flat=True)), ['product1'])
+
+
+@override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'])
+class TestFacilityRegistry(TestCase):
+    def test_service_classes_imported_once(self):
+        facility.clear_facility_caches(setting='TOM_FACILITY_CLASSES')
+        with mock.patch('tom_observations.facility.import_string', wraps=import_string) as mock_import_string:
+            self.assertEqual(facility.get_service_classes(), {'FakeRoboticFacility': FakeRoboticFacility})
+            self.assertEqual(facility.get_service_classes(), {'FakeRoboticFacility': FakeRoboticFacility})
+            self.assertEqual(facility.get_service_class('FakeRoboticFacility'), FakeRoboticFacility)
+        self.assertEqual(mock_import_string.call_count, 1)
+
+    def test_service_classes_cleared_on_settings_change(self):
+        facility.get_service_classes()
+        with self.settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeManualFacility']):
+            self.assertEqual(list(facility.get_service_classes()), ['FakeManualFacility'])
+        self.assertEqual(list(facility.get_service_classes()), ['FakeRoboticFacility'])
+
+    def test_observation_list_uses_cached_facility(self):
+        """
+        Reads the properties of a list of observations, which imported and instantiated the facility class for every
+        property of every record before the facility registry was cached.
+        """
+        target = SiderealTargetFactory.create()
+        ObservationRecord.objects.bulk_create([
+            ObservationRecord(target=target, facility='FakeRoboticFacility', observation_id=str(i),
+                              status='COMPLETED' if i % 2 else 'PENDING', parameters={})
+            for i in range(20)
+        ])
+
+        with mock.patch('tom_observations.facility.import_string', wraps=import_string) as mock_import_string, \
+                mock.patch.object(FakeRoboticFacility, '__init__', autospec=True,
+                                  side_effect=FakeRoboticFacility.__init__) as mock_init, \
+                self.assertNumQueries(1):
+            terminal = [(record.terminal, record.url) for record in ObservationRecord.objects.all()]
+
+        self.assertEqual(sum(is_terminal for is_terminal, _ in terminal), 10)
+        self.assertLessEqual(mock_import_string.call_count, 1)
+        self.assertLessEqual(mock_init.call_count, 1)
+
+
+@override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility',
+                                         'tom_observations.facilities.lco.LCOFacility'])
+class TestObservationRecordQuerySet(TestCase):
+    def setUp(self):
+        target = SiderealTargetFactory.create()
+        self.fake_pending = ObservingRecordFactory.create(target_id=target.id, facility='FakeRoboticFacility',
+                                                          status='PENDING')
+        self.fake_failed = ObservingRecordFactory.create(target_id=target.id, facility='FakeRoboticFacility',
+                                                         status='FAILED')
+        self.lco_pending = ObservingRecordFactory.create(target_id=target.id, facility='LCO', status='PENDING')
+        self.lco_completed = ObservingRecordFactory.create(target_id=target.id, facility='LCO', status='COMPLETED')
+        self.lco_canceled = ObservingRecordFactory.create(target_id=target.id, facility='LCO', status='CANCELED')
+        # FAILED is not a state of LCO observations, and unknown facilities have no terminal states
+        self.lco_unknown = ObservingRecordFactory.create(target_id=target.id, facility='LCO', status='FAILED')
+        self.other = ObservingRecordFactory.create(target_id=target.id, facility='Other', status='COMPLETED')
+
+    def test_terminal(self):
+        self.assertCountEqual(ObservationRecord.objects.terminal(),
+                              [self.fake_failed, self.lco_completed, self.lco_canceled])
+        self.assertCountEqual(ObservationRecord.objects.non_terminal(),
+                              [self.fake_pending, self.lco_pending, self.lco_unknown, self.other])
+
+    def test_terminal_matches_property(self):
+        for record in ObservationRecord.objects.filter(facility__in=['FakeRoboticFacility', 'LCO']):
+            self.assertEqual(ObservationRecord.objects.terminal().filter(pk=record.pk).exists(), record.terminal)
+            self.assertEqual(ObservationRecord.objects.annotate_terminal().get(pk=record.pk).is_terminal,
+                             record.terminal)
+
+    def test_failed(self):
+        # FakeRoboticFacility does not define failed states
+        self.assertCountEqual(ObservationRecord.objects.failed(), [self.lco_canceled])
+
 
 class TestGetVisibility(TestCase):
     def setUp(self):
@@ -497,3 +732,24 @@ class TestGetVisibility(TestCase):
         self.assertEqual(len(airmass_data), len(expected_airmass))
         for i, expected_airmass_value in enumerate(expected_airmass):
             self.assertAlmostEqual(airmass_data[i], expected_airmass_value, places=3)
+
+    @mock.patch('tom_observations.utils.facility.get_service_classes')
+    def test_get_visibilities_sidereal(self, mock_facility):
+        mock_facility.return_value = {'Fake Robotic Facility': FakeRoboticFacility}
+        end = self.start + timedelta(minutes=60)
+        non_sidereal_target = Target(type=Target.NON_SIDEREAL)
+        circumpolar_target = Target(ra=self.target.ra, dec=80, type=Target.SIDEREAL)
+        times, airmass = get_sidereal_visibilities(
+            [self.target, non_sidereal_target, circumpolar_target], self.start, end, self.interval, self.airmass_limit
+        )
+
+        self.assertEqual(len(times), 7)
+        airmass_data = airmass['(FakeRoboticFacility) Siding Spring']
+        self.assertEqual(airmass_data.shape, (3, 7))
+        single_airmass_data = get_sidereal_visibility(
+            self.target, self.start, end, self.interval, self.airmass_limit
+        )['(FakeRoboticFacility) Siding Spring'][1]
+        for i, single_airmass_value in enumerate(single_airmass_data):
+            self.assertAlmostEqual(airmass_data[0][i], single_airmass_value)
+        self.assertTrue(np.isnan(airmass_data[1]).all())
+        self.assertTrue(np.isnan(airmass_data[2]).all())  # never rises above the horizon at Siding Spring
@@ -2,6 +2,10 @@ from astropy.coordinates import get_sun, SkyCoord
 from astropy import units
 from astropy.time import Time
 from astroplan import Observer, FixedTarget, time_grid_from_range
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
 import numpy as np
 import logging
 
@@ -60,12 +64,111 @@ def get_sidereal_visibility(
         empty_visibility = {}
         return empty_visibility
 
+    times, visibilities = get_sidereal_visibilities(
+        [target], start_time, end_time, interval, airmass_limit, facility_name=facility_name
+    )
+
+    visibility = {}
+    for observer_name, obj_airmass in visibilities.items():
+        visibility[observer_name] = (
+            times, [None if np.isnan(airmass) else float(airmass) for airmass in obj_airmass[0]]
+        )
+
+    return visibility
+
+
+def get_sidereal_visibilities(
+        targets,
+        start_time,
+        end_time,
+        interval,
+        airmass_limit,
+        facility_name=None
+):
+    """
+    Calculates the airmass of many sidereal targets at once for each given interval between the start and end times.
+
+    The observers and the sun's position are computed once for all of the targets, and the airmass of every target at
+    every time is computed for each site as a single array, so this is much faster than calling
+    ``get_sidereal_visibility`` for each target. As with ``get_sidereal_visibility``, any airmass above the limit or
+    during the day is omitted, as is the airmass of any target that is not sidereal.
+
+    :param targets: the targets for which to calculate the airmass
+    :type targets: list of Target
+
+    :param start_time: start of the window for which to calculate the airmass
+    :type start_time: datetime
+
+    :param end_time: end of the window for which to calculate the airmass
+    :type end_time: datetime
+
+    :param interval: time interval, in minutes, at which to calculate airmass within the given window
+    :type interval: int
+
+    :param airmass_limit: maximum acceptable airmass for the resulting calculations
+    :type airmass_limit: int
+
+    :param facility_name: name string of a declared observing facility class OR general facility,
+                            for which to calculate the airmass.
+                        None indicates all available facilities.
+    :type facility_name: string
+
+    :returns: A tuple of the array of datetimes used in the airmass calculations and a dictionary containing the
+        airmass data for each site. The dict keys consist of the site name prepended with the observing facility. The
+        values are arrays of shape (number of targets, number of datetimes), with NaN wherever the airmass is omitted.
+    :rtype: tuple
+    """
+
     if end_time < start_time:
         raise Exception('Start must be before end')
 
     if airmass_limit is None:
         airmass_limit = 10
 
+    observers = get_observers(facility_name)
+
+    sun, time_range = get_astroplan_sun_and_time(start_time, end_time, interval)
+
+    # Non-sidereal targets are left with no airmass at all
+    sidereal = np.array([target.type == 'SIDEREAL' for target in targets], dtype=bool)
+    if sidereal.any():
+        coords = SkyCoord(
+            [target.ra for target in targets if target.type == 'SIDEREAL'],
+            [target.dec for target in targets if target.type == 'SIDEREAL'],
+            unit='deg'
+        )
+
+    visibility = {}
+    for observer_name, observer in observers.items():
+        obj_airmass = np.full((len(targets), len(time_range)), np.nan)
+        if sidereal.any():
+            sun_alt = observer.altaz(time_range, sun).alt
+            airmass = np.asarray(observer.altaz(time_range, coords, grid_times_targets=True).secz)
+            bad = (
+                (airmass >= airmass_limit) |
+                (airmass <= 1) |
+                (sun_alt > -18*units.deg)  # between astronomical twilights, i.e. sun is up
+            )
+            obj_airmass[sidereal] = np.where(bad, np.nan, airmass)
+
+        visibility[observer_name] = obj_airmass
+
+    return time_range.datetime, visibility
+
+
+def get_observers(facility_name=None):
+    """
+    Builds an astroplan ``Observer`` for each site of a facility.
+
+    :param facility_name: name string of a declared observing facility class OR general facility.
+                        None indicates all available facilities.
+    :type facility_name: string
+
+    :returns: A dictionary of the observers for each site. The dict keys consist of the site name prepended with the
+        observing facility.
+    :rtype: dict
+    """
+
     # Build list of observers, including all sites for a given facility
     observers = {}
 
@@ -108,25 +211,7 @@ def get_sidereal_visibility(
                 elevation=site_details.get('elevation') * units.m
             )
 
-    body = FixedTarget(name=target.name, coord=SkyCoord(target.ra, target.dec, unit='deg'))
-
-    visibility = {}
-    sun, time_range = get_astroplan_sun_and_time(start_time, end_time, interval)
-    for observer_name, observer in observers.items():
-        sun_alt = observer.altaz(time_range, sun).alt
-        obj_airmass = observer.altaz(time_range, body).secz
-
-        bad_indices = np.argwhere(
-            (obj_airmass >= airmass_limit) |
-            (obj_airmass <= 1) |
-            (sun_alt > -18*units.deg)  # between astronomical twilights, i.e. sun is up
-        )
-
-        obj_airmass = [None if i in bad_indices else float(airmass) for i, airmass in enumerate(obj_airmass)]
-
-        visibility[observer_name] = (time_range.datetime, obj_airmass)
-
-    return visibility
+    return observers
 
 
 def get_astroplan_sun_and_time(start_time, end_time, interval):
@@ -184,3 +269,84 @@ def get_facilities():
     facilities += [(x.full_name, x.full_name) for x in GeneralFacility.objects.all()]
 
     return facilities
+
+
+def get_facility_status(facility_class, user=None):
+    """
+    Fetches the status of a facility with ``get_facility_status``, adding the URL from ``get_facility_weather_urls``
+    to each site that has one.
+
+    :param facility_class: The facility class
+    :type facility_class: class
+
+    :param user: Optional. The user whose credentials the facility should use.
+    :type user: User
+
+    :returns: The facility status dictionary
+    :rtype: dict
+    """
+    instance = facility_class()
+    instance.set_user(user)
+    weather_urls = instance.get_facility_weather_urls()
+    status = instance.get_facility_status()
+
+    # add the weather_url to the site dictionary
+    for site in status.get('sites', []):
+        url = next((
+            site_url['weather_url'] for site_url in weather_urls.get('sites', [])
+            if site_url['code'] == site['code']), None)
+        if url is not None:
+            site['weather_url'] = url
+
+    return status
+
+
+def _facility_status_cache_key(name, facility_class, user=None):
+    """
+    Returns the key under which the status of a facility is cached. Only facilities that override ``set_user``, and so
+    may fetch their status with the credentials of the user, are cached separately for each signed-in user.
+    """
+    if (user is not None and user.is_authenticated
+            and facility_class.set_user is not facility.BaseObservationFacility.set_user):
+        return f'facility_status_{name}_{user.pk}'
+    return f'facility_status_{name}'
+
+
+def get_facility_statuses(user=None, refresh=False):
+    """
+    Returns the status of every facility in ``TOM_FACILITY_CLASSES``, as returned by ``get_facility_status``.
+
+    Statuses are cached for ``FACILITY_STATUS_CACHE_TIMEOUT`` seconds (300 by default). The statuses of facilities that
+    override ``set_user`` may be fetched with the credentials of the user, so they are cached for each signed-in user;
+    the statuses of all other facilities are shared by every user. The statuses that are not cached are fetched from all
+    of the facilities concurrently, so a slow facility does not hold up the others.
+
+    :param user: Optional. The user whose credentials the facilities should use for the statuses that are fetched.
+    :type user: User
+
+    :param refresh: Whether to fetch every status again, rather than using the cached statuses.
+    :type refresh: bool
+
+    :returns: List of facility status dictionaries, in the order of ``TOM_FACILITY_CLASSES``
+    :rtype: list
+    """
+    facility_classes = facility.get_service_classes()
+    cache_keys = {name: _facility_status_cache_key(name, facility_class, user)
+                  for name, facility_class in facility_classes.items()}
+    cached_statuses = {} if refresh else cache.get_many(cache_keys.values())
+
+    def fetch_in_thread(name):
+        try:
+            return get_facility_status(facility_classes[name], user)
+        finally:
+            connections.close_all()
+
+    missing = [name for name in facility_classes if cache_keys[name] not in cached_statuses]
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            fetched = executor.map(fetch_in_thread, missing)
+            fetched_statuses = {cache_keys[name]: status for name, status in zip(missing, fetched)}
+        cache.set_many(fetched_statuses, getattr(settings, 'FACILITY_STATUS_CACHE_TIMEOUT', 300))
+        cached_statuses.update(fetched_statuses)
+
+    return [cached_statuses[cache_keys[name]] for name in facility_classes]
@@ -33,6 +33,7 @@ from tom_observations.facility import get_service_class, get_service_classes
 from tom_observations.facility import BaseManualObservationFacility
 from tom_observations.forms import AddExistingObservationForm, facility_choices
 from tom_observations.models import ObservationRecord, ObservationGroup, ObservationTemplate, DynamicCadence
+from tom_observations.utils import get_facility_statuses
 from tom_targets.models import Target
 from tom_targets.permissions import targets_for_user
 
@@ -848,25 +849,11 @@ def render_facility_status_list(request, *args, **kwargs):
     """
     View function for rendering the facility status partial.
     """
-    facility_statuses = []
-    for facility_class in get_service_classes().values():
-        facility = facility_class()
-        facility.set_user(request.user)
-        weather_urls = facility.get_facility_weather_urls()
-        status = facility.get_facility_status()
-
-        # add the weather_url to the site dictionary
-        for site in status.get('sites', []):
-            url = next((
-                site_url['weather_url'] for site_url in weather_urls.get('sites', [])
-                if site_url['code'] == site['code']), None)
-            if url is not None:
-                site['weather_url'] = url
-
-        facility_statuses.append(status)
-
+    # Statuses are served from the cache, and only fetched again when the user asks for an update
     hx_trigger = request.GET.get('hx_trigger')
-    if hx_trigger != 'load':
+    facility_statuses = get_facility_statuses(user=request.user, refresh=hx_trigger == 'refresh')
+
+    if hx_trigger == 'refresh':
         messages.info(request, "Facility statuses updated.")
 
     return render(
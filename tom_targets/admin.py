@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Target, TargetList, TargetExtra, PersistentShare
+from .models import Target, TargetList, TargetExtra, PersistentShare, QueuedShare
 from .forms import AdminPersistentShareForm
 
 
@@ -27,8 +27,19 @@ class PersistentShareAdmin(admin.ModelAdmin):
     )
 
 
+class QueuedShareAdmin(admin.ModelAdmin):
+    model = QueuedShare
+    list_display = ('reduced_datum', 'destination', 'status', 'attempts', 'next_attempt', 'modified')
+    list_filter = ('status', 'destination')
+    raw_id_fields = (
+        'reduced_datum',
+    )
+
+
 admin.site.register(Target, TargetAdmin)
 
 admin.site.register(TargetList, TargetListAdmin)
 
 admin.site.register(PersistentShare, PersistentShareAdmin)
+
+admin.site.register(QueuedShare, QueuedShareAdmin)
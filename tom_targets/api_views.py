@@ -1,7 +1,7 @@
 from django_filters import rest_framework as drf_filters
 from django.http import Http404
 from guardian.mixins import PermissionListMixin
-from guardian.shortcuts import get_objects_for_user
+from rest_framework.decorators import action
 from rest_framework.mixins import DestroyModelMixin, RetrieveModelMixin
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 from rest_framework.response import Response
@@ -9,7 +9,9 @@ from rest_framework import status
 
 from tom_targets.filters import TargetFilterSet
 from tom_targets.models import TargetExtra, TargetName, TargetList, Target
-from tom_targets.serializers import TargetSerializer, TargetExtraSerializer, TargetNameSerializer, TargetListSerializer
+from tom_targets.permissions import targets_with_permission
+from tom_targets.serializers import (TargetSerializer, TargetExtraSerializer, TargetNameSerializer,
+                                     TargetListSerializer, TargetCatalogMatchSerializer)
 
 
 permissions_map = {  # TODO: Use the built-in DRF mapping or just switch to DRF entirely.
@@ -47,6 +49,9 @@ class TargetViewSet(ModelViewSet, PermissionListMixin):
 
     ``TargetName`` and ``TargetExtra`` objects can only be deleted or specifically retrieved via the
     ``/api/targetname/`` or ``/api/targetextra/`` endpoints.
+
+    A whole catalog of candidates can be matched against the ``Target`` objects visible to the user by posting lists of
+    ``names`` and/or ``ra``, ``dec`` and a ``radius`` in arcseconds to ``/api/targets/match/``.
     """
     serializer_class = TargetSerializer
     filter_backends = (drf_filters.DjangoFilterBackend,)
@@ -54,7 +59,7 @@ class TargetViewSet(ModelViewSet, PermissionListMixin):
 
     def get_queryset(self):
         permission_required = permissions_map.get(self.request.method)
-        return get_objects_for_user(self.request.user, f'{Target._meta.app_label}.{permission_required}')
+        return targets_with_permission(self.request.user, Target.objects.all(), permission_required)
 
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
@@ -72,6 +77,31 @@ class TargetViewSet(ModelViewSet, PermissionListMixin):
             response.data['message'] = 'Target successfully updated.'
         return response
 
+    # POST /api/targets/match/
+    @action(detail=False, methods=['post'], serializer_class=TargetCatalogMatchSerializer)
+    def match(self, request, *args, **kwargs):
+        """
+        Matches every candidate of a catalog against existing targets using ``TargetMatchManager.match_catalog``.
+        Returns one entry per candidate, in the order given, listing the matching targets and their separation from
+        the candidate in arcseconds (null for targets that only matched by name).
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        queryset = targets_with_permission(request.user, Target.objects.all(), 'view_target')
+        matches = Target.matches.match_catalog(queryset=queryset, **serializer.validated_data)
+
+        matched_ids = {target_id for candidate_matches in matches for target_id in candidate_matches}
+        target_names = dict(Target.objects.filter(pk__in=matched_ids).values_list('pk', 'name'))
+        results = [
+            {
+                'index': index,
+                'matches': [{'id': target_id, 'name': target_names[target_id], 'separation': separation}
+                            for target_id, separation in candidate_matches.items()]
+            }
+            for index, candidate_matches in enumerate(matches)
+        ]
+        return Response(results, status=status.HTTP_200_OK)
+
     def handle_exception(self, exc):
         """Create Custom Error Message for Http404 errors because Target can have different names based on the supplied
          Model."""
@@ -93,7 +123,7 @@ class TargetNameViewSet(DestroyModelMixin, PermissionListMixin, RetrieveModelMix
     def get_queryset(self):
         permission_required = permissions_map.get(self.request.method)
         return TargetName.objects.filter(
-            target__in=get_objects_for_user(self.request.user, f'{Target._meta.app_label}.{permission_required}')
+            target__in=targets_with_permission(self.request.user, Target.objects.all(), permission_required)
         )
 
 
@@ -108,7 +138,7 @@ class TargetExtraViewSet(DestroyModelMixin, PermissionListMixin, RetrieveModelMi
     def get_queryset(self):
         permission_required = permissions_map.get(self.request.method)
         return TargetExtra.objects.filter(
-            target__in=get_objects_for_user(self.request.user, f'{Target._meta.app_label}.{permission_required}')
+            target__in=targets_with_permission(self.request.user, Target.objects.all(), permission_required)
         )
 
 
@@ -123,5 +153,5 @@ class TargetListViewSet(DestroyModelMixin, PermissionListMixin, RetrieveModelMix
     def get_queryset(self):
         permission_required = permissions_map.get(self.request.method)
         return TargetList.objects.filter(
-            target__in=get_objects_for_user(self.request.user, f'{Target._meta.app_label}.{permission_required}')
+            target__in=targets_with_permission(self.request.user, Target.objects.all(), permission_required)
         )
@@ -1,24 +1,24 @@
 import logging
 
+import numpy as np
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.db.models.functions.math import ACos, Cos, Radians, Pi, Sin
-from django.db.models.functions import Least
 from django.forms.models import model_to_dict
 from django.urls import reverse
 from django.utils.module_loading import import_string
 from guardian.shortcuts import assign_perm
-from math import radians
 from astropy.coordinates import get_constellation, SkyCoord
 
 from tom_common.hooks import run_hook
+from tom_targets.sky_pixels import (MAX_PIXEL_RANGES, cone_search, crossmatch, merge_pixel_ranges, sky_pixel,
+                                    sky_pixel_filter, sky_pixel_ranges)
 
 logger = logging.getLogger(__name__)
 GLOBAL_TARGET_FIELDS = ['name', 'type']
 
 IGNORE_FIELDS = ['id', 'created', 'modified', 'aliases', 'targetextra', 'targetlist', 'observationrecord',
-                 'dataproduct', 'reduceddatum', 'basetarget_ptr']
+                 'dataproduct', 'reduceddatum', 'basetarget_ptr', 'simple_name', 'sky_pixel']
 
 SIDEREAL_FIELDS = GLOBAL_TARGET_FIELDS + [
     'ra', 'dec', 'epoch', 'pm_ra', 'pm_dec', 'galactic_lng', 'galactic_lat', 'distance', 'distance_err'
@@ -30,6 +30,9 @@ NON_SIDEREAL_FIELDS = GLOBAL_TARGET_FIELDS + [
     'ephemeris_epoch', 'ephemeris_epoch_err', 'perihdist', 'abs_mag', 'slope'
 ]
 
+# Maximum number of names sent to the database in a single query by ``TargetMatchManager.match_catalog``
+MATCH_CATALOG_CHUNK_SIZE = 500
+
 REQUIRED_SIDEREAL_FIELDS = ['ra', 'dec']
 REQUIRED_NON_SIDEREAL_FIELDS = [
     'scheme', 'epoch_of_elements', 'inclination', 'lng_asc_node', 'arg_of_perihelion', 'eccentricity',
@@ -122,32 +125,89 @@ class TargetMatchManager(models.Manager):
         if ra is None or dec is None or radius is None or dec < -90 or dec > 90:
             return self.get_queryset().none()
 
-        # Ensure that the search ra is between 0 and 360
-        ra %= 360
-
         radius /= 3600  # Convert radius from arcseconds to degrees
-        double_radius = radius * 2
-        # Perform initial filter to reduce the number of targets that need a calculated separation
-        queryset = super().get_queryset().filter(
-            ra__gte=ra - double_radius, ra__lte=ra + double_radius,
-            dec__gte=dec - double_radius, dec__lte=dec + double_radius
-        )
 
-        # Calculate the angular separation between the target and the given ra and dec
-        # Uses Django Database Functions, to perform the calculation in the database.
-        # Includes a "Least" function to ensure that the value passed to the ACos function is never greater than 1
-        # due to floating point errors. We ignore the case of this being less than -1 since this will only happen when
-        # the target is on the opposite side of the sky from the search coordinates.
-        separation = models.ExpressionWrapper(
-            ACos(
-                Least(
-                    (Sin(radians(dec)) * Sin(Radians('dec'))) +
-                    (Cos(radians(dec)) * Cos(Radians('dec')) * Cos(radians(ra) - Radians('ra'))), 1.0
+        # Candidates are selected from the indexed sky pixels before calculating the exact separation in the database
+        return cone_search(super().get_queryset(), ra, dec, radius)
+
+    def match_catalog(self, names=None, ra=None, dec=None, radius=None, queryset=None):
+        """
+        Matches a whole catalog of candidates against existing targets in a few queries, rather than one query per
+        candidate. A candidate matches a target when its name, processed by ``simplify_name``, matches the similarly
+        processed name or an alias of the target, or when its position is within ``radius`` of the target.
+
+        NOTE:
+            Overrides of ``match_target``, ``match_name`` or ``match_cone_search`` in a custom ``TargetMatchManager``
+            are not used by this function. Overrides of ``simplify_name`` are.
+
+        :param names: The names of the candidates. Entries that are ``None`` or empty are not matched by name.
+        :type names: list
+
+        :param ra: The right ascensions of the candidates in degrees. Must have the same length as ``names`` if both are
+            given. Entries that are ``None`` are not matched by position.
+        :type ra: list
+
+        :param dec: The declinations of the candidates in degrees.
+        :type dec: list
+
+        :param radius: The radius in arcseconds within which to match positions. Positions are not matched if not given.
+        :type radius: float
+
+        :param queryset: Optional queryset to restrict the targets that are matched. If not provided, all targets will
+            be considered.
+        :type queryset: QuerySet
+
+        :return: A list with one dictionary per candidate, mapping the primary key of each matching target to its
+            separation from the candidate in arcseconds. The separation is None for targets that only matched by name.
+        :rtype: list
+        """
+        queryset = queryset if queryset is not None else self.get_queryset()
+        count = len(names) if names is not None else len(ra) if ra is not None else 0
+        matches = [{} for _ in range(count)]
+
+        if names is not None:
+            simple_names = [self.simplify_name(name) if name else None for name in names]
+            unique_names = list({simple_name for simple_name in simple_names if simple_name})
+            alias_model = self.model._meta.get_field('aliases').related_model
+            target_ids_by_name = {}
+            for start in range(0, len(unique_names), MATCH_CATALOG_CHUNK_SIZE):
+                chunk = unique_names[start:start + MATCH_CATALOG_CHUNK_SIZE]
+                name_matches = queryset.filter(simple_name__in=chunk).values_list('simple_name', 'pk')
+                alias_matches = alias_model.objects.filter(
+                    simple_name__in=chunk, target_id__in=queryset.values('pk')
+                ).values_list('simple_name', 'target_id')
+                for simple_name, target_id in list(name_matches) + list(alias_matches):
+                    target_ids_by_name.setdefault(simple_name, set()).add(target_id)
+            for index, simple_name in enumerate(simple_names):
+                for target_id in target_ids_by_name.get(simple_name, []):
+                    matches[index][target_id] = None
+
+        if ra is not None and dec is not None and radius is not None:
+            radius /= 3600  # Convert radius from arcseconds to degrees
+            indices = [index for index in range(count)
+                       if ra[index] is not None and dec[index] is not None and -90 <= dec[index] <= 90]
+            candidate_ra = np.array([ra[index] for index in indices], dtype=float) % 360
+            candidate_dec = np.array([dec[index] for index in indices], dtype=float)
+
+            # Fetch the positions of every target in the sky pixels covering any of the candidates
+            ranges = merge_pixel_ranges(
+                pixel_range for index in range(len(indices))
+                for pixel_range in sky_pixel_ranges(candidate_ra[index], candidate_dec[index], radius)
+            )
+            targets = []
+            for start in range(0, len(ranges), MAX_PIXEL_RANGES):
+                pixel_filter = sky_pixel_filter(ranges[start:start + MAX_PIXEL_RANGES])
+                targets.extend(queryset.filter(pixel_filter).values_list('pk', 'ra', 'dec'))
+
+            if targets:
+                target_ids, target_ra, target_dec = zip(*targets)
+                candidate_indices, target_indices, separations = crossmatch(
+                    candidate_ra, candidate_dec, target_ra, target_dec, radius
                 )
-            ) * 180 / Pi(), models.FloatField()
-        )
+                for candidate_index, target_index, separation in zip(candidate_indices, target_indices, separations):
+                    matches[indices[candidate_index]][target_ids[target_index]] = float(separation) * 3600
 
-        return queryset.annotate(separation=separation).filter(separation__lte=radius)
+        return matches
 
     def match_exact_name(self, name):
         """
@@ -171,13 +231,12 @@ class TargetMatchManager(models.Manager):
         :return: queryset containing matching Targets. Will return targets even when matched value is an alias.
         """
         simple_name = self.simplify_name(name)
-        matching_names = []
-        for target in self.get_queryset().all().prefetch_related('aliases'):
-            for alias in target.names:
-                if self.simplify_name(alias) == simple_name:
-                    matching_names.append(target.name)
-        initial_queryset = input_queryset or self.get_queryset()
-        queryset = initial_queryset.filter(name__in=matching_names)
+        # The simplified names of every target and alias are stored in indexed columns when they are saved (see
+        # ``BaseTarget.save`` and ``TargetName.save``), so this is a pair of indexed lookups rather than a scan.
+        alias_model = self.model._meta.get_field('aliases').related_model
+        alias_matches = alias_model.objects.filter(simple_name=simple_name).values('target_id')
+        initial_queryset = input_queryset if input_queryset is not None else self.get_queryset()
+        queryset = initial_queryset.filter(models.Q(simple_name=simple_name) | models.Q(pk__in=alias_matches))
         return queryset
 
     def simplify_name(self, name):
@@ -186,6 +245,11 @@ class TargetMatchManager(models.Manager):
         By default, this method removes capitalization, spaces, dashes, underscores, and parentheses from the name.
         This can be overridden in a subclass to provide custom name simplification.
 
+        NOTE:
+            The result is stored on each ``Target`` and ``TargetName`` when they are saved. If you change the
+            simplification logic of an existing TOM, run ``./manage.py backfillsimplenames`` to update the stored
+            values.
+
         :param name: The string to be simplified.
 
         :return: A simplified string version of the given name.
@@ -220,6 +284,9 @@ class BaseTarget(models.Model):
     :param name: The name of this target e.g. Barnard\'s star.
     :type name: str
 
+    :param simple_name: The simplified version of ``name`` used for fuzzy matching. Set automatically on save.
+    :type simple_name: str
+
     :param type: The type of this target.
     :type type: str
 
@@ -235,6 +302,10 @@ class BaseTarget(models.Model):
     :param dec: Declination, in degrees.
     :type dec: float
 
+    :param sky_pixel: The sky pixel containing the target position, used to index cone searches. Set automatically on
+        save.
+    :type sky_pixel: int
+
     :param epoch: Julian Years. Max 2100.
     :type epoch: float
 
@@ -327,6 +398,10 @@ class BaseTarget(models.Model):
         max_length=100, default='', verbose_name='Name', help_text='The name of this target e.g. Barnard\'s star.',
         unique=True
     )
+    simple_name = models.CharField(
+        max_length=100, default='', editable=False, db_index=True, verbose_name='Simplified Name',
+        help_text='The name of this target as processed by simplify_name, used for fuzzy matching.'
+    )
     type = models.CharField(
         max_length=100, choices=TARGET_TYPES, verbose_name='Target Type', help_text='The type of this target.'
     )
@@ -349,6 +424,10 @@ class BaseTarget(models.Model):
     dec = models.FloatField(
         null=True, blank=True, verbose_name='Declination', help_text='Declination, in degrees.'
     )
+    sky_pixel = models.IntegerField(
+        null=True, editable=False, db_index=True, verbose_name='Sky Pixel',
+        help_text='The sky pixel containing this target\'s position, used to index cone searches.'
+    )
     epoch = models.FloatField(
         null=True, blank=True, verbose_name='Epoch', help_text='Julian Years. Max 2100.'
     )
@@ -466,6 +545,17 @@ class BaseTarget(models.Model):
 
         created = False if self.id else True
 
+        self.simple_name = self.__class__.matches.simplify_name(self.name)
+        self.sky_pixel = sky_pixel(self.ra, self.dec)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'name' in update_fields:
+                update_fields.add('simple_name')
+            if update_fields & {'ra', 'dec'}:
+                update_fields.add('sky_pixel')
+            kwargs['update_fields'] = update_fields
+
         super().save(*args, **kwargs)
 
         if created:
@@ -555,9 +645,7 @@ class BaseTarget(models.Model):
         :returns: List of ``ObservationRecord`` objects without a terminal status
         :rtype: list
         """
-        return [
-            obs for obs in self.observationrecord_set.exclude(status='').order_by('scheduled_start') if not obs.terminal
-        ]
+        return list(self.observationrecord_set.exclude(status='').non_terminal().order_by('scheduled_start'))
 
     @property
     def extra_fields(self):
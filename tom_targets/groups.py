@@ -1,6 +1,132 @@
 from .filters import TargetFilterSet
-from .models import Target
+from .models import Target, TargetList
+from .permissions import targets_for_user
 from django.contrib import messages
+from django.db import transaction
+
+# Number of targets to insert into or delete from a grouping per query
+GROUPING_BATCH_SIZE = 1000
+
+
+def _batches(target_ids):
+    target_ids = sorted(target_ids)
+    for start in range(0, len(target_ids), GROUPING_BATCH_SIZE):
+        yield target_ids[start:start + GROUPING_BATCH_SIZE]
+
+
+def _filtered_targets(filter_data, request):
+    """
+    Returns the targets displayed by a particular filter that the user is allowed to view.
+    """
+    target_queryset = TargetFilterSet(request=request, data=filter_data, queryset=Target.objects.all()).qs
+    return targets_for_user(request.user, target_queryset, 'view_target')
+
+
+def _selected_targets(targets_ids, request):
+    """
+    Returns the selected targets that the user is allowed to view, and the ids of those that could not be found or are
+    not valid, with the reason for each.
+    """
+    valid_ids = set()
+    failure_targets = []
+    for target_id in targets_ids:
+        try:
+            valid_ids.add(int(target_id))
+        except (TypeError, ValueError) as e:
+            failure_targets.append((target_id, e,))
+    target_queryset = targets_for_user(request.user, Target.objects.filter(pk__in=valid_ids), 'view_target')
+    found_ids = set(target_queryset.values_list('pk', flat=True))
+    failure_targets.extend((target_id, 'Target not found.',) for target_id in sorted(valid_ids - found_ids))
+    return target_queryset, failure_targets
+
+
+def _through_rows(grouping_object, target_ids):
+    through_model = TargetList.targets.through
+    return [through_model(targetlist_id=grouping_object.pk, basetarget_id=target_id) for target_id in target_ids]
+
+
+def _split_by_membership(target_queryset, grouping_object):
+    """
+    Returns the names of the targets in the queryset, keyed by id, and the ids of those that are already in the
+    grouping.
+    """
+    target_names = dict(target_queryset.values_list('pk', 'name'))
+    existing_ids = set(grouping_object.targets.filter(pk__in=target_queryset.values('pk'))
+                       .values_list('pk', flat=True))
+    return target_names, existing_ids
+
+
+def _add_to_grouping(target_queryset, grouping_object, move=False):
+    """
+    Adds the targets in a queryset to a ``TargetList`` with a single bulk insert, optionally removing the targets that
+    are not already in the ``TargetList`` from every other grouping first.
+
+    :returns: the names of the added targets and the names of the targets that were already in the grouping
+    :rtype: tuple
+    """
+    target_names, existing_ids = _split_by_membership(target_queryset, grouping_object)
+    new_ids = set(target_names) - existing_ids
+    through_model = TargetList.targets.through
+    with transaction.atomic():
+        if move:
+            for batch in _batches(new_ids):
+                through_model.objects.filter(basetarget_id__in=batch).delete()
+        through_model.objects.bulk_create(_through_rows(grouping_object, sorted(new_ids)),
+                                          batch_size=GROUPING_BATCH_SIZE, ignore_conflicts=True)
+    return ([name for pk, name in target_names.items() if pk in new_ids],
+            [name for pk, name in target_names.items() if pk in existing_ids])
+
+
+def _remove_from_grouping(target_queryset, grouping_object):
+    """
+    Removes the targets in a queryset from a ``TargetList`` with a single filtered delete.
+
+    :returns: the names of the removed targets and the names of the targets that were not in the grouping
+    :rtype: tuple
+    """
+    target_names, existing_ids = _split_by_membership(target_queryset, grouping_object)
+    through_model = TargetList.targets.through
+    with transaction.atomic():
+        for batch in _batches(existing_ids):
+            through_model.objects.filter(targetlist=grouping_object, basetarget_id__in=batch).delete()
+    return ([name for pk, name in target_names.items() if pk in existing_ids],
+            sorted(name for pk, name in target_names.items() if pk not in existing_ids))
+
+
+def _update_grouping(target_queryset, failure_targets, grouping_object, request, action):
+    """
+    Adds, removes or moves the targets in a queryset to or from a ``TargetList`` after checking once that the user is
+    allowed to change it, and adds the summary of the outcome to the request's messages.
+    """
+    verb, preposition, warning = {
+        'add': ('added', 'to', 'already in'),
+        'remove': ('removed', 'from', 'not in'),
+        'move': ('moved', 'to', 'already in'),
+    }[action]
+    if not request.user.has_perm('tom_targets.change_targetlist', grouping_object):
+        messages.error(request, "Failed to {} target(s) {} group '{}'; Permission denied."
+                                .format(action, preposition, grouping_object.name))
+        return
+    try:
+        if action == 'remove':
+            success_targets, warning_targets = _remove_from_grouping(target_queryset, grouping_object)
+        else:
+            success_targets, warning_targets = _add_to_grouping(target_queryset, grouping_object,
+                                                                move=action == 'move')
+    except Exception as e:
+        messages.error(request, "Failed to {} target(s) {} group '{}'; {}"
+                                .format(action, preposition, grouping_object.name, e))
+        return
+    messages.success(request, "{} target(s) successfully {} {} group '{}'."
+                              .format(len(success_targets), verb, preposition, grouping_object.name))
+    if warning_targets:
+        messages.warning(request, "{} target(s) {} group '{}': {}"
+                                  .format(len(warning_targets), warning, grouping_object.name,
+                                          ', '.join(warning_targets)))
+    for failure_target in failure_targets:
+        messages.error(request, "Failed to {} target with id={} {} group '{}'; {}"
+                                .format(action, failure_target[0], preposition, grouping_object.name,
+                                        failure_target[1]))
 
 
 def add_all_to_grouping(filter_data, grouping_object, request):
@@ -17,34 +143,13 @@ def add_all_to_grouping(filter_data, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []  # targets that are already in the grouping
-    failure_targets = []
     try:
-        target_queryset = TargetFilterSet(request=request, data=filter_data, queryset=Target.objects.all()).qs
+        target_queryset = _filtered_targets(filter_data, request)
     except Exception:
         messages.error(request, "Error with filter parameters. No target(s) were added to group '{}'."
                                 .format(grouping_object.name))
         return
-    for target_object in target_queryset:
-        try:
-            if not request.user.has_perm('tom_targets.change_targetlist', grouping_object):
-                failure_targets.append((grouping_object.name, 'Permission denied.',))
-            elif grouping_object.targets.filter(pk=target_object.pk).exists():
-                warning_targets.append(target_object.name)
-            else:
-                grouping_object.targets.add(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append((target_object.pk, e,))
-    messages.success(request, "{} target(s) successfully added to group '{}'."
-                              .format(len(success_targets), grouping_object.name))
-    if warning_targets:
-        messages.warning(request, "{} target(s) already in group '{}': {}"
-                                  .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
-    for failure_target in failure_targets:
-        messages.error(request, "Failed to add target with id={} to group '{}'; {}"
-                                .format(failure_target[0], grouping_object.name, failure_target[1]))
+    _update_grouping(target_queryset, [], grouping_object, request, 'add')
 
 
 def add_selected_to_grouping(targets_ids, grouping_object, request):
@@ -61,29 +166,8 @@ def add_selected_to_grouping(targets_ids, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []
-    failure_targets = []
-    for target_id in targets_ids:
-        try:
-            target_object = Target.objects.get(pk=target_id)
-            if not request.user.has_perm('tom_targets.change_targetlist', grouping_object):
-                failure_targets.append((grouping_object.name, 'Permission denied.',))
-            elif grouping_object.targets.filter(pk=target_object.pk).exists():
-                warning_targets.append(target_object.name)
-            else:
-                grouping_object.targets.add(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append((target_id, e,))
-    messages.success(request, "{} target(s) successfully added to group '{}'."
-                              .format(len(success_targets), grouping_object.name))
-    if warning_targets:
-        messages.warning(request, "{} target(s) already in group '{}': {}"
-                                  .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
-    for failure_target in failure_targets:
-        messages.error(request, "Failed to add target with id={} to group '{}'; {}"
-                                .format(failure_target[0], grouping_object.name, failure_target[1]))
+    target_queryset, failure_targets = _selected_targets(targets_ids, request)
+    _update_grouping(target_queryset, failure_targets, grouping_object, request, 'add')
 
 
 def remove_all_from_grouping(filter_data, grouping_object, request):
@@ -100,41 +184,19 @@ def remove_all_from_grouping(filter_data, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []
-    failure_targets = []
     try:
-        target_queryset = TargetFilterSet(request=request, data=filter_data, queryset=Target.objects.all()).qs
+        target_queryset = _filtered_targets(filter_data, request)
     except Exception:
         messages.error(request, "Error with filter parameters. No target(s) were removed from group '{}'."
                                 .format(grouping_object.name))
         return
-    for target_object in target_queryset:
-        try:
-            if not request.user.has_perm('tom_targets.change_targetlist', grouping_object):
-                failure_targets.append((grouping_object.name, 'Permission denied.',))
-            elif not grouping_object.targets.filter(pk=target_object.pk).exists():
-                warning_targets.append(target_object.name)
-            else:
-                grouping_object.targets.remove(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append({'name': target_object.name, 'error': e})
-    messages.success(request, "{} target(s) successfully removed from group '{}'."
-                              .format(len(success_targets), grouping_object.name))
-    if warning_targets:
-        messages.warning(request, "{} target(s) not in group '{}': {}"
-                                  .format(len(warning_targets), grouping_object.name, ', '
-                                          .join(sorted(warning_targets))))
-    for failure_target in failure_targets:
-        messages.error(request, "Failed to remove target with id={} from group '{}'; {}"
-                                .format(failure_target['id'], grouping_object.name, failure_target['error']))
+    _update_grouping(target_queryset, [], grouping_object, request, 'remove')
 
 
 def remove_selected_from_grouping(targets_ids, grouping_object, request):
     """
-    Removes all targets displayed by a particular filter from a ``TargetList``. Successes, warnings, and errors result
-    in messages being added to the request with the appropriate message level.
+    Removes all selected targets from a ``TargetList``. Successes, warnings, and errors result in messages being added
+    to the request with the appropriate message level.
 
     :param targets_ids: list of selected targets
     :type targets_ids: list
@@ -145,30 +207,8 @@ def remove_selected_from_grouping(targets_ids, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []
-    failure_targets = []
-    for target_id in targets_ids:
-        try:
-            target_object = Target.objects.get(pk=target_id)
-            if not request.user.has_perm('tom_targets.change_targetlist', grouping_object):
-                failure_targets.append((grouping_object.name, 'Permission denied.',))
-            elif not grouping_object.targets.filter(pk=target_object.pk).exists():
-                warning_targets.append(target_object.name)
-            else:
-                grouping_object.targets.remove(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append({'id': target_id, 'error': e})
-    messages.success(request, "{} target(s) successfully removed from group '{}'."
-                              .format(len(success_targets), grouping_object.name))
-    if warning_targets:
-        messages.warning(request, "{} target(s) not in group '{}': {}"
-                                  .format(len(warning_targets), grouping_object.name, ', '
-                                          .join(sorted(warning_targets))))
-    for failure_target in failure_targets:
-        messages.error(request, "Failed to remove target with id={} from group '{}'; {}"
-                                .format(failure_target['id'], grouping_object.name, failure_target['error']))
+    target_queryset, failure_targets = _selected_targets(targets_ids, request)
+    _update_grouping(target_queryset, failure_targets, grouping_object, request, 'remove')
 
 
 def move_all_to_grouping(filter_data, grouping_object, request):
@@ -187,35 +227,13 @@ def move_all_to_grouping(filter_data, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []
-    failure_targets = []
     try:
-        target_queryset = TargetFilterSet(request=request, data=filter_data, queryset=Target.objects.all()).qs
+        target_queryset = _filtered_targets(filter_data, request)
     except Exception:
         messages.error(request, "Error with filter parameters. No target(s) were moved to group '{}'."
                                 .format(grouping_object.name))
         return
-    for target_object in target_queryset:
-        try:
-            if not request.user.has_perm('tom_targets.change_targetlist', grouping_object):
-                failure_targets.append((grouping_object.name, 'Permission denied.',))
-            elif grouping_object.targets.filter(pk=target_object.pk).exists():
-                warning_targets.append(target_object.name)
-            else:
-                target_object.targetlist_set.clear()
-                grouping_object.targets.add(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append({'name': target_object.name, 'error': e})
-    messages.success(request, "{} target(s) successfully moved to group '{}'."
-                              .format(len(success_targets), grouping_object.name))
-    if warning_targets:
-        messages.warning(request, "{} target(s) already in group '{}': {}"
-                                  .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
-    for failure_target in failure_targets:
-        messages.error(request, "Failed to move target with id={} to group '{}'; {}"
-                                .format(failure_target['id'], grouping_object.name, failure_target['error']))
+    _update_grouping(target_queryset, [], grouping_object, request, 'move')
 
 
 def move_selected_to_grouping(targets_ids, grouping_object, request):
@@ -234,27 +252,5 @@ def move_selected_to_grouping(targets_ids, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []
-    failure_targets = []
-    for target_id in targets_ids:
-        try:
-            target_object = Target.objects.get(pk=target_id)
-            if not request.user.has_perm('tom_targets.change_targetlist', grouping_object):
-                failure_targets.append((grouping_object.name, 'Permission denied.',))
-            elif grouping_object.targets.filter(pk=target_object.pk).exists():
-                warning_targets.append(target_object.name)
-            else:
-                target_object.targetlist_set.clear()
-                grouping_object.targets.add(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append((target_id, e,))
-    messages.success(request, "{} target(s) successfully moved to group '{}'."
-                              .format(len(success_targets), grouping_object.name))
-    if warning_targets:
-        messages.warning(request, "{} target(s) already in group '{}': {}"
-                                  .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
-    for failure_target in failure_targets:
-        messages.error(request, "Failed to move target with id={} to group '{}'; {}"
-                                .format(failure_target[0], grouping_object.name, failure_target[1]))
+    target_queryset, failure_targets = _selected_targets(targets_ids, request)
+    _update_grouping(target_queryset, failure_targets, grouping_object, request, 'move')
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from tom_targets.models import Target, TargetName
+
+
+class Command(BaseCommand):
+    """
+    This management command recomputes the stored simplified names of all Targets and TargetNames that are used by
+    ``TargetMatchManager.match_fuzzy_name``. It should be run after changing ``simplify_name`` in a custom
+    ``TargetMatchManager``, or after Targets or TargetNames have been written without calling ``save()``
+    (e.g. with ``bulk_create`` or ``update``).
+
+    Example: ./manage.py backfillsimplenames --batch_size 5000
+    """
+
+    help = 'Recomputes the simplified names used for fuzzy target name matching.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=10000,
+            help='Number of rows to read and update at a time.'
+        )
+
+    def backfill(self, model, batch_size):
+        """
+        Update the ``simple_name`` of every row of ``model`` whose stored value is out of date.
+
+        :returns: The number of updated rows
+        :rtype: int
+        """
+        updated = 0
+        batch = []
+        for obj in model.objects.only('pk', 'name', 'simple_name').iterator(chunk_size=batch_size):
+            simple_name = Target.matches.simplify_name(obj.name)
+            if obj.simple_name != simple_name:
+                obj.simple_name = simple_name
+                batch.append(obj)
+            if len(batch) >= batch_size:
+                updated += model.objects.bulk_update(batch, ['simple_name'])
+                batch = []
+        if batch:
+            updated += model.objects.bulk_update(batch, ['simple_name'])
+        return updated
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in [Target, TargetName]:
+            updated = self.backfill(model, batch_size)
+            self.stdout.write(f'Updated the simplified names of {updated} {model._meta.verbose_name_plural}.')
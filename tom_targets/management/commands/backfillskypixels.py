@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from tom_targets.models import Target
+from tom_targets.sky_pixels import sky_pixel
+
+
+class Command(BaseCommand):
+    """
+    This management command recomputes the sky pixel of every Target, which is used to index cone searches. It should
+    be run after Target coordinates have been written without calling ``save()`` (e.g. with ``bulk_create`` or
+    ``update``).
+
+    Example: ./manage.py backfillskypixels --batch_size 5000
+    """
+
+    help = 'Recomputes the sky pixels used to index target cone searches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=10000,
+            help='Number of targets to read and update at a time.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        updated = 0
+        batch = []
+        for target in Target.objects.only('pk', 'ra', 'dec', 'sky_pixel').iterator(chunk_size=batch_size):
+            pixel = sky_pixel(target.ra, target.dec)
+            if target.sky_pixel != pixel:
+                target.sky_pixel = pixel
+                batch.append(target)
+            if len(batch) >= batch_size:
+                updated += Target.objects.bulk_update(batch, ['sky_pixel'])
+                batch = []
+        if batch:
+            updated += Target.objects.bulk_update(batch, ['sky_pixel'])
+        self.stdout.write(f'Updated the sky pixels of {updated} targets.')
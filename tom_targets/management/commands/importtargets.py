@@ -0,0 +1,56 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tom_targets.utils import IMPORT_CHUNK_SIZE, bulk_import_targets
+
+
+class Command(BaseCommand):
+    """
+    This management command imports the targets in a CSV file, in the same format as the target import page, using
+    ``bulk_import_targets``. Use ``--dry_run`` to check a file for errors without creating any targets.
+
+    Example: ./manage.py importtargets targets.csv --user admin --chunk_size 5000
+    """
+
+    help = 'Imports targets in bulk from a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path to the CSV file of targets to import.')
+        parser.add_argument(
+            '--user',
+            help='Username of a user who will be given access to the imported targets.'
+        )
+        parser.add_argument(
+            '--chunk_size',
+            type=int,
+            default=IMPORT_CHUNK_SIZE,
+            help='Number of rows to validate and insert at a time.'
+        )
+        parser.add_argument(
+            '--dry_run',
+            action='store_true',
+            help='Validate the targets and report errors without creating any targets.'
+        )
+
+    def report_progress(self, rows, targets, errors):
+        self.stdout.write(f'Processed {rows} rows: {targets} targets, {errors} errors')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'User {options["user"]} does not exist.')
+
+        with open(options['csv_file'], newline='', encoding='utf-8') as csv_file:
+            result = bulk_import_targets(csv_file, user=user, dry_run=options['dry_run'],
+                                         chunk_size=options['chunk_size'], progress=self.report_progress)
+
+        for error in result['errors']:
+            self.stderr.write(error)
+        if options['dry_run']:
+            self.stdout.write(f'Dry run, no targets were created. Targets that would be created: '
+                              f'{len(result["targets"])}')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Targets created: {len(result["targets"])}'))
@@ -0,0 +1,78 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from tom_targets.merge import target_merge
+from tom_targets.models import Target
+
+
+class Command(BaseCommand):
+    """
+    This management command merges pairs of duplicate targets listed in a CSV file, such as the output of a search for
+    duplicates. Each row holds the primary target and the secondary target to merge into it, as either target ids or
+    target names, and the secondary target is deleted once merged. An all-digit identifier is looked up as a target id
+    first and as a target name if no target has that id. Each pair is merged in its own transaction, so a
+    pair that fails to merge does not undo the others. Use ``--dry_run`` to check the pairs without merging any targets.
+
+    Example: ./manage.py mergetargets duplicates.csv
+    """
+
+    help = 'Merges the pairs of primary and secondary targets listed in a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path to a CSV file with a primary and a secondary target on each row.')
+        parser.add_argument(
+            '--dry_run',
+            action='store_true',
+            help='Check that the targets of each pair exist without merging any targets.'
+        )
+
+    def get_target(self, identifier):
+        """
+        Returns the target with the given id, falling back to the target with the given name so that targets with
+        all-digit names can still be merged by name.
+        """
+        identifier = identifier.strip()
+        if identifier.isdigit():
+            try:
+                return Target.objects.get(pk=int(identifier))
+            except Target.DoesNotExist:
+                pass
+        return Target.objects.get(name=identifier)
+
+    def handle(self, *args, **options):
+        merged = 0
+        errors = 0
+        with open(options['csv_file'], newline='', encoding='utf-8') as csv_file:
+            for line, row in enumerate(csv.reader(csv_file), start=1):
+                if not row or row[0].strip().lower() == 'primary':
+                    # Skip blank lines and the header row
+                    continue
+                if len(row) != 2:
+                    self.stderr.write(f'Line {line}: expected a primary and a secondary target, got {row}')
+                    errors += 1
+                    continue
+                try:
+                    primary_target = self.get_target(row[0])
+                    secondary_target = self.get_target(row[1])
+                except Target.DoesNotExist:
+                    self.stderr.write(f'Line {line}: target {row[0]} or {row[1]} does not exist')
+                    errors += 1
+                    continue
+                if primary_target == secondary_target:
+                    self.stderr.write(f'Line {line}: cannot merge target {primary_target} into itself')
+                    errors += 1
+                    continue
+
+                if not options['dry_run']:
+                    try:
+                        target_merge(primary_target, secondary_target)
+                    except Exception as e:
+                        self.stderr.write(f'Line {line}: unable to merge {secondary_target} into {primary_target}: {e}')
+                        errors += 1
+                        continue
+                merged += 1
+
+        if options['dry_run']:
+            return f'Dry run, no targets were merged. Pairs that would be merged: {merged}, errors: {errors}'
+        return f'Targets merged: {merged}, errors: {errors}'
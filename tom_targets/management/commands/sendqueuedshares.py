@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from tom_targets.sharing import share_queued_data
+
+
+class Command(BaseCommand):
+    """
+    This management command shares all of the data queued by continuous sharing whose next attempt is due, including
+    those whose earlier attempts failed. New data are normally shared by the ``send_queued_shares`` task, which only
+    shares the data queued with it, so this command should be run regularly by a cron job to retry failed shares when
+    the task backend does not support deferred tasks, and to share any data left in the outbox.
+
+    Example: ./manage.py sendqueuedshares --batch_size 100
+    """
+
+    help = 'Shares the data queued by continuous sharing whose next attempt is due'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=None,
+            help='Number of queued data to share with a destination at a time.'
+        )
+
+    def handle(self, *args, **options):
+        results = share_queued_data(batch_size=options['batch_size'])
+        return (f'Queued data shared: {results["sent"]}, to be retried: {results["retrying"]}, '
+                f'failed: {results["failed"]}')
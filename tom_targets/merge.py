@@ -1,7 +1,9 @@
 from django.contrib import messages
-from django.core.exceptions import ValidationError
+from django.db import transaction
 from tom_targets.models import TargetName, TargetExtra
-from tom_dataproducts.models import ReducedDatum, DataProduct
+from tom_targets.sharing import continuous_share_data
+from tom_dataproducts.data_processor import DUPLICATE_CHECK_BATCH_SIZE
+from tom_dataproducts.models import ReducedDatum, DataProduct, reduced_datum_value_hash
 from tom_observations.models import ObservationRecord
 
 
@@ -19,6 +21,9 @@ def target_merge(primary_target, secondary_target):
     but secondary_target does have, will get merged into primary_target. After attributes merged,
     secondary_target is deleted.
 
+    The merge is done in a single transaction, moving the related objects of the secondary_target with one query per
+    model rather than saving them one at a time.
+
     :param primary_target: Target object which holds all the primary_target attributes
     :type target: tom_targets.models.Target
 
@@ -28,63 +33,97 @@ def target_merge(primary_target, secondary_target):
     returns: primary_target
     """
 
-    model_fields = primary_target._meta.fields
-    # loops through target attributes. If attribute missing from primary target
-    # and secondary target has the attribute, the attribute gets merged into Primary target
-    for field in model_fields:
-        if getattr(primary_target, field.name, None) is None\
-                and getattr(secondary_target, field.name, None) is not None:
-            setattr(primary_target, field.name, getattr(secondary_target, field.name, None))
+    with transaction.atomic():
+        model_fields = primary_target._meta.fields
+        # loops through target attributes. If attribute missing from primary target
+        # and secondary target has the attribute, the attribute gets merged into Primary target
+        merged_fields = False
+        for field in model_fields:
+            if getattr(primary_target, field.name, None) is None\
+                    and getattr(secondary_target, field.name, None) is not None:
+                setattr(primary_target, field.name, getattr(secondary_target, field.name, None))
+                merged_fields = True
+        if merged_fields:
             primary_target.save()
 
-    new_name = TargetName(target=primary_target, name=secondary_target.name)
-    new_name.save()
+        # Secondary target name and aliases all become aliases in the Primary target.
+        new_name = TargetName(target=primary_target, name=secondary_target.name)
+        new_name.save()
+        TargetName.objects.filter(target=secondary_target).update(target=primary_target)
 
-    merge_aliases = secondary_target.aliases.all()
-    # Secondary target name and aliases all become aliases in the Primary target.
+        # Add the primary_target to all TargetLists associated with the secondary_target
+        primary_target.targetlist_set.add(*secondary_target.targetlist_set.all())
 
-    for alias in merge_aliases:
-        alias_hold = alias.name
-        alias.delete()
-        new_name = TargetName(target=primary_target, name=alias_hold)
-        new_name.save()
+        # take secondary_target dataproducts and save them as primary_target dataproducts
+        DataProduct.objects.filter(target=secondary_target).update(target=primary_target)
 
-    # Call all TargetLists associated with the secondary_target
-    st_lists = secondary_target.targetlist_set.all()
-    for targetlist in st_lists:
-        targetlist.targets.add(primary_target)
-
-    # take secondary_target dataproducts and save them as primary_target dataproducts
-    st_dataproducts = DataProduct.objects.filter(target=secondary_target)
-    for dataproduct in st_dataproducts:
-        dataproduct.target = primary_target
-        dataproduct.save()
-
-    # take secondary_target reduceddatums and save them as primary_target reduceddatums
-    st_reduceddatums = ReducedDatum.objects.filter(target=secondary_target)
-    for reduceddatum in st_reduceddatums:
-        reduceddatum.target = primary_target
-        try:
-            reduceddatum.validate_unique()
-        except ValidationError:
-            reduceddatum.delete()  # delete what would become a duplicate reduceddatum
-        else:
-            reduceddatum.save()
+        # take secondary_target reduceddatums and save them as primary_target reduceddatums, deleting those that would
+        # become duplicates of a reduceddatum the primary_target already has
+        duplicate_pks, moved_pks = _find_duplicate_reduced_datums(primary_target, secondary_target)
+        for pk_start in range(0, len(duplicate_pks), DUPLICATE_CHECK_BATCH_SIZE):
+            ReducedDatum.objects.filter(pk__in=duplicate_pks[pk_start:pk_start + DUPLICATE_CHECK_BATCH_SIZE]).delete()
+        ReducedDatum.objects.filter(target=secondary_target).update(target=primary_target)
 
-    # take secondary target extras without repeated keys and save them as primary target extras
-    pt_targetextra_keys = list(TargetExtra.objects.filter(target=primary_target).values_list("key", flat=True))
-    st_targetextras = TargetExtra.objects.filter(target=secondary_target)
-    for targetextra in st_targetextras:
-        if targetextra.key not in pt_targetextra_keys:
-            targetextra.target = primary_target
-            targetextra.save()
+        # take secondary target extras without repeated keys and save them as primary target extras
+        pt_targetextra_keys = list(TargetExtra.objects.filter(target=primary_target).values_list("key", flat=True))
+        TargetExtra.objects.filter(target=secondary_target).exclude(key__in=pt_targetextra_keys)\
+            .update(target=primary_target)
 
-    # take secondary_target observationrecords and save them as primary_target observationrecords
-    st_observationrecords = ObservationRecord.objects.filter(target=secondary_target)
-    for observationrecord in st_observationrecords:
-        observationrecord.target = primary_target
-        observationrecord.save()
+        # take secondary_target observationrecords and save them as primary_target observationrecords
+        ObservationRecord.objects.filter(target=secondary_target).update(target=primary_target)
 
-    secondary_target.delete()
+        secondary_target.delete()
+
+        if moved_pks:
+            # Share the moved reduceddatums with the primary_target's persistent shares, as their post_save signal would
+            continuous_share_data(primary_target, [ReducedDatum(pk=pk) for pk in moved_pks])
 
     return primary_target
+
+
+def _missing_value_hashes(target):
+    """
+    Returns the hashes of the values of the reduceddatums of a target that were saved without one, such as those bulk
+    created outside of ``bulk_create_reduced_data``, by primary key.
+    """
+    return {pk: reduced_datum_value_hash(value) for pk, value in
+            ReducedDatum.objects.filter(target=target, value_hash='').values_list('pk', 'value')}
+
+
+def _find_duplicate_reduced_datums(primary_target, secondary_target):
+    """
+    Finds the reduceddatums of the secondary_target that would become duplicates once moved to the primary_target,
+    matching them on their data type, timestamp and value hash. The hashes of reduceddatums that were saved without one
+    are calculated from their values. Reduceddatums that are duplicated within the secondary_target are also found, so
+    that only one of them is kept.
+
+    :returns: The primary keys of the duplicate reduceddatums, and those of the reduceddatums that are not duplicates
+    :rtype: tuple
+    """
+    st_reduceddatums = list(ReducedDatum.objects.filter(target=secondary_target).order_by('pk')
+                            .values_list('pk', 'data_type', 'timestamp', 'value_hash'))
+    if any(not value_hash for *_, value_hash in st_reduceddatums):
+        missing_hashes = _missing_value_hashes(secondary_target)
+        st_reduceddatums = [(pk, data_type, timestamp, value_hash or missing_hashes[pk])
+                            for pk, data_type, timestamp, value_hash in st_reduceddatums]
+    value_hashes = list({value_hash for _, _, _, value_hash in st_reduceddatums})
+    existing = set()
+    for hash_start in range(0, len(value_hashes), DUPLICATE_CHECK_BATCH_SIZE):
+        existing.update(ReducedDatum.objects.filter(
+            target=primary_target,
+            value_hash__in=value_hashes[hash_start:hash_start + DUPLICATE_CHECK_BATCH_SIZE]
+        ).values_list('data_type', 'timestamp', 'value_hash'))
+    missing_hashes = _missing_value_hashes(primary_target)
+    if missing_hashes:
+        existing.update((data_type, timestamp, missing_hashes[pk]) for pk, data_type, timestamp in
+                        ReducedDatum.objects.filter(pk__in=missing_hashes).values_list('pk', 'data_type', 'timestamp'))
+
+    duplicate_pks, moved_pks = [], []
+    for pk, data_type, timestamp, value_hash in st_reduceddatums:
+        key = (data_type, timestamp, value_hash)
+        if key in existing:
+            duplicate_pks.append(pk)
+        else:
+            existing.add(key)
+            moved_pks.append(pk)
+    return duplicate_pks, moved_pks
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:42
+
+from django.db import migrations, models
+
+
+def simplify_name(name):
+    # A copy of TargetMatchManager.simplify_name as it was when this migration was written, so that later changes to
+    # the model code do not change what this migration does. TOMs with a customized match manager should run
+    # ./manage.py backfillsimplenames after migrating.
+    return name.lower().replace(" ", "").replace("-", "").replace("_", "").replace("(", "").replace(")", "")
+
+
+def populate_simple_names(apps, schema_editor):
+    # The batching is necessary to avoid memory issues with huge datasets
+    batch_size = 10000
+    for model_name in ['BaseTarget', 'TargetName']:
+        model = apps.get_model('tom_targets', model_name)
+        batch = []
+        for obj in model.objects.only('pk', 'name').iterator(chunk_size=batch_size):
+            obj.simple_name = simplify_name(obj.name)
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                model.objects.bulk_update(batch, ['simple_name'])
+                batch = []
+        model.objects.bulk_update(batch, ['simple_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0030_alter_basetarget_slope'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basetarget',
+            name='simple_name',
+            field=models.CharField(db_index=True, default='', editable=False, help_text='The name of this target as processed by simplify_name, used for fuzzy matching.', max_length=100, verbose_name='Simplified Name'),
+        ),
+        migrations.AddField(
+            model_name='targetname',
+            name='simple_name',
+            field=models.CharField(db_index=True, default='', editable=False, help_text='The alias as processed by simplify_name, used for fuzzy matching.', max_length=100, verbose_name='Simplified Alias'),
+        ),
+        # The lambda is a noop so this migration remains reversible.
+        migrations.RunPython(populate_simple_names, lambda *args, **kwargs: None),
+    ]
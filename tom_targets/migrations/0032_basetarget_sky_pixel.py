@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:44
+
+from math import floor
+
+from django.db import migrations, models
+
+
+def sky_pixel(ra, dec):
+    # A copy of tom_targets.sky_pixels.sky_pixel with the 0.1 degree pixel grid as it was when this migration was
+    # written, so that later changes to the pixel grid do not change what this migration does.
+    sky_pixel_size = 0.1
+    n_dec_zones = 1800
+    n_ra_cells = 3600
+    ra = float(ra)
+    dec = float(dec)
+    zone = min(max(floor((dec + 90) / sky_pixel_size), 0), n_dec_zones - 1)
+    cell = min(floor((ra % 360) / sky_pixel_size), n_ra_cells - 1)
+    return zone * n_ra_cells + cell
+
+
+def populate_sky_pixels(apps, schema_editor):
+    BaseTarget = apps.get_model('tom_targets', 'BaseTarget')
+    # The batching is necessary to avoid memory issues with huge datasets
+    batch_size = 10000
+    batch = []
+    targets = BaseTarget.objects.filter(ra__isnull=False, dec__isnull=False).only('pk', 'ra', 'dec')
+    for target in targets.iterator(chunk_size=batch_size):
+        target.sky_pixel = sky_pixel(target.ra, target.dec)
+        batch.append(target)
+        if len(batch) >= batch_size:
+            BaseTarget.objects.bulk_update(batch, ['sky_pixel'])
+            batch = []
+    BaseTarget.objects.bulk_update(batch, ['sky_pixel'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0031_basetarget_simple_name_targetname_simple_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basetarget',
+            name='sky_pixel',
+            field=models.IntegerField(db_index=True, editable=False, help_text="The sky pixel containing this target's position, used to index cone searches.", null=True, verbose_name='Sky Pixel'),
+        ),
+        # The lambda is a noop so this migration remains reversible.
+        migrations.RunPython(populate_sky_pixels, lambda *args, **kwargs: None),
+    ]
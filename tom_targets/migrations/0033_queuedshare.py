@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_dataproducts', '0015_reduceddatum_value_hash'),
+        ('tom_targets', '0032_basetarget_sky_pixel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedShare',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destination', models.CharField(help_text='The sharing destination, as it appears in your DATA_SHARING settings dict', max_length=200)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENDING', 'Sending'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='The number of times sharing has been attempted.')),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, help_text='The time after which to next share.')),
+                ('last_error', models.TextField(blank=True, default='', help_text='The error from the last failed attempt.')),
+                ('claim', models.CharField(blank=True, default='', max_length=32)),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='The time which this datum was queued in the TOM database.')),
+                ('modified', models.DateTimeField(default=django.utils.timezone.now, help_text='The time which the status last changed.')),
+                ('reduced_datum', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tom_dataproducts.reduceddatum')),
+            ],
+            options={
+                'ordering': ('created',),
+                'indexes': [models.Index(fields=['status', 'next_attempt'], name='queuedshare_status_idx')],
+            },
+        ),
+    ]
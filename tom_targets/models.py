@@ -6,6 +6,7 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 from django.utils.module_loading import import_string
 
 from tom_targets.base_models import BaseTarget
@@ -38,6 +39,9 @@ class TargetName(models.Model):
     :param name: The name that this ``TargetName`` object represents.
     :type name: str
 
+    :param simple_name: The simplified version of ``name`` used for fuzzy matching. Set automatically on save.
+    :type simple_name: str
+
     :param created: The time at which this target name was created in the TOM database.
     :type created: datetime
 
@@ -46,6 +50,10 @@ class TargetName(models.Model):
     """
     target = models.ForeignKey(BaseTarget, on_delete=models.CASCADE, related_name='aliases')
     name = models.CharField(max_length=100, unique=True, verbose_name='Alias')
+    simple_name = models.CharField(
+        max_length=100, default='', editable=False, db_index=True, verbose_name='Simplified Alias',
+        help_text='The alias as processed by simplify_name, used for fuzzy matching.'
+    )
     created = models.DateTimeField(
         auto_now_add=True, help_text='The time at which this target name was created.'
     )
@@ -57,6 +65,17 @@ class TargetName(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """
+        Saves TargetName model data to the database, storing the simplified version of the alias used by
+        ``TargetMatchManager.match_fuzzy_name``.
+        """
+        self.simple_name = Target.matches.simplify_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'simple_name'}
+        super().save(*args, **kwargs)
+
     def validate_unique(self, *args, **kwargs):
         """
         Ensures that Target.name and all aliases of the target are unique.
@@ -121,6 +140,14 @@ class TargetExtra(models.Model):
         Saves TargetExtra model data to the database. In the process, converts the string value of the ``TargetExtra``
         to the appropriate type, and stores it in the corresponding field as well.
         """
+        self.set_typed_values()
+        super().save(*args, **kwargs)
+
+    def set_typed_values(self):
+        """
+        Converts the string value of the ``TargetExtra`` to the appropriate types and stores them in the corresponding
+        fields. Called by ``save``, and should be called before creating ``TargetExtra`` objects with ``bulk_create``.
+        """
         if self.value is None:
             self.value = 'None'
         try:
@@ -141,7 +168,6 @@ class TargetExtra(models.Model):
                 self.time_value = None
         else:
             self.time_value = None
-        super().save(*args, **kwargs)
 
     def typed_value(self, type_val):
         """
@@ -231,3 +257,66 @@ class PersistentShare(models.Model):
 
     def __str__(self):
         return f'{self.target}-{self.destination}'
+
+
+class QueuedShare(models.Model):
+    """
+    Class representing a ``ReducedDatum`` waiting in the outbox to be shared with the destination of a
+    ``PersistentShare``. Continuous sharing queues new data here instead of sharing it straight away, and the queued
+    data are delivered in the background, in batches per destination and target. Queued data are removed from the
+    outbox once they have been shared.
+
+    :param reduced_datum: The ``ReducedDatum`` to share
+    :type reduced_datum: ReducedDatum
+
+    :param destination: The sharing destination, as it appears in your TOM's DATA_SHARING settings dict
+    :type destination: str
+
+    :param status: ``PENDING`` until the datum is shared, or ``FAILED`` once every attempt has failed. ``SENDING``
+                   while it is being shared.
+    :type status: str
+
+    :param attempts: The number of times sharing this datum has been attempted
+    :type attempts: int
+
+    :param next_attempt: The time after which the datum will next be shared
+    :type next_attempt: datetime
+
+    :param last_error: The error from the last failed attempt
+    :type last_error: str
+
+    :param claim: Identifies the run that is sharing this datum while it is ``SENDING``
+    :type claim: str
+
+    :param created: The time at which this datum was queued
+    :type created: datetime
+
+    :param modified: The time at which the status of this datum last changed
+    :type modified: datetime
+    """
+    PENDING = 'PENDING'
+    SENDING = 'SENDING'
+    FAILED = 'FAILED'
+    STATUSES = ((PENDING, 'Pending'), (SENDING, 'Sending'), (FAILED, 'Failed'))
+
+    reduced_datum = models.ForeignKey('tom_dataproducts.ReducedDatum', on_delete=models.CASCADE)
+    destination = models.CharField(
+        max_length=200, help_text='The sharing destination, as it appears in your DATA_SHARING settings dict')
+    status = models.CharField(max_length=20, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0, help_text='The number of times sharing has been attempted.')
+    next_attempt = models.DateTimeField(default=timezone.now, help_text='The time after which to next share.')
+    last_error = models.TextField(blank=True, default='', help_text='The error from the last failed attempt.')
+    claim = models.CharField(max_length=32, blank=True, default='')
+    created = models.DateTimeField(
+        auto_now_add=True, help_text='The time which this datum was queued in the TOM database.'
+    )
+    modified = models.DateTimeField(default=timezone.now, help_text='The time which the status last changed.')
+
+    class Meta:
+        ordering = ('created',)
+        indexes = [
+            models.Index(fields=['status', 'next_attempt'], name='queuedshare_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.reduced_datum_id}-{self.destination}'
@@ -1,14 +1,194 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from guardian.models import GroupObjectPermission, UserObjectPermission
 from guardian.shortcuts import get_objects_for_user
 
 from tom_targets.models import Target
 
 
+TARGET_PERMISSIONS_VERSION_KEY = 'target_permissions_version'
+
+# Users with object permissions for more targets than this are filtered with a subquery instead of a cached list of ids,
+# so that the list never makes for an unreasonably long query
+MAX_CACHED_TARGET_IDS = 10000
+
+# Number of object primary keys whose permissions are deleted per query
+PERMISSION_DELETE_BATCH_SIZE = 1000
+
+# The primary keys of deleted objects whose permissions are still to be removed, by database alias and then model
+_pending_permission_cleanup = threading.local()
+
+# Whether this thread has read target ids under the current cache version since it last changed the version
+_target_permissions_state = threading.local()
+
+
+def _bump_target_permissions_version():
+    cache.set(TARGET_PERMISSIONS_VERSION_KEY, uuid.uuid4().hex, None)
+    _target_permissions_state.version_read = False
+
+
+def invalidate_target_permissions_cache(using=None):
+    """
+    Invalidates the cached ids of the targets that each user has object permissions for. This is called whenever target
+    object permissions, global permissions or group memberships change, and should also be called by code that assigns
+    object permissions in bulk, as django-guardian does not send signals for those.
+
+    Outside of a transaction the cache is invalidated straight away. Within a transaction it is invalidated once it is
+    committed, so that ids read by another request before the commit are not kept, and straight away if this thread has
+    read ids since the last invalidation, so that they are read again for the rest of the transaction. Changing many
+    permissions in one transaction therefore writes the cache version at most twice, rather than once per permission.
+
+    :param using: The alias of the database in which the permissions changed.
+    :type using: str
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        _bump_target_permissions_version()
+        return
+
+    if getattr(_target_permissions_state, 'version_read', True):
+        _bump_target_permissions_version()
+    # Callbacks registered in a transaction or savepoint that was rolled back are discarded, so this only finds the
+    # callback while it is still due to run
+    if not any(callback[1] is _bump_target_permissions_version for callback in connection.run_on_commit):
+        transaction.on_commit(_bump_target_permissions_version, using=using)
+
+
+def delete_object_permissions(model, object_pks):
+    """
+    Deletes the user and group object permissions for the given objects of a model, with one filtered delete per batch
+    of objects. Unlike django-guardian's ``clean_orphan_obj_perms``, this does not scan the permissions of every other
+    object.
+
+    :param model: The model of the objects.
+    :type model: Model
+
+    :param object_pks: The primary keys of the objects.
+    :type object_pks: iterable
+
+    :returns: The number of permissions deleted
+    :rtype: int
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    object_pks = sorted(str(pk) for pk in object_pks)
+    deleted = 0
+    # One transaction, so that the target permissions cache is invalidated once rather than for every permission
+    with transaction.atomic():
+        for pk_start in range(0, len(object_pks), PERMISSION_DELETE_BATCH_SIZE):
+            batch = object_pks[pk_start:pk_start + PERMISSION_DELETE_BATCH_SIZE]
+            for permission_model in [UserObjectPermission, GroupObjectPermission]:
+                deleted += permission_model.objects.filter(content_type=content_type, object_pk__in=batch).delete()[0]
+    return deleted
+
+
+def delete_object_permissions_on_commit(instance, using='default'):
+    """
+    Deletes the object permissions for a deleted object once the deletion is committed. Objects that are deleted
+    together, such as by deleting a queryset, have their permissions deleted together in ``delete_object_permissions``.
+    Permissions are kept for objects that still exist by then, such as those whose deletion was rolled back.
+
+    :param instance: The deleted object.
+    :type instance: Model
+
+    :param using: The alias of the database the object was deleted from.
+    :type using: str
+    """
+    if not hasattr(_pending_permission_cleanup, 'pks'):
+        _pending_permission_cleanup.pks = {}
+    pending = _pending_permission_cleanup.pks.setdefault(using, {})
+    pending.setdefault(type(instance), set()).add(instance.pk)
+
+    def clean_up():
+        # The first callback of a transaction deletes the permissions for all the objects deleted in it
+        for model, object_pks in _pending_permission_cleanup.pks.pop(using, {}).items():
+            remaining_pks = set(model._default_manager.using(using).filter(pk__in=object_pks)
+                                .values_list('pk', flat=True))
+            delete_object_permissions(model, object_pks - remaining_pks)
+
+    transaction.on_commit(clean_up, using=using)
+
+
+def permitted_target_ids(user, action):
+    """
+    Returns the ids of the targets that the user has object permissions for, either directly or through their groups.
+    The ids are cached for ``TARGET_PERMISSIONS_CACHE_TIMEOUT`` seconds or until permissions change, and on the user
+    object for the rest of the request.
+
+    :param user: The user for whom to retrieve target ids.
+    :type user: User
+
+    :param action: The action to check permissions for.
+    :type action: str
+
+    :returns: The ids of the targets, or None if the user has permissions for more than ``MAX_CACHED_TARGET_IDS``
+        targets or caching is disabled
+    :rtype: frozenset
+    """
+    timeout = getattr(settings, 'TARGET_PERMISSIONS_CACHE_TIMEOUT', 300)
+    if not timeout:
+        return None
+
+    version = cache.get(TARGET_PERMISSIONS_VERSION_KEY)
+    if version is None:
+        cache.add(TARGET_PERMISSIONS_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(TARGET_PERMISSIONS_VERSION_KEY)
+    _target_permissions_state.version_read = True
+
+    request_cache = getattr(user, '_permitted_target_ids', {})
+    if request_cache.get('version') != version:
+        request_cache = user._permitted_target_ids = {'version': version}
+
+    if action not in request_cache:
+        key = f'permitted_target_ids_{version}_{user.pk}_{action}'
+        ids = cache.get(key)
+        if ids is None:
+            ids = list(get_objects_for_user(user, f'{Target._meta.app_label}.{action}', Target.objects.all())
+                       .values_list('pk', flat=True)[:MAX_CACHED_TARGET_IDS + 1])
+            # Too many ids are stored as False, so that they are not counted again for every request
+            ids = ids if len(ids) <= MAX_CACHED_TARGET_IDS else False
+            cache.set(key, ids, timeout)
+        request_cache[action] = frozenset(ids) if ids is not False else None
+    return request_cache[action]
+
+
+def targets_with_permission(user, qs, action):
+    """
+    Filters a queryset of targets to those that the user has object permissions for, like django-guardian's
+    get_objects_for_user, but using the cached ids from ``permitted_target_ids`` where possible.
+
+    :param user: The user for whom to retrieve targets.
+    :type user: User
+
+    :param qs: The queryset of targets to filter.
+    :type qs: QuerySet
+
+    :param action: The action to check permissions for.
+    :type action: str
+
+    :returns: The filtered queryset of targets.
+    """
+    ids = None
+    if user.is_authenticated and action in ['view_target', 'change_target', 'delete_target']:
+        if user.is_superuser:
+            return qs
+        ids = permitted_target_ids(user, action)
+    if ids is None:
+        return get_objects_for_user(user, f'{Target._meta.app_label}.{action}', qs)
+    return qs.filter(pk__in=ids)
+
+
 def targets_for_user(user, qs, action):
     """
     This is a wrapper function for django-guardian's get_objects_for_user function
     that attempts to mitigate performance issues with TOMs that have large targets
     that are not private. It works by splitting the queryset into private and public
-    targets and then checking permissions only for the private targets.
+    targets and then checking permissions only for the private targets, using the
+    cached ids of the targets the user has permissions for.
 
     :param user: The user for whom to retrieve targets.
     :type user: User
@@ -31,7 +211,7 @@ def targets_for_user(user, qs, action):
             # Exclude targets that are private except for those that the user has explicit permissions to view
             private_targets = qs.filter(permissions=Target.Permissions.PRIVATE)
             public_targets = qs.exclude(permissions=Target.Permissions.PRIVATE)
-            return public_targets | get_objects_for_user(user, f'{Target._meta.app_label}.{action}', private_targets)
+            return public_targets | targets_with_permission(user, private_targets, action)
     else:
         # Only allow open targets
         return qs.filter(permissions=Target.Permissions.OPEN)
@@ -182,3 +182,36 @@ class TargetSerializer(serializers.ModelSerializer):
         instance.save()
 
         return instance
+
+
+class TargetCatalogMatchSerializer(serializers.Serializer):
+    """
+    Serializer for a catalog of candidates to be matched against existing targets in a single request. See
+    ``TargetMatchManager.match_catalog`` for how candidates are matched.
+    """
+    names = serializers.ListField(
+        child=serializers.CharField(allow_null=True, allow_blank=True), required=False,
+        help_text='The names of the candidates.'
+    )
+    ra = serializers.ListField(
+        child=serializers.FloatField(allow_null=True), required=False,
+        help_text='The right ascensions of the candidates, in degrees.'
+    )
+    dec = serializers.ListField(
+        child=serializers.FloatField(allow_null=True, min_value=-90, max_value=90), required=False,
+        help_text='The declinations of the candidates, in degrees.'
+    )
+    radius = serializers.FloatField(
+        required=False, min_value=0, help_text='The radius within which to match positions, in arcseconds.'
+    )
+
+    def validate(self, data):
+        coordinates = [data.get(field) for field in ['ra', 'dec', 'radius']]
+        if any(value is not None for value in coordinates) and any(value is None for value in coordinates):
+            raise serializers.ValidationError('ra, dec and radius must be given together.')
+        if 'names' not in data and 'ra' not in data:
+            raise serializers.ValidationError('Either names or ra, dec and radius must be given.')
+        lengths = {len(data[field]) for field in ['names', 'ra', 'dec'] if field in data}
+        if len(lengths) > 1:
+            raise serializers.ValidationError('names, ra and dec must have the same length.')
+        return data
@@ -1,15 +1,30 @@
+from datetime import timedelta
+import logging
+import uuid
+
 import requests
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F, Q, QuerySet
+from django.utils import timezone
+from django_tasks.backends.immediate import ImmediateBackend
 
 from tom_targets.serializers import TargetSerializer
-from tom_targets.models import PersistentShare
+from tom_targets.models import PersistentShare, QueuedShare, Target
 from tom_dataproducts.sharing import (check_for_share_safe_datums, share_data_with_tom,
                                       get_destination_target, sharing_feedback_converter)
 from tom_dataproducts.models import ReducedDatum
 from tom_dataproducts.alertstreams.hermes import publish_to_hermes, BuildHermesMessage
 
+logger = logging.getLogger(__name__)
+
+# Defaults for the settings of the outbox of data queued by continuous sharing
+SHARING_OUTBOX_BATCH_SIZE = 500
+SHARING_OUTBOX_MAX_ATTEMPTS = 5
+SHARING_OUTBOX_RETRY_DELAY = 60
+SHARING_OUTBOX_CLAIM_TIMEOUT = 1800
+
 
 def share_target_and_all_data(share_destination, target):
     """
@@ -44,31 +59,139 @@ def share_target_and_all_data(share_destination, target):
 def continuous_share_data(target, reduced_datums):
     """
     Triggered when new ReducedDatums are created.
-    Shares those ReducedDatums to the sharing destination of any PersistentShares on the target.
+    Queues those ReducedDatums to be shared to the sharing destination of any PersistentShares on the target, and
+    enqueues the ``send_queued_shares`` task to share them once the current transaction is committed, so that the
+    caller never waits for the sharing destinations. The task only shares the data queued here; data queued earlier
+    that are still due are left to the ``sendqueuedshares`` management command. The ``ImmediateBackend`` would run the
+    task in the caller's request, so with that backend the queued data are only shared by the management command.
     :param target: Target instance that these reduced_datums belong to
-    :param reduced_datums: list of ReducedDatum instances to share
+    :param reduced_datums: list or queryset of ReducedDatum instances to share
     """
-    persistentshares = PersistentShare.objects.filter(target=target)
-    for persistentshare in persistentshares:
-        share_destination = persistentshare.destination
+    destinations = list(PersistentShare.objects.filter(target=target).values_list('destination', flat=True))
+    if not destinations:
+        return
+    if isinstance(reduced_datums, QuerySet):
+        reduced_datum_pks = list(reduced_datums.values_list('pk', flat=True))
+    else:
         reduced_datum_pks = [rd.pk for rd in reduced_datums]
-        if 'HERMES' in share_destination.upper():
-            hermes_topic = share_destination.split(':')[1]
-            destination = share_destination.split(':')[0]
-            filtered_reduced_datums = check_for_share_safe_datums(
-                destination, ReducedDatum.objects.filter(pk__in=reduced_datum_pks), topic=hermes_topic)
-            sharing = getattr(settings, "DATA_SHARING", {})
-            tom_name = f"{getattr(settings, 'TOM_NAME', 'TOM Toolkit')}"
-            message = BuildHermesMessage(title=f"Updated data for {target.name} from "
-                                         f"{tom_name}.",
-                                         authors=sharing.get('hermes', {}).get('DEFAULT_AUTHORS', None),
-                                         submitter=tom_name,
-                                         message='',
-                                         topic=hermes_topic
-                                         )
-            publish_to_hermes(message, filtered_reduced_datums)
-        else:
-            share_data_with_tom(share_destination, None, None, None, selected_data=reduced_datum_pks)
+    if not reduced_datum_pks:
+        return
+
+    queued_shares = QueuedShare.objects.bulk_create(
+        [QueuedShare(reduced_datum_id=pk, destination=destination)
+         for destination in destinations for pk in reduced_datum_pks],
+        batch_size=getattr(settings, 'SHARING_OUTBOX_BATCH_SIZE', SHARING_OUTBOX_BATCH_SIZE)
+    )
+    # Imported here, as the tasks import this module
+    from tom_targets.tasks import send_queued_shares
+    if isinstance(send_queued_shares.get_backend(), ImmediateBackend):
+        return
+    send_queued_shares.enqueue([queued_share.pk for queued_share in queued_shares])
+
+
+def share_reduced_datums(share_destination, target, reduced_datums):
+    """
+    Shares ReducedDatums of a target with a sharing destination, as continuous sharing does.
+    :param share_destination: String sharing destination from the DATA_SHARING setting
+    :param target: Target instance that these reduced_datums belong to
+    :param reduced_datums: queryset of ReducedDatum instances to share
+    :return: The feedback message from the sharing destination
+    """
+    if 'HERMES' in share_destination.upper():
+        hermes_topic = share_destination.split(':')[1]
+        destination = share_destination.split(':')[0]
+        filtered_reduced_datums = check_for_share_safe_datums(destination, reduced_datums, topic=hermes_topic)
+        sharing = getattr(settings, "DATA_SHARING", {})
+        tom_name = f"{getattr(settings, 'TOM_NAME', 'TOM Toolkit')}"
+        message = BuildHermesMessage(title=f"Updated data for {target.name} from "
+                                     f"{tom_name}.",
+                                     authors=sharing.get('hermes', {}).get('DEFAULT_AUTHORS', None),
+                                     submitter=tom_name,
+                                     message='',
+                                     topic=hermes_topic
+                                     )
+        response = publish_to_hermes(message, filtered_reduced_datums)
+    else:
+        response = share_data_with_tom(share_destination, None, None, None,
+                                       selected_data=list(reduced_datums.values_list('pk', flat=True)))
+    return sharing_feedback_converter(response)
+
+
+def share_queued_data(batch_size=None, queued_share_pks=None):
+    """
+    Shares the ReducedDatums queued by continuous sharing whose next attempt is due, in batches of ``batch_size`` per
+    sharing destination and target, and removes them from the outbox once they have been shared. Queued data that fail
+    to be shared are retried after ``SHARING_OUTBOX_RETRY_DELAY`` seconds, doubling the delay after each attempt, until
+    they have been attempted ``SHARING_OUTBOX_MAX_ATTEMPTS`` times.
+
+    Each batch is claimed before it is shared, so that concurrent runs do not share the same data twice. Data claimed
+    by a run that has not finished sharing them within ``SHARING_OUTBOX_CLAIM_TIMEOUT`` are assumed to be abandoned and
+    are claimed again.
+
+    :param batch_size: Optional. Number of queued data to share at a time. Defaults to the ``SHARING_OUTBOX_BATCH_SIZE``
+    setting.
+    :type batch_size: int, optional
+
+    :param queued_share_pks: Optional. Only share the ``QueuedShare`` objects with these primary keys, rather than every
+    queued datum that is due.
+    :type queued_share_pks: list, optional
+
+    :returns: The number of queued data that were shared, that will be retried and that failed for good
+    :rtype: dict
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'SHARING_OUTBOX_BATCH_SIZE', SHARING_OUTBOX_BATCH_SIZE)
+    max_attempts = getattr(settings, 'SHARING_OUTBOX_MAX_ATTEMPTS', SHARING_OUTBOX_MAX_ATTEMPTS)
+    retry_delay = getattr(settings, 'SHARING_OUTBOX_RETRY_DELAY', SHARING_OUTBOX_RETRY_DELAY)
+    claim_timeout = getattr(settings, 'SHARING_OUTBOX_CLAIM_TIMEOUT', SHARING_OUTBOX_CLAIM_TIMEOUT)
+
+    start = timezone.now()
+    due = (Q(status=QueuedShare.PENDING, next_attempt__lte=start)
+           | Q(status=QueuedShare.SENDING, modified__lt=start - timedelta(seconds=claim_timeout)))
+    if queued_share_pks is not None:
+        due &= Q(pk__in=queued_share_pks)
+    results = {'sent': 0, 'retrying': 0, 'failed': 0}
+    while True:
+        # Claim the queued data of the destination and target that have been waiting longest
+        oldest = QueuedShare.objects.filter(due).order_by('next_attempt', 'pk')\
+            .values('destination', 'reduced_datum__target').first()
+        if oldest is None:
+            break
+        batch_pks = list(QueuedShare.objects.filter(due, destination=oldest['destination'],
+                                                    reduced_datum__target=oldest['reduced_datum__target'])
+                         .order_by('pk').values_list('pk', flat=True)[:batch_size])
+        claim = uuid.uuid4().hex
+        QueuedShare.objects.filter(due, pk__in=batch_pks).update(
+            status=QueuedShare.SENDING, claim=claim, modified=timezone.now()
+        )
+        claimed = QueuedShare.objects.filter(claim=claim, status=QueuedShare.SENDING)
+        if not claimed.exists():
+            # Another run claimed this batch first
+            continue
+        target = Target.objects.get(pk=oldest['reduced_datum__target'])
+
+        try:
+            feedback = share_reduced_datums(oldest['destination'], target,
+                                            ReducedDatum.objects.filter(queuedshare__in=claimed).distinct())
+            error = feedback if 'ERROR' in feedback.upper() else ''
+        except Exception as e:
+            error = repr(e)
+
+        now = timezone.now()
+        if not error:
+            results['sent'] += claimed.delete()[0]
+            continue
+        logger.warning(f'Failed to share data for {target.name} with {oldest["destination"]}: {error}')
+        results['failed'] += claimed.filter(attempts__gte=max_attempts - 1).update(
+            status=QueuedShare.FAILED, attempts=F('attempts') + 1, last_error=error, modified=now
+        )
+        # The delay before the next attempt doubles with each failed attempt
+        for attempts in claimed.values_list('attempts', flat=True).distinct():
+            results['retrying'] += claimed.filter(attempts=attempts).update(
+                status=QueuedShare.PENDING, attempts=attempts + 1, last_error=error, modified=now,
+                next_attempt=now + timedelta(seconds=retry_delay * 2 ** attempts)
+            )
+    return results
 
 
 def share_target_with_tom(share_destination, form_data, target_lists=()):
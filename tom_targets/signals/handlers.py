@@ -1,10 +1,13 @@
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
 from django.dispatch import receiver
-from django.db.models.signals import post_save, post_delete
-from guardian.utils import clean_orphan_obj_perms
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from guardian.models import GroupObjectPermission, UserObjectPermission
 
 from tom_dataproducts.models import ReducedDatum
 from tom_targets.sharing import continuous_share_data
 from tom_targets.models import Target
+from tom_targets.permissions import delete_object_permissions_on_commit, invalidate_target_permissions_cache
 
 
 @receiver(post_save, sender=ReducedDatum)
@@ -16,8 +19,33 @@ def cb_reduceddatum_post_save(sender, instance, *args, **kwargs):
 
 
 @receiver(post_delete, sender=Target)
-def cb_target_post_delete(sender, instance, *args, **kwargs):
-    # When a Target is deleted, clean up orphaned permissions.
-    # Note that this removes ALL orphaned permissions, not just those
-    # associated with this target.
-    clean_orphan_obj_perms()
+def cb_target_post_delete(sender, instance, using='default', *args, **kwargs):
+    # When a Target is deleted, delete the permissions for it. Other orphaned permissions are left to the
+    # clean_orphan_obj_perms management command.
+    delete_object_permissions_on_commit(instance, using=using)
+
+
+@receiver(post_save, sender=UserObjectPermission)
+@receiver(post_delete, sender=UserObjectPermission)
+@receiver(post_save, sender=GroupObjectPermission)
+@receiver(post_delete, sender=GroupObjectPermission)
+def cb_object_permissions_changed(sender, instance, using='default', *args, **kwargs):
+    # When target object permissions change, the cached ids of the targets each user can access are stale
+    if instance.content_type_id == ContentType.objects.get_for_model(Target).pk:
+        invalidate_target_permissions_cache(using=using)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def cb_permissions_m2m_changed(sender, action, using='default', *args, **kwargs):
+    # Group memberships and global permissions also decide which targets each user can access
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        invalidate_target_permissions_cache(using=using)
+
+
+@receiver(post_save, sender=User)
+def cb_user_post_save(sender, instance, created, *args, **kwargs):
+    # A new user may reuse the primary key of a deleted one, so do not let them inherit its cached target ids
+    if created:
+        invalidate_target_permissions_cache()
@@ -0,0 +1,243 @@
+"""
+Sky pixelization used to index ``Target`` positions for cone searches.
+
+The sky is divided into declination zones of height ``SKY_PIXEL_SIZE`` degrees, and each zone into right ascension
+cells of the same width. A pixel number increases with right ascension within a zone and zones follow one another in
+order of increasing declination, so the pixels overlapping a cone can be expressed as a handful of contiguous integer
+ranges that can be answered from a database index before the exact separation is computed.
+"""
+from math import asin, cos, degrees, floor, radians, sin
+
+import numpy as np
+from astropy.coordinates import angular_separation
+from django.db import models
+from django.db.models.functions import Least
+from django.db.models.functions.math import ACos, Cos, Pi, Radians, Sin
+
+SKY_PIXEL_SIZE = 0.1  # degrees
+N_DEC_ZONES = int(round(180 / SKY_PIXEL_SIZE))
+N_RA_CELLS = int(round(360 / SKY_PIXEL_SIZE))
+
+# Cones that would need more ranges than this are only constrained by declination zone.
+MAX_PIXEL_RANGES = 250
+
+
+def sky_pixel(ra, dec):
+    """
+    Returns the sky pixel containing the given position.
+
+    :param ra: Right ascension in degrees.
+    :type ra: float
+
+    :param dec: Declination in degrees.
+    :type dec: float
+
+    :returns: The pixel number, or None if either coordinate is missing.
+    :rtype: int
+    """
+    if ra is None or dec is None:
+        return None
+    ra = float(ra)
+    dec = float(dec)
+    zone = min(max(floor((dec + 90) / SKY_PIXEL_SIZE), 0), N_DEC_ZONES - 1)
+    cell = min(floor((ra % 360) / SKY_PIXEL_SIZE), N_RA_CELLS - 1)
+    return zone * N_RA_CELLS + cell
+
+
+def sky_pixels(ra, dec):
+    """
+    Vectorized version of ``sky_pixel`` for arrays of positions with no missing values.
+
+    :param ra: Right ascensions in degrees.
+    :type ra: array-like
+
+    :param dec: Declinations in degrees.
+    :type dec: array-like
+
+    :returns: Array of pixel numbers.
+    :rtype: numpy.ndarray
+    """
+    ra = np.asarray(ra, dtype=float)
+    dec = np.asarray(dec, dtype=float)
+    zone = np.clip(np.floor((dec + 90) / SKY_PIXEL_SIZE), 0, N_DEC_ZONES - 1).astype(np.int64)
+    cell = np.minimum(np.floor(np.mod(ra, 360) / SKY_PIXEL_SIZE), N_RA_CELLS - 1).astype(np.int64)
+    return zone * N_RA_CELLS + cell
+
+
+def sky_pixel_ranges(ra, dec, radius):
+    """
+    Returns inclusive ranges of sky pixels that together cover a cone. The covering is conservative: every position
+    within the cone lies in one of the ranges, but the ranges also contain positions outside of the cone.
+
+    Cones that contain a pole cover every right ascension, and cones that cross RA=0/360 are split into two ranges per
+    declination zone.
+
+    :param ra: Right ascension of the center of the cone in degrees.
+    :type ra: float
+
+    :param dec: Declination of the center of the cone in degrees.
+    :type dec: float
+
+    :param radius: Radius of the cone in degrees.
+    :type radius: float
+
+    :returns: Sorted list of (first_pixel, last_pixel) tuples.
+    :rtype: list
+    """
+    ra %= 360
+    # Pad the cone slightly so that floating point differences with the database never exclude an edge match
+    radius += 1e-9
+    dec_min = dec - radius
+    dec_max = dec + radius
+    first_zone = min(max(floor((dec_min + 90) / SKY_PIXEL_SIZE), 0), N_DEC_ZONES - 1)
+    last_zone = min(max(floor((dec_max + 90) / SKY_PIXEL_SIZE), 0), N_DEC_ZONES - 1)
+
+    # Largest offset in right ascension of any point in the cone, or None if every right ascension is covered
+    ra_half_width = None
+    if dec_min > -90 and dec_max < 90:
+        sin_half_width = sin(radians(radius)) / cos(radians(dec))
+        if sin_half_width < 1:
+            ra_half_width = degrees(asin(sin_half_width))
+    if ra_half_width is None or ra_half_width >= 180:
+        cell_ranges = [(0, N_RA_CELLS - 1)]
+    else:
+        first_cell = floor(((ra - ra_half_width) % 360) / SKY_PIXEL_SIZE)
+        last_cell = min(floor(((ra + ra_half_width) % 360) / SKY_PIXEL_SIZE), N_RA_CELLS - 1)
+        if ra - ra_half_width < 0 or ra + ra_half_width >= 360:
+            # The cone crosses RA=0/360
+            cell_ranges = [(0, last_cell), (first_cell, N_RA_CELLS - 1)]
+        else:
+            cell_ranges = [(first_cell, last_cell)]
+
+    if (last_zone - first_zone + 1) * len(cell_ranges) > MAX_PIXEL_RANGES:
+        cell_ranges = [(0, N_RA_CELLS - 1)]
+
+    ranges = []
+    for zone in range(first_zone, last_zone + 1):
+        for first_cell, last_cell in cell_ranges:
+            ranges.append((zone * N_RA_CELLS + first_cell, zone * N_RA_CELLS + last_cell))
+    # Contiguous ranges, such as full zones or the two halves of a zone split at RA=0, are merged
+    return merge_pixel_ranges(ranges)
+
+
+def merge_pixel_ranges(ranges):
+    """
+    Merges overlapping and contiguous pixel ranges, such as those covering several cones.
+
+    :param ranges: Iterable of inclusive (first_pixel, last_pixel) tuples.
+    :type ranges: iterable
+
+    :returns: Sorted list of disjoint (first_pixel, last_pixel) tuples.
+    :rtype: list
+    """
+    merged = []
+    for first_pixel, last_pixel in sorted(ranges):
+        if merged and merged[-1][1] + 1 >= first_pixel:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last_pixel))
+        else:
+            merged.append((first_pixel, last_pixel))
+    return merged
+
+
+def sky_pixel_filter(ranges):
+    """
+    Returns a ``Q`` object selecting targets whose ``sky_pixel`` is within any of the given ranges.
+
+    :param ranges: Iterable of inclusive (first_pixel, last_pixel) tuples.
+    :type ranges: iterable
+
+    :rtype: Q
+    """
+    pixel_filter = models.Q()
+    for first_pixel, last_pixel in ranges:
+        pixel_filter |= models.Q(sky_pixel__range=(first_pixel, last_pixel))
+    return pixel_filter
+
+
+def crossmatch(ra1, dec1, ra2, dec2, radius):
+    """
+    Finds all pairs of positions from two catalogs that are within ``radius`` of each other. The second catalog is
+    sorted by declination so that each position of the first catalog is only compared to the slice of the second
+    catalog within ``radius`` in declination, and the separations for each slice are calculated as one array operation.
+
+    :param ra1: Right ascensions of the first catalog in degrees.
+    :type ra1: array-like
+
+    :param dec1: Declinations of the first catalog in degrees.
+    :type dec1: array-like
+
+    :param ra2: Right ascensions of the second catalog in degrees.
+    :type ra2: array-like
+
+    :param dec2: Declinations of the second catalog in degrees.
+    :type dec2: array-like
+
+    :param radius: Maximum separation in degrees.
+    :type radius: float
+
+    :returns: Arrays of the indices into the first catalog, the indices into the second catalog, and the separations in
+        degrees of each matching pair.
+    :rtype: tuple
+    """
+    ra1 = np.radians(np.asarray(ra1, dtype=float))
+    dec1 = np.radians(np.asarray(dec1, dtype=float))
+    ra2 = np.radians(np.asarray(ra2, dtype=float))
+    dec2 = np.radians(np.asarray(dec2, dtype=float))
+    radius = radians(radius)
+
+    order = np.argsort(dec2, kind='stable')
+    sorted_dec2 = dec2[order]
+    lower = np.searchsorted(sorted_dec2, dec1 - radius, side='left')
+    upper = np.searchsorted(sorted_dec2, dec1 + radius, side='right')
+
+    indices1, indices2, separations = [], [], []
+    for index in np.nonzero(upper > lower)[0]:
+        candidates = order[lower[index]:upper[index]]
+        separation = angular_separation(ra1[index], dec1[index], ra2[candidates], dec2[candidates])
+        within = separation <= radius
+        indices1.append(np.full(np.count_nonzero(within), index))
+        indices2.append(candidates[within])
+        separations.append(separation[within])
+    if not indices1:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([], dtype=float)
+    return np.concatenate(indices1), np.concatenate(indices2), np.degrees(np.concatenate(separations))
+
+
+def cone_search(queryset, ra, dec, radius):
+    """
+    Filters a queryset of targets to those within a cone, annotated with their ``separation`` in degrees from the center
+    of the cone. Candidates are first selected using the indexed ``sky_pixel`` field, then the exact angular separation
+    is calculated in the database for the remaining targets.
+
+    :param queryset: Queryset of Target objects
+    :type queryset: QuerySet
+
+    :param ra: Right ascension of the center of the cone in degrees.
+    :type ra: float
+
+    :param dec: Declination of the center of the cone in degrees.
+    :type dec: float
+
+    :param radius: Radius of the cone in degrees.
+    :type radius: float
+
+    :returns: The filtered and annotated queryset
+    :rtype: QuerySet
+    """
+    ra %= 360
+    pixel_filter = sky_pixel_filter(sky_pixel_ranges(ra, dec, radius))
+
+    # Calculate the angular separation between the target and the given ra and dec.
+    # Includes a "Least" function to ensure that the value passed to the ACos function is never greater than 1
+    # due to floating point errors. We ignore the case of this being less than -1 since this will only happen when
+    # the target is on the opposite side of the sky from the search coordinates.
+    separation = models.ExpressionWrapper(
+        ACos(
+            Least(
+                (Sin(radians(dec)) * Sin(Radians('dec'))) +
+                (Cos(radians(dec)) * Cos(Radians('dec')) * Cos(radians(ra) - Radians('ra'))), 1.0
+            )
+        ) * 180 / Pi(), models.FloatField()
+    )
+
+    return queryset.filter(pixel_filter).annotate(separation=separation).filter(separation__lte=radius)
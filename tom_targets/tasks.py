@@ -0,0 +1,28 @@
+from django.db.models import Min
+from django_tasks import default_task_backend, task
+
+from tom_targets.models import QueuedShare
+from tom_targets.sharing import share_queued_data
+
+
+@task(enqueue_on_commit=True)
+def send_queued_shares(queued_share_pks):
+    """
+    Shares the data queued by one call to ``continuous_share_data`` in the background, once the transaction that queued
+    them is committed. If the task backend supports deferred tasks, this task is enqueued again for when those of the
+    data that failed to be shared are due to be retried. Otherwise, they are retried by the ``sendqueuedshares``
+    management command, which shares everything in the outbox that is due.
+
+    :param queued_share_pks: The primary keys of the ``QueuedShare`` objects to share
+    :type queued_share_pks: list
+
+    :returns: The number of queued data that were shared, that will be retried and that failed for good
+    :rtype: dict
+    """
+    results = share_queued_data(queued_share_pks=queued_share_pks)
+    if results['retrying'] and default_task_backend.supports_defer:
+        next_attempt = QueuedShare.objects.filter(pk__in=queued_share_pks, status=QueuedShare.PENDING)\
+            .aggregate(Min('next_attempt'))['next_attempt__min']
+        if next_attempt:
+            send_queued_shares.using(run_after=next_attempt).enqueue(queued_share_pks)
+    return results
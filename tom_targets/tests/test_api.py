@@ -54,6 +54,28 @@ class TestTargetViewset(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(response.json()['detail'], 'No Target matches the given query.')
 
+    def test_target_match(self):
+        data = {'names': [self.st.name.upper(), 'unknown', None],
+                'ra': [None, self.st2.ra, self.st.ra + 0.5 / 3600],
+                'dec': [None, self.st2.dec, self.st.dec],
+                'radius': 2}
+        response = self.client.post(reverse('api:targets-match'), data=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()
+        self.assertEqual([result['index'] for result in results], [0, 1, 2])
+        self.assertEqual(results[0]['matches'], [{'id': self.st.id, 'name': self.st.name, 'separation': None}])
+        # The user does not have permission to view st2
+        self.assertEqual(results[1]['matches'], [])
+        self.assertEqual(results[2]['matches'][0]['id'], self.st.id)
+        self.assertLess(results[2]['matches'][0]['separation'], 2)
+
+    def test_target_match_invalid(self):
+        data = {'names': ['a', 'b'], 'ra': [1], 'dec': [1], 'radius': 1}
+        response = self.client.post(reverse('api:targets-match'), data=data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('api:targets-match'), data={'ra': [1], 'dec': [1]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_target_create(self):
         """
         Test that a target can be created with all valid parameters through the API
@@ -1,29 +1,47 @@
+import csv
 import pytz
-from datetime import datetime
+import tempfile
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest.mock import patch
+import numpy as np
 import responses
+from astropy import units as u
+from astropy.coordinates import SkyCoord
 
-from django.contrib.auth.models import AnonymousUser, User, Group
+from django.contrib.auth.models import AnonymousUser, User, Group, Permission
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.messages import get_messages
-from django.contrib.messages.constants import SUCCESS, WARNING
+from django.contrib.messages.constants import ERROR, SUCCESS, WARNING
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.forms.models import model_to_dict
 
 from .factories import SiderealTargetFactory, NonSiderealTargetFactory, TargetGroupingFactory, TargetNameFactory
 from tom_observations.tests.utils import FakeRoboticFacility
 from tom_observations.tests.factories import ObservingRecordFactory
-from tom_targets.models import Target, TargetExtra, TargetList, TargetName
-from tom_targets.utils import import_targets
+from tom_targets.models import PersistentShare, QueuedShare, Target, TargetExtra, TargetList, TargetName
+from tom_targets.utils import bulk_import_targets, create_targets_in_bulk, export_targets, import_targets
 from tom_targets.merge import target_merge
-from tom_targets.base_models import BaseTarget, get_target_model_app_label
+from tom_targets.sharing import share_queued_data
+from tom_targets.base_models import BaseTarget, TargetMatchManager, get_target_model_app_label
 from tom_targets.templatetags.targets_extras import target_table_headers, target_table_row
-from tom_targets.permissions import targets_for_user
-from tom_dataproducts.models import ReducedDatum, DataProduct
+from tom_targets import permissions, tasks
+from tom_targets.permissions import (
+    delete_object_permissions, delete_object_permissions_on_commit, permitted_target_ids, targets_for_user
+)
+from tom_targets.sky_pixels import sky_pixel_ranges, sky_pixels
+from tom_dataproducts.models import ReducedDatum, DataProduct, reduced_datum_value_hash
 from tom_observations.models import ObservationRecord
-from guardian.shortcuts import assign_perm, get_perms
+from guardian.models import GroupObjectPermission, UserObjectPermission
+from guardian.shortcuts import assign_perm, get_objects_for_user, get_perms, remove_perm
 
 
 class TestTargetListUserPermissions(TestCase):
@@ -978,6 +996,44 @@ class TestTargetMatchManager(TestCase):
         self.assertTrue(fuzzy_matches.exists())
         self.assertFalse(strict_matches.exists())
 
+    def test_fuzzy_matching_uses_stored_simple_names(self):
+        TargetName.objects.create(target=self.target, name='Test-Alias (1)')
+        self.assertEqual(Target.objects.get(pk=self.target.pk).simple_name, 'testtarget')
+        self.assertEqual(TargetName.objects.get(name='Test-Alias (1)').simple_name, 'testalias1')
+        self.assertEqual(list(Target.matches.match_fuzzy_name('TEST_alias1')), [self.target])
+        self.assertEqual(list(Target.matches.match_fuzzy_name('test alias 1', Target.objects.none())), [])
+
+    def test_fuzzy_matching_tracks_renames(self):
+        self.target.name = 'renamed_target'
+        self.target.save(update_fields=['name'])
+        self.assertFalse(Target.matches.match_fuzzy_name('testtarget').exists())
+        self.assertTrue(Target.matches.match_fuzzy_name('Renamed Target').exists())
+
+    def test_backfill_simple_names(self):
+        Target.objects.filter(pk=self.target.pk).update(simple_name='')
+        self.assertFalse(Target.matches.match_fuzzy_name('testtarget').exists())
+        call_command('backfillsimplenames', stdout=StringIO())
+        self.assertTrue(Target.matches.match_fuzzy_name('testtarget').exists())
+
+    def test_match_catalog(self):
+        TargetName.objects.create(target=self.target, name='alias-one')
+        other = Target.objects.create(name='other', type=Target.SIDEREAL, ra=359.9999, dec=-22.1)
+        names = ['Test Target', 'ALIAS_ONE', None, 'nothing', 'other']
+        ra = [None, None, 0.0001, 113.456 + 2 / 3600, 10]
+        dec = [None, None, -22.1, -22.1, 10]
+        with self.assertNumQueries(3):
+            matches = Target.matches.match_catalog(names=names, ra=ra, dec=dec, radius=1)
+        self.assertEqual(matches[0], {self.target.pk: None})
+        self.assertEqual(matches[1], {self.target.pk: None})
+        self.assertEqual(list(matches[2]), [other.pk])
+        self.assertAlmostEqual(matches[2][other.pk], 0.0002 * 3600 * np.cos(np.radians(22.1)), places=3)
+        self.assertEqual(matches[3], {})
+        self.assertEqual(matches[4], {other.pk: None})
+
+    def test_match_catalog_queryset(self):
+        matches = Target.matches.match_catalog(names=['testtarget'], queryset=Target.objects.exclude(pk=self.target.pk))
+        self.assertEqual(matches, [{}])
+
     def test_cone_search_matching(self):
         ra = 113.456
         dec = -22.1
@@ -1022,6 +1078,44 @@ class TestTargetMatchManager(TestCase):
         matches = Target.matches.match_cone_search(ra, dec, radius)
         self.assertFalse(matches.exists())
 
+    def test_cone_search_matching_across_ra_wraparound(self):
+        target = Target.objects.create(name='wraparound', type=Target.SIDEREAL, ra=359.9999, dec=10)
+        matches = Target.matches.match_cone_search(0.0001, 10, 2)
+        self.assertEqual(list(matches), [target])
+        matches = Target.matches.match_cone_search(0.0001, 10, 0.5)
+        self.assertFalse(matches.exists())
+
+    def test_cone_search_matching_near_pole(self):
+        target = Target.objects.create(name='polar', type=Target.SIDEREAL, ra=10, dec=89.99)
+        # The search position is on the other side of the pole, 180 degrees away in RA
+        matches = Target.matches.match_cone_search(190, 89.99, 100)
+        self.assertEqual(list(matches), [target])
+        matches = Target.matches.match_cone_search(190, 89.99, 50)
+        self.assertFalse(matches.exists())
+
+    def test_sky_pixel_ranges_cover_cone(self):
+        rng = np.random.default_rng(42)
+        for ra, dec, radius in [(0.01, 0, 0.5), (359.5, -30, 2), (180, 89.5, 1), (45, -89.9, 0.3), (10, 60, 30)]:
+            ranges = sky_pixel_ranges(ra, dec, radius)
+            # Random positions inside the cone, offset from the center along random position angles
+            separation = radius * np.sqrt(rng.uniform(0, 1, 1000))
+            position_angle = rng.uniform(0, 360, 1000)
+            points = SkyCoord(ra, dec, unit='deg').directional_offset_by(position_angle * u.deg, separation * u.deg)
+            for pixel in sky_pixels(points.ra.deg, points.dec.deg):
+                self.assertTrue(any(first <= pixel <= last for first, last in ranges))
+
+    def test_backfill_sky_pixels(self):
+        Target.objects.filter(pk=self.target.pk).update(sky_pixel=None)
+        self.assertFalse(Target.matches.match_cone_search(self.target.ra, self.target.dec, 1).exists())
+        call_command('backfillskypixels', stdout=StringIO())
+        self.assertTrue(Target.matches.match_cone_search(self.target.ra, self.target.dec, 1).exists())
+
+
+class PositionalMatchManager(TargetMatchManager):
+    def match_target(self, target, *args, **kwargs):
+        return self.match_name(target.name) | self.get_queryset().filter(
+            pk__in=self.match_cone_search(target.ra, target.dec, 2).values('pk'))
+
 
 class TestTargetImport(TestCase):
     def setUp(self):
@@ -1075,6 +1169,104 @@ class TestTargetImport(TestCase):
             for alias in aliases[target_name].split(','):
                 self.assertTrue(TargetName.objects.filter(target=target, name=alias).exists())
 
+    @override_settings(EXTRA_FIELDS=[{'name': 'redshift', 'type': 'number'},
+                                     {'name': 'priority', 'type': 'number', 'default': 1}])
+    def test_bulk_import(self):
+        group = Group.objects.create(name='bulk group')
+        csv = [
+            'name,type,ra,dec,redshift,name2,groups',
+            'm13,SIDEREAL,250.421,36.459,5,Great Cluster,bulk group',
+            'm27,SIDEREAL,299.901,22.721,,,',
+            'm31,SIDEREAL,10.684,41.269,0.1,,missing group',
+        ]
+        progress = []
+        result = bulk_import_targets(csv, user=self.user, chunk_size=2,
+                                     progress=lambda *args: progress.append(args))
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(len(result['targets']), 3)
+        self.assertEqual(progress, [(2, 2, 0), (3, 3, 0)])
+
+        m13 = Target.objects.get(name='m13')
+        self.assertEqual(m13.ra, 250.421)
+        self.assertEqual(m13.extra_fields, {'redshift': 5.0, 'priority': 1.0})
+        self.assertEqual(list(Target.matches.match_fuzzy_name('greatcluster')), [m13])
+        self.assertEqual(list(Target.matches.match_cone_search(250.421, 36.459, 1)), [m13])
+        for target in Target.objects.all():
+            self.assertEqual(set(get_perms(self.user, target)), {'view_target', 'change_target', 'delete_target'})
+        self.assertEqual(get_perms(group, m13), get_perms(self.user, m13))
+        self.assertEqual(get_perms(group, Target.objects.get(name='m27')), [])
+
+    def test_bulk_import_errors(self):
+        SiderealTargetFactory.create(name='Existing Target')
+        csv = [
+            'name,type,ra,dec,name2',
+            'existing_target,SIDEREAL,250.421,36.459,',
+            'm27,SIDEREAL,299.901,22.721,M 27',
+            'm31,SIDEREAL,not a number,41.269,',
+            'm33,SIDEREAL,23.462,30.66,',
+            'M-33,SIDEREAL,23.462,30.66,',
+        ]
+        result = bulk_import_targets(csv, user=self.user)
+        self.assertEqual([target.name for target in result['targets']], ['m33'])
+        self.assertEqual(len(result['errors']), 4)
+        for line, error in zip([2, 3, 4, 6], result['errors']):
+            self.assertTrue(error.startswith(f'Error on line {line}:'))
+        self.assertFalse(Target.objects.filter(name__in=['m27', 'm31', 'M-33']).exists())
+
+    def test_bulk_import_custom_match_manager(self):
+        SiderealTargetFactory.create(name='Existing Target', ra=250.421, dec=36.459)
+        csv = [
+            'name,type,ra,dec',
+            'm13,SIDEREAL,250.421,36.459',
+            'm27,SIDEREAL,299.901,22.721',
+            'other m27,SIDEREAL,299.9011,22.721',
+        ]
+        self.addCleanup(setattr, Target.matches, '__class__', type(Target.matches))
+        Target.matches.__class__ = PositionalMatchManager
+        result = bulk_import_targets(csv, user=self.user)
+        self.assertEqual([target.name for target in result['targets']], ['m27'])
+        for line, error in zip([2, 4], result['errors']):
+            self.assertTrue(error.startswith(f'Error on line {line}:'))
+        self.assertEqual(len(result['errors']), 2)
+
+    @override_settings(EXTRA_FIELDS=[{'name': 'priority', 'type': 'number', 'default': 1}])
+    def test_create_targets_in_bulk_custom_target_model(self):
+        target = Target(name='m13', type=Target.SIDEREAL, ra=250.421, dec=36.459)
+        # Custom Target models inherit from BaseTarget, which bulk_create does not support
+        with patch.object(Target._meta, 'parents', {BaseTarget: None}), \
+                patch.object(Target, 'save', autospec=True) as mock_save:
+            create_targets_in_bulk([(target, [('redshift', '5')], ['Great Cluster'], [])], {'priority': 1})
+        mock_save.assert_called_once_with(target, extras={'redshift': '5'}, names=['Great Cluster'])
+        self.assertFalse(TargetExtra.objects.exists())
+
+    def test_bulk_import_dry_run(self):
+        csv = [
+            'name,type,ra,dec,name2',
+            'm13,SIDEREAL,250.421,36.459,Great Cluster',
+            'm27,SIDEREAL,299.901,,',
+        ]
+        with self.assertNumQueries(2):
+            result = bulk_import_targets(csv, user=self.user, dry_run=True)
+        self.assertEqual([target.name for target in result['targets']], ['m13', 'm27'])
+        self.assertFalse(Target.objects.exists())
+        self.assertFalse(TargetName.objects.exists())
+
+    def test_import_view_dry_run(self):
+        csv_file = SimpleUploadedFile("test.csv", b"name,type,ra,dec\nm13,SIDEREAL,250.421,36.459",
+                                      content_type="text/csv")
+        response = self.client.post(reverse('targets:import'), {'target_csv': csv_file, 'dry_run': 'on'})
+        self.assertRedirects(response, reverse('targets:import'))
+        self.assertFalse(Target.objects.exists())
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            csv_file.write('name,type,ra,dec\nm13,SIDEREAL,250.421,36.459\nm27,SIDEREAL,299.901,22.721\n')
+            csv_file.flush()
+            out = StringIO()
+            call_command('importtargets', csv_file.name, '--user', self.user.username, stdout=out)
+        self.assertIn('Targets created: 2', out.getvalue())
+        self.assertIn('view_target', get_perms(self.user, Target.objects.get(name='m27')))
+
 
 class TestTargetExport(TestCase):
     """
@@ -1121,6 +1313,24 @@ class TestTargetExport(TestCase):
         self.assertIn('M42', content)
         self.assertNotIn('M52', content)
 
+    @patch('tom_targets.utils.EXPORT_BATCH_SIZE', 2)
+    def test_export_targets_in_batches(self):
+        for index in range(3):
+            SiderealTargetFactory.create(name=f'extra target {index}', targetextra_set=None, aliases=None)
+        TargetNameFactory.create(name='Messier 42', target=self.st)
+        TargetExtra.objects.create(target=self.st2, key='redshift', value='0.1')
+
+        # Two queries for the header, then three for each of the three batches plus one for the empty last batch
+        with self.assertNumQueries(12):
+            rows = list(csv.DictReader(export_targets(Target.objects.all())))
+        exported_names = [row['name'] for row in rows]
+        self.assertEqual(exported_names, list(Target.objects.order_by('pk').values_list('name', flat=True)))
+        rows = {row['name']: row for row in rows}
+        self.assertIn('Messier 42', [rows['M42'][f'name{index}'] for index in range(2, 5)])
+        self.assertEqual(rows['M52']['redshift'], '0.1')
+        self.assertEqual(rows['extra target 0']['redshift'], '')
+        self.assertNotIn('simple_name', rows['M42'])
+
 
 class TestTargetSearch(TestCase):
     def setUp(self):
@@ -1230,7 +1440,7 @@ class TestTargetGrouping(TestCase):
 
 class TestTargetAddRemoveGrouping(TestCase):
     def setUp(self):
-        user = User.objects.create(username='testuser')
+        user = self.user = User.objects.create(username='testuser')
         self.client.force_login(user)
         # create targets
         self.fake_targets = []
@@ -1269,6 +1479,45 @@ class TestTargetAddRemoveGrouping(TestCase):
         self.assertIn(('1 target(s) already in group \'{}\': {}'.format(
             self.fake_grouping.name, self.fake_targets[0].name), WARNING), messages)
 
+    def test_add_all_to_grouping_in_bulk(self):
+        for _ in range(20):
+            target = SiderealTargetFactory.create()
+            assign_perm(f'{get_target_model_app_label()}.view_target', self.user, target)
+        hidden_target = SiderealTargetFactory.create(permissions=Target.Permissions.PRIVATE)
+        data = {
+            'grouping': self.fake_grouping.id,
+            'add': True,
+            'isSelectAll': 'True',
+            'selected-target': [],
+            'query_string': 'type=SIDEREAL',
+        }
+        # The number of queries does not depend on the number of targets added
+        with self.assertNumQueries(16):
+            response = self.client.post(reverse('targets:add-remove-grouping'), data=data)
+        self.assertEqual(self.fake_grouping.targets.count(), 23)
+        self.assertNotIn(hidden_target, self.fake_grouping.targets.all())
+        messages = [(m.message, m.level) for m in get_messages(response.wsgi_request)]
+        self.assertIn(('22 target(s) successfully added to group \'{}\'.'.format(self.fake_grouping.name),
+                       SUCCESS), messages)
+
+    def test_add_selected_to_grouping_missing_target(self):
+        hidden_target = SiderealTargetFactory.create(permissions=Target.Permissions.PRIVATE)
+        data = {
+            'grouping': self.fake_grouping.id,
+            'add': True,
+            'isSelectAll': 'False',
+            'selected-target': [self.fake_targets[1].id, hidden_target.id, 'abc'],
+            'query_string': '',
+        }
+        response = self.client.post(reverse('targets:add-remove-grouping'), data=data)
+        self.assertEqual(set(self.fake_grouping.targets.all()), {self.fake_targets[0], self.fake_targets[1]})
+        messages = [(m.message, m.level) for m in get_messages(response.wsgi_request)]
+        self.assertIn(('1 target(s) successfully added to group \'{}\'.'.format(self.fake_grouping.name),
+                       SUCCESS), messages)
+        self.assertIn(('Failed to add target with id={} to group \'{}\'; Target not found.'.format(
+            hidden_target.id, self.fake_grouping.name), ERROR), messages)
+        self.assertEqual(len([level for _, level in messages if level == ERROR]), 2)
+
     def test_add_to_invalid_grouping(self):
         data = {
             'grouping': -1,
@@ -1820,6 +2069,122 @@ class TestShareTargetList(TestCase):
         self.assertContains(response, 'No targets shared.')
 
 
+@override_settings(DATA_SHARING={'local_host': {'BASE_URL': 'https://fake.url/example/',
+                                                'USERNAME': 'fake_user',
+                                                'PASSWORD': 'password'}})
+class TestContinuousSharing(TestCase):
+    """
+    Tests for the outbox of data queued by continuous sharing.
+    """
+    def setUp(self):
+        self.target = SiderealTargetFactory.create()
+        PersistentShare.objects.create(target=self.target, destination='local_host')
+        self.base_url = settings.DATA_SHARING['local_host']['BASE_URL']
+
+    def create_reduced_datums(self, count):
+        return [ReducedDatum.objects.create(target=self.target, data_type='photometry',
+                                            value={'magnitude': 18 + i, 'error': .5, 'filter': 'V'})
+                for i in range(count)]
+
+    @responses.activate
+    def test_new_data_queued(self):
+        # No requests are made to the destination while the data are saved
+        reduced_datums = self.create_reduced_datums(2)
+        other_target = SiderealTargetFactory.create()
+        ReducedDatum.objects.create(target=other_target, data_type='photometry', value={'magnitude': 18})
+        self.assertEqual(
+            set(QueuedShare.objects.values_list('reduced_datum', 'destination', 'status')),
+            {(rd.pk, 'local_host', QueuedShare.PENDING) for rd in reduced_datums}
+        )
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_queued_data_shared_in_batch(self):
+        self.create_reduced_datums(3)
+        responses.add(responses.GET, self.base_url + 'api/targets/', json={'results': [{'id': 1}]})
+        responses.add(responses.POST, self.base_url + 'api/reduceddatums/', json={}, status=201)
+
+        results = share_queued_data()
+        self.assertEqual(results, {'sent': 3, 'retrying': 0, 'failed': 0})
+        # Shared data are removed from the outbox
+        self.assertFalse(QueuedShare.objects.exists())
+        # The destination target is looked up once for the whole batch
+        self.assertEqual(len([call for call in responses.calls if call.request.method == 'GET']), 1)
+        self.assertEqual(share_queued_data(), {'sent': 0, 'retrying': 0, 'failed': 0})
+
+    @responses.activate
+    @override_settings(SHARING_OUTBOX_MAX_ATTEMPTS=2, SHARING_OUTBOX_RETRY_DELAY=60)
+    def test_failed_share_retried(self):
+        self.create_reduced_datums(2)
+        responses.add(responses.GET, self.base_url + 'api/targets/', json={'results': []})
+
+        self.assertEqual(share_queued_data(), {'sent': 0, 'retrying': 2, 'failed': 0})
+        queued_share = QueuedShare.objects.first()
+        self.assertEqual(queued_share.status, QueuedShare.PENDING)
+        self.assertEqual(queued_share.attempts, 1)
+        self.assertIn('No matching targets found', queued_share.last_error)
+        self.assertAlmostEqual((queued_share.next_attempt - timezone.now()).total_seconds(), 60, delta=5)
+
+        # The retry is not due yet
+        self.assertEqual(share_queued_data(), {'sent': 0, 'retrying': 0, 'failed': 0})
+        QueuedShare.objects.update(next_attempt=timezone.now())
+        self.assertEqual(share_queued_data(), {'sent': 0, 'retrying': 0, 'failed': 2})
+        self.assertFalse(QueuedShare.objects.exclude(status=QueuedShare.FAILED).exists())
+
+    @responses.activate
+    def test_abandoned_share_claimed_again(self):
+        self.create_reduced_datums(1)
+        QueuedShare.objects.update(status=QueuedShare.SENDING, claim='abandoned',
+                                   modified=timezone.now() - timedelta(hours=1))
+        responses.add(responses.GET, self.base_url + 'api/targets/', json={'results': [{'id': 1}]})
+        responses.add(responses.POST, self.base_url + 'api/reduceddatums/', json={}, status=201)
+        self.assertEqual(share_queued_data(), {'sent': 1, 'retrying': 0, 'failed': 0})
+
+    def test_queued_data_sent_on_commit(self):
+        # The task enqueued for this datum is never run, as the test transaction is not committed
+        self.create_reduced_datums(1)
+        with patch('tom_targets.tasks.send_queued_shares') as mock_task:
+            with self.captureOnCommitCallbacks(execute=True):
+                reduced_datum = ReducedDatum.objects.create(target=self.target, data_type='photometry',
+                                                            value={'magnitude': 12})
+        # Only the data just queued are sent by the task; the rest of the outbox is left to the sendqueuedshares command
+        mock_task.enqueue.assert_called_once_with([QueuedShare.objects.get(reduced_datum=reduced_datum).pk])
+
+    @responses.activate
+    def test_queued_data_not_sent_with_immediate_backend(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reduced_datum = ReducedDatum.objects.create(target=self.target, data_type='photometry',
+                                                        value={'magnitude': 12})
+        # The ImmediateBackend would share the data in the request that created them, so they are left in the outbox
+        self.assertEqual(len(responses.calls), 0)
+        self.assertTrue(QueuedShare.objects.filter(reduced_datum=reduced_datum).exists())
+
+    @responses.activate
+    def test_failed_queued_data_deferred(self):
+        reduced_datums = self.create_reduced_datums(2)
+        queued_share_pks = [QueuedShare.objects.get(reduced_datum=reduced_datums[0]).pk]
+        responses.add(responses.GET, self.base_url + 'api/targets/', json={'results': []})
+        send_queued_shares = tasks.send_queued_shares.func
+        with patch('tom_targets.tasks.default_task_backend') as mock_backend, \
+                patch('tom_targets.tasks.send_queued_shares') as mock_task:
+            mock_backend.supports_defer = True
+            results = send_queued_shares(queued_share_pks)
+        self.assertEqual(results, {'sent': 0, 'retrying': 1, 'failed': 0})
+        # Only the data the task was given are shared and deferred until their retry is due
+        mock_task.using.assert_called_once_with(run_after=QueuedShare.objects.get(pk=queued_share_pks[0]).next_attempt)
+        mock_task.using.return_value.enqueue.assert_called_once_with(queued_share_pks)
+        self.assertEqual(QueuedShare.objects.get(reduced_datum=reduced_datums[1]).attempts, 0)
+
+    @responses.activate
+    def test_send_queued_shares_command(self):
+        self.create_reduced_datums(1)
+        responses.add(responses.GET, self.base_url + 'api/targets/', json={'results': [{'id': 1}]})
+        responses.add(responses.POST, self.base_url + 'api/reduceddatums/', json={}, status=201)
+        out = StringIO()
+        call_command('sendqueuedshares', stdout=out)
+        self.assertIn('Queued data shared: 1, to be retried: 0, failed: 0', out.getvalue())
+
+
 class TestTargetMerge(TestCase):
     def setUp(self):
         self.user = User.objects.create(username='testuser')
@@ -2005,6 +2370,80 @@ class TestTargetMerge(TestCase):
         for observationrecord in st2_observationrecords:
             self.assertIn(observationrecord, ObservationRecord.objects.filter(target=self.st1))
 
+    def test_merge_duplicate_reduced_datums(self):
+        """
+        Makes sure that datums that would become duplicates of the primary target's datums are deleted in bulk
+        """
+        timestamp = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+        for target in [self.st1, self.st2, self.st2]:
+            ReducedDatum.objects.bulk_create([ReducedDatum(
+                target=target, data_type='photometry', timestamp=timestamp, value={'magnitude': 10},
+                value_hash=reduced_datum_value_hash({'magnitude': 10})
+            )])
+        for magnitude in range(11, 31):
+            ReducedDatum.objects.create(target=self.st2, data_type='photometry', timestamp=timestamp,
+                                        value={'magnitude': magnitude})
+
+        # The number of queries does not depend on the number of datums moved
+        with CaptureQueriesContext(connection) as queries:
+            target_merge(self.st1, self.st2)
+        self.assertLess(len(queries), 30)
+        self.assertEqual(ReducedDatum.objects.filter(target=self.st1).count(), 21)
+        self.assertEqual(ReducedDatum.objects.filter(target=self.st1, value={'magnitude': 10}).count(), 1)
+
+    def test_merge_reduced_datums_without_value_hash(self):
+        timestamp = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+        ReducedDatum.objects.create(target=self.st1, data_type='photometry', timestamp=timestamp,
+                                    value={'magnitude': 10, 'filter': 'g'})
+        # Simultaneous photometry in several bands, bulk created without a value hash
+        ReducedDatum.objects.bulk_create([
+            ReducedDatum(target=target, data_type='photometry', timestamp=timestamp,
+                         value={'magnitude': magnitude, 'filter': band})
+            for target, magnitude, band in [(self.st1, 11, 'r'), (self.st2, 10, 'g'), (self.st2, 11, 'r'),
+                                            (self.st2, 12, 'i'), (self.st2, 12, 'i')]
+        ])
+
+        target_merge(self.st1, self.st2)
+        self.assertEqual(sorted(ReducedDatum.objects.filter(target=self.st1).values_list('value__filter', flat=True)),
+                         ['g', 'i', 'r'])
+
+    def test_merge_targets_command(self):
+        st3 = SiderealTargetFactory.create()
+        ReducedDatum.objects.create(target=self.st2, data_type='photometry', value={'magnitude': 10})
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            csv_file.write(f'primary,secondary\n{self.st1.id},{self.st2.id}\n{st3.name},{self.st1.name}\n'
+                           f'{self.st1.id},{self.st2.id}\n')
+            csv_file.flush()
+            out, err = StringIO(), StringIO()
+            call_command('mergetargets', csv_file.name, stdout=out, stderr=err)
+
+        self.assertIn('Targets merged: 2, errors: 1', out.getvalue())
+        self.assertIn('Line 4', err.getvalue())
+        self.assertEqual(list(Target.objects.values_list('id', flat=True)), [st3.id])
+        self.assertEqual(ReducedDatum.objects.get().target, st3)
+        self.assertIn(self.st2.name, st3.names)
+
+    def test_merge_targets_command_dry_run(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            csv_file.write(f'{self.st1.id},{self.st2.id}\n{self.st1.id},{self.st1.id}\n')
+            csv_file.flush()
+            out, err = StringIO(), StringIO()
+            call_command('mergetargets', csv_file.name, '--dry_run', stdout=out, stderr=err)
+
+        self.assertIn('Pairs that would be merged: 1, errors: 1', out.getvalue())
+        self.assertEqual(Target.objects.count(), 2)
+
+    def test_merge_targets_command_numeric_name(self):
+        numeric_target = SiderealTargetFactory.create(name='99999')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            csv_file.write(f'{self.st1.id},{numeric_target.name}\n')
+            csv_file.flush()
+            out, err = StringIO(), StringIO()
+            call_command('mergetargets', csv_file.name, stdout=out, stderr=err)
+
+        self.assertIn('Targets merged: 1, errors: 0', out.getvalue())
+        self.assertFalse(Target.objects.filter(pk=numeric_target.pk).exists())
+
 
 class TestTargetSeed(TestCase):
     def test_seed_targets_authenticated(self):
@@ -2087,6 +2526,119 @@ class TestTargetPermissionFiltering(TestCase):
         with self.assertRaises(AssertionError):
             targets_for_user(self.user, Target.objects.all(), 'view_targett')
 
+    def test_permitted_target_ids_cached(self):
+        target_app_label = get_target_model_app_label()
+        assign_perm(f'{target_app_label}.view_target', self.user, self.private_user_target)
+        with patch('tom_targets.permissions.get_objects_for_user', wraps=get_objects_for_user) as mock_get_objects:
+            self.assertIn(self.private_user_target, targets_for_user(self.user, Target.objects.all(), 'view_target'))
+            # A later request, with a fresh user object, reads the ids from the cache
+            user = User.objects.get(pk=self.user.pk)
+            self.assertIn(self.private_user_target, targets_for_user(user, Target.objects.all(), 'view_target'))
+            self.assertIn(self.private_user_target, targets_for_user(user, Target.objects.all(), 'view_target'))
+        self.assertEqual(mock_get_objects.call_count, 1)
+
+    def test_permitted_target_ids_invalidated(self):
+        target_app_label = get_target_model_app_label()
+        self.assertNotIn(self.private_group_target,
+                         targets_for_user(self.user, Target.objects.all(), 'view_target'))
+
+        assign_perm(f'{target_app_label}.view_target', self.group, self.private_group_target)
+        self.group.user_set.add(self.user)
+        self.assertIn(self.private_group_target, targets_for_user(self.user, Target.objects.all(), 'view_target'))
+
+        self.group.user_set.remove(self.user)
+        self.assertNotIn(self.private_group_target,
+                         targets_for_user(self.user, Target.objects.all(), 'view_target'))
+
+        assign_perm(f'{target_app_label}.view_target', self.user, self.private_user_target)
+        remove_perm(f'{target_app_label}.view_target', self.user, self.private_user_target)
+        self.assertNotIn(self.private_user_target, targets_for_user(self.user, Target.objects.all(), 'view_target'))
+
+    def test_permitted_target_ids_invalidated_by_global_permissions(self):
+        content_type = ContentType.objects.get_for_model(Target)
+        self.group.user_set.add(self.user)
+        self.assertNotIn(self.private_user_target, targets_for_user(self.user, Target.objects.all(), 'view_target'))
+        self.group.permissions.add(Permission.objects.get(codename='view_target', content_type=content_type))
+        user = User.objects.get(pk=self.user.pk)
+        self.assertIn(self.private_user_target, targets_for_user(user, Target.objects.all(), 'view_target'))
+
+        self.assertNotIn(self.private_user_target, targets_for_user(user, Target.objects.all(), 'change_target'))
+        user.user_permissions.add(Permission.objects.get(codename='change_target', content_type=content_type))
+        user = User.objects.get(pk=self.user.pk)
+        self.assertIn(self.private_user_target, targets_for_user(user, Target.objects.all(), 'change_target'))
+
+    def test_permitted_target_ids_not_invalidated_by_other_permissions(self):
+        target_list = TargetList.objects.create(name='testlist')
+        targets_for_user(self.user, Target.objects.all(), 'view_target')
+        with patch('tom_targets.permissions._bump_target_permissions_version') as mock_bump:
+            assign_perm('tom_targets.change_targetlist', self.user, target_list)
+        mock_bump.assert_not_called()
+
+    def test_permitted_target_ids_invalidated_once_per_transaction(self):
+        target_app_label = get_target_model_app_label()
+        other_users = [User.objects.create(username=f'user{i}') for i in range(5)]
+        for user in other_users:
+            assign_perm(f'{target_app_label}.view_target', user, self.private_user_target)
+        targets_for_user(self.user, Target.objects.all(), 'view_target')
+        with patch('tom_targets.permissions._bump_target_permissions_version',
+                   wraps=permissions._bump_target_permissions_version) as mock_bump:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.private_user_target.delete()
+        # Once for the ids read in this transaction, and once on commit
+        self.assertEqual(mock_bump.call_count, 2)
+
+    @override_settings(TARGET_PERMISSIONS_CACHE_TIMEOUT=0)
+    def test_permitted_target_ids_cache_disabled(self):
+        target_app_label = get_target_model_app_label()
+        assign_perm(f'{target_app_label}.view_target', self.user, self.private_user_target)
+        self.assertIsNone(permitted_target_ids(self.user, 'view_target'))
+        self.assertIn(self.private_user_target, targets_for_user(self.user, Target.objects.all(), 'view_target'))
+
+
+class TestTargetPermissionCleanup(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+        self.group = Group.objects.create(name='testgroup')
+        self.targets = [SiderealTargetFactory.create() for _ in range(3)]
+        target_app_label = get_target_model_app_label()
+        for target in self.targets:
+            assign_perm(f'{target_app_label}.view_target', self.user, target)
+            assign_perm(f'{target_app_label}.change_target', self.group, target)
+
+    def test_delete_target_permissions(self):
+        content_type = ContentType.objects.get_for_model(Target)
+        # Permissions for objects that do not exist can only be created in bulk, bypassing guardian's checks
+        orphan, = UserObjectPermission.objects.bulk_create([UserObjectPermission(
+            user=self.user, permission=Permission.objects.get(codename='view_target', content_type=content_type),
+            content_type=content_type, object_pk='999999'
+        )])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.targets[0].delete()
+        self.assertEqual(get_perms(self.user, self.targets[1]), ['view_target'])
+        self.assertEqual(get_perms(self.group, self.targets[1]), ['change_target'])
+        self.assertEqual(UserObjectPermission.objects.count(), 3)
+        self.assertEqual(GroupObjectPermission.objects.count(), 2)
+        # Orphaned permissions of other objects are left for the clean_orphan_obj_perms command
+        self.assertTrue(UserObjectPermission.objects.filter(object_pk=orphan.object_pk).exists())
+
+    def test_bulk_delete_target_permissions(self):
+        with patch('tom_targets.permissions.delete_object_permissions',
+                   wraps=delete_object_permissions) as mock_delete_permissions:
+            with self.captureOnCommitCallbacks(execute=True):
+                Target.objects.filter(pk__in=[target.pk for target in self.targets[:2]]).delete()
+        mock_delete_permissions.assert_called_once()
+        self.assertLessEqual({self.targets[0].pk, self.targets[1].pk}, mock_delete_permissions.call_args[0][1])
+        self.assertEqual(list(UserObjectPermission.objects.values_list('object_pk', flat=True)),
+                         [str(self.targets[2].pk)])
+        self.assertEqual(list(GroupObjectPermission.objects.values_list('object_pk', flat=True)),
+                         [str(self.targets[2].pk)])
+
+    def test_existing_target_permissions_kept(self):
+        # Targets whose deletion was rolled back still exist, and keep their permissions
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_object_permissions_on_commit(self.targets[0])
+        self.assertEqual(get_perms(self.user, self.targets[0]), ['view_target'])
+
 
 class TestTargetTagsFilters(TestCase):
     def setUp(self):
@@ -2112,3 +2664,33 @@ class TestTargetTagsFilters(TestCase):
         self.target_1.save()
         row = target_table_row(self.target_1)
         assert row == ["Target 1", 0, "None", "bar"]
+
+
+@override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'])
+class TestTargetFacilitySelectionView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='test', email='test@example.com')
+        self.client.force_login(self.user)
+        self.southern_target = SiderealTargetFactory.create(name='Southern', ra=100, dec=-80)
+        self.northern_target = SiderealTargetFactory.create(name='Northern', ra=100, dec=80)
+        self.non_sidereal_target = NonSiderealTargetFactory.create(name='Comet')
+        self.target_list = TargetList.objects.create(name='selection')
+        self.target_list.targets.add(self.southern_target, self.northern_target, self.non_sidereal_target)
+
+    def test_observable_targets(self):
+        response = self.client.post(reverse('targets:target-selection'), data={
+            'target_list': self.target_list.id,
+            'observatory': 'FakeRoboticFacility',
+            'window_start': '2024-06-01 00:00:00'
+        })
+        rows = {(row[1], row[2]): row for row in response.context['target_visibilities']}
+        self.assertEqual(set(rows), {
+            ('Northern', '(FakeRoboticFacility) Los Angeles'), ('Northern', '(FakeRoboticFacility) Siding Spring'),
+            ('Southern', '(FakeRoboticFacility) Los Angeles'), ('Southern', '(FakeRoboticFacility) Siding Spring'),
+        })
+        self.assertEqual(rows[('Northern', '(FakeRoboticFacility) Siding Spring')][3:], ['>2', '-', '-', '-', 0])
+        self.assertEqual(rows[('Southern', '(FakeRoboticFacility) Los Angeles')][3:], ['>2', '-', '-', '-', 0])
+        southern_row = rows[('Southern', '(FakeRoboticFacility) Siding Spring')]
+        self.assertEqual(southern_row[0], self.southern_target.id)
+        self.assertLess(southern_row[3], 2)
+        self.assertNotEqual(southern_row[7], 0)
@@ -1,65 +1,137 @@
-from django.db.models import Count
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Max
 from django.contrib.auth.models import Group
+from guardian.shortcuts import assign_perm
 
 import csv
+from itertools import islice
+from tom_common.hooks import run_hook
+from .base_models import TargetMatchManager, get_target_model_app_label
 from .models import Target, TargetExtra, TargetName
-from io import StringIO
-from django.db.models import ExpressionWrapper, FloatField
-from django.db.models.functions.math import ACos, Cos, Radians, Pi, Sin
-from math import radians
+from .permissions import invalidate_target_permissions_cache
+from .sky_pixels import cone_search, sky_pixel
+
+
+# Number of targets read from the database at a time by ``export_targets``
+EXPORT_BATCH_SIZE = 1000
+
+# Number of rows validated and inserted at a time by ``bulk_import_targets``
+IMPORT_CHUNK_SIZE = 1000
+
+# Target fields that are maintained by the TOM for indexing and are not exported
+EXPORT_EXCLUDED_FIELDS = ['id', 'simple_name', 'sky_pixel']
+
+
+class Echo:
+    """
+    A pseudo-buffer that returns what is written to it instead of storing it, used to stream a CSV as it is written.
+    See https://docs.djangoproject.com/en/stable/howto/outputting-csv/#streaming-large-csv-files
+    """
+    def write(self, value):
+        return value
 
 
-# NOTE: This saves locally. To avoid this, create file buffer.
-# referenced https://www.codingforentrepreneurs.com/blog/django-queryset-to-csv-files-datasets/
 def export_targets(qs):
     """
-    Exports all the specified targets into a csv file in folder csvTargetFiles
-    NOTE: This saves locally. To avoid this, create file buffer.
+    Exports all the specified targets to CSV, including their extras and aliases. The CSV is generated one row at a
+    time while targets, extras and aliases are read from the database in batches of ``EXPORT_BATCH_SIZE`` targets, so
+    memory use does not grow with the number of exported targets.
 
-    :param qs: List of targets to export
+    :param qs: Targets to export
     :type qs: QuerySet
 
-    :returns: String buffer of exported targets
-    :rtype: StringIO
+    :returns: Generator of the lines of the CSV
+    :rtype: generator
     """
-    qs_pk = [data['id'] for data in qs]
-    data_list = list(qs)
-    target_fields = [field.name for field in Target._meta.get_fields()]
-    target_extra_fields = list({field.key for field in TargetExtra.objects.filter(target__in=qs_pk)})
+    target_fields = [field.name for field in Target._meta.concrete_fields
+                     if not field.is_relation and field.name not in EXPORT_EXCLUDED_FIELDS]
+    target_ids = qs.values('pk')
+    target_extra_fields = list(
+        TargetExtra.objects.filter(target__in=target_ids).order_by('key').values_list('key', flat=True).distinct()
+    )
     # Gets the count of the target names for the target with the most aliases in the database
     # This is to construct enough row headers of format "name2, name3, name4, etc" for exporting aliases
     # The alias headers are then added to the set of fields for export
-    aliases = TargetName.objects.filter(target__in=qs_pk).values('target_id').annotate(count=Count('target_id'))
-    max_alias_count = 0
-    if aliases:
-        max_alias_count = max([alias['count'] for alias in aliases])
+    max_alias_count = TargetName.objects.filter(target__in=target_ids).values('target_id').annotate(
+        count=Count('target_id')
+    ).aggregate(max_count=Max('count'))['max_count'] or 0
     all_fields = target_fields + target_extra_fields + [f'name{index+1}' for index in range(1, max_alias_count+1)]
-    for key in ['id', 'targetlist', 'dataproduct', 'observationrecord', 'reduceddatum', 'aliases', 'targetextra']:
-        all_fields.remove(key)
-
-    file_buffer = StringIO()
-    writer = csv.DictWriter(file_buffer, fieldnames=all_fields)
-    writer.writeheader()
-    for target_data in data_list:
-        extras = list(TargetExtra.objects.filter(target_id=target_data['id']))
-        names = list(TargetName.objects.filter(target_id=target_data['id']))
-        for e in extras:
-            target_data[e.key] = e.value
-        name_index = 2
-        for name in names:
-            target_data[f'name{str(name_index)}'] = name.name
-            name_index += 1
-        # do not export 'pk's
-        for pointer_key in [pk for pk in target_data.keys() if pk.endswith('_ptr_id')]:
-            del target_data[pointer_key]
-        del target_data['id']
-        writer.writerow(target_data)
-    return file_buffer
+
+    writer = csv.DictWriter(Echo(), fieldnames=all_fields)
+    yield writer.writeheader()
+
+    # Targets are read in batches ordered by primary key, each starting after the last target of the previous batch
+    qs = qs.order_by('pk')
+    last_pk = None
+    while True:
+        batch = qs if last_pk is None else qs.filter(pk__gt=last_pk)
+        batch = list(batch.values('pk', *target_fields)[:EXPORT_BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1]['pk']
+        batch_ids = [target_data['pk'] for target_data in batch]
+
+        extras = {}
+        for target_id, key, value in TargetExtra.objects.filter(target__in=batch_ids).values_list(
+                'target_id', 'key', 'value'):
+            extras.setdefault(target_id, {})[key] = value
+        names = {}
+        for target_id, name in TargetName.objects.filter(target__in=batch_ids).order_by('pk').values_list(
+                'target_id', 'name'):
+            names.setdefault(target_id, []).append(name)
+
+        for target_data in batch:
+            target_id = target_data.pop('pk')
+            target_data.update(extras.get(target_id, {}))
+            for name_index, name in enumerate(names.get(target_id, []), start=2):
+                target_data[f'name{name_index}'] = name
+            yield writer.writerow(target_data)
+
+
+def parse_target_row(row, base_target_fields):
+    """
+    Splits a row of a target CSV into the values of the target fields, the extras, the aliases and the groups of the
+    target.
+
+    :param row: A row of the CSV, as read by ``csv.DictReader``
+    :type row: dict
+
+    :param base_target_fields: The names of the fields of the Target model
+    :type base_target_fields: list
+
+    :returns: Tuple of the target field values (dict), extras (list of key/value tuples), aliases (list) and group
+        names (list)
+    :rtype: tuple
+    """
+    # filter out empty values in base fields, otherwise converting empty string to float will throw error
+    row = {k: v for (k, v) in row.items() if not (k in base_target_fields and not v)}
+    target_extra_fields = []
+    target_names = []
+    group_names = []
+    target_fields = {}
+    for k in row:
+        # All fields starting with 'name' (e.g. name2, name3) that aren't literally 'name' will be added as
+        # TargetNames
+        if k != 'name' and k.startswith('name'):
+            if row[k]:
+                target_names.append(row[k])
+        elif k == 'groups':
+            groups = row[k].split(',')
+            for group in groups:
+                group_names.append(group.strip())
+        elif k not in base_target_fields:
+            target_extra_fields.append((k, row[k]))
+        else:
+            target_fields[k] = row[k]
+    return target_fields, target_extra_fields, target_names, group_names
 
 
 def import_targets(target_stream):
     """
-    Imports a set of targets into the TOM and saves them to the database.
+    Imports a set of targets into the TOM and saves them to the database, one target at a time. See
+    ``bulk_import_targets`` for importing large files.
 
     :param target_stream: String buffer of targets
     :type target_stream: StringIO
@@ -67,40 +139,18 @@ def import_targets(target_stream):
     :returns: dictionary of successfully imported targets, as well errors
     :rtype: dict
     """
-    # TODO: Replace this with an in memory iterator
     targetreader = csv.DictReader(target_stream, dialect=csv.excel)
     targets = []
     errors = []
     base_target_fields = [field.name for field in Target._meta.get_fields()]
     for index, row in enumerate(targetreader):
-        # filter out empty values in base fields, otherwise converting empty string to float will throw error
-        row = {k: v for (k, v) in row.items() if not (k in base_target_fields and not v)}
-        target_extra_fields = []
-        target_names = []
-        group_names = []
-        target_fields = {}
-        for k in row:
-            # All fields starting with 'name' (e.g. name2, name3) that aren't literally 'name' will be added as
-            # TargetNames
-            if k != 'name' and k.startswith('name'):
-                target_names.append(row[k])
-            elif k == 'groups':
-                groups = row[k].split(',')
-                for group in groups:
-                    group_names.append(group.strip())
-            elif k not in base_target_fields:
-                target_extra_fields.append((k, row[k]))
-            else:
-                target_fields[k] = row[k]
-        for extra in target_extra_fields:
-            row.pop(extra[0])
+        target_fields, target_extra_fields, target_names, group_names = parse_target_row(row, base_target_fields)
         try:
             target = Target.objects.create(**target_fields)
             for extra in target_extra_fields:
                 TargetExtra.objects.create(target=target, key=extra[0], value=extra[1])
             for name in target_names:
-                if name:
-                    TargetName.objects.create(target=target, name=name)
+                TargetName.objects.create(target=target, name=name)
             targets.append(target)
             for group in group_names:
                 try:
@@ -115,14 +165,217 @@ def import_targets(target_stream):
     return {'targets': targets, 'errors': errors}
 
 
+def _uses_custom_matching():
+    """
+    Returns whether the configured ``TargetMatchManager`` overrides how targets are matched, in which case
+    ``TargetMatchManager.match_catalog`` would not find the same duplicates as ``Target.validate_unique``.
+    """
+    manager_class = type(Target.matches)
+    return any(getattr(manager_class, method_name) is not getattr(TargetMatchManager, method_name)
+               for method_name in ['is_unique', 'match_target', 'match_name', 'match_fuzzy_name'])
+
+
+def _match_existing(parsed):
+    """
+    Returns whether each name and alias of the parsed targets matches an existing target, in the same order as they
+    are passed to ``TargetMatchManager.match_catalog`` by ``bulk_import_targets``, using the matching methods of the
+    configured ``TargetMatchManager`` as ``Target.validate_unique`` and ``TargetName.validate_unique`` do.
+    """
+    matches = []
+    for _, target, _, target_names, _ in parsed:
+        matches.append(not Target.matches.is_unique(target))
+        matches.extend(Target.matches.match_name(name).exists() for name in target_names)
+    return matches
+
+
+def bulk_import_targets(target_stream, user=None, dry_run=False, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Imports a set of targets into the TOM in chunks of ``chunk_size`` rows. Each chunk is validated before anything is
+    written: field values are checked, and the names and aliases of every target are matched against each other and
+    against the existing targets and aliases in a few queries using ``TargetMatchManager.match_catalog``. The valid
+    targets of each chunk, and their extras, aliases and permissions, are then inserted with ``bulk_create`` in a
+    single transaction.
+
+    If the configured ``TargetMatchManager`` overrides ``is_unique``, ``match_target``, ``match_name`` or
+    ``match_fuzzy_name``, each target is instead matched with those methods, and the rows are validated and inserted one
+    at a time so that targets in the file are also matched against those inserted before them.
+
+    Rows that fail validation are not imported and are reported in the returned errors, in the same format as
+    ``import_targets``.
+
+    :param target_stream: Iterable of the lines of a target CSV, such as an open file or a StringIO
+    :type target_stream: iterable
+
+    :param user: User that will be given access to the imported targets, if provided
+    :type user: User
+
+    :param dry_run: If True, validate the targets and report errors without writing anything to the database
+    :type dry_run: bool
+
+    :param chunk_size: Number of rows to validate and insert at a time
+    :type chunk_size: int
+
+    :param progress: Optional callable, called after each chunk with the number of rows processed, the number of targets
+        imported (or that would be imported in a dry run) and the number of errors so far
+    :type progress: callable
+
+    :returns: dictionary of successfully imported targets (unsaved in a dry run), as well errors
+    :rtype: dict
+    """
+    targetreader = csv.DictReader(target_stream, dialect=csv.excel)
+    targets = []
+    errors = []
+    base_target_fields = [field.name for field in Target._meta.get_fields()]
+    concrete_field_names = [field.name for field in Target._meta.concrete_fields]
+    target_app_label = get_target_model_app_label()
+    default_extras = {extra_field['name']: extra_field['default'] for extra_field in settings.EXTRA_FIELDS
+                      if extra_field.get('default') is not None}
+    # Simplified names of all the targets and aliases in the file, mapped to the line they first appear on
+    seen_names = {}
+    groups = {}
+    rows_processed = 0
+    custom_matching = _uses_custom_matching()
+    if custom_matching:
+        chunk_size = 1
+
+    while True:
+        chunk = list(islice(targetreader, chunk_size))
+        if not chunk:
+            break
+        line_offset = rows_processed + 2  # the first row of the file is the header
+        rows_processed += len(chunk)
+
+        # Build and validate the targets of the chunk without touching the database
+        parsed = []
+        chunk_errors = []
+        for index, row in enumerate(chunk):
+            line = line_offset + index
+            target_fields, target_extra_fields, target_names, group_names = parse_target_row(row, base_target_fields)
+            try:
+                target = Target(**target_fields)
+                target.clean_fields(exclude=[name for name in concrete_field_names
+                                             if name not in target_fields and name != 'name'])
+            except ValidationError as e:
+                chunk_errors.append((line, '; '.join(e.messages)))
+                continue
+            except Exception as e:
+                chunk_errors.append((line, str(e)))
+                continue
+            target.simple_name = Target.matches.simplify_name(target.name)
+            target.sky_pixel = sky_pixel(target.ra, target.dec)
+            parsed.append((line, target, target_extra_fields, target_names, group_names))
+
+        # Check the names and aliases against the rest of the file and the database
+        all_names = [name for _, target, _, target_names, _ in parsed for name in [target.name] + target_names]
+        if custom_matching:
+            existing_matches = iter(_match_existing(parsed))
+        else:
+            existing_matches = iter(Target.matches.match_catalog(names=all_names))
+        valid = []
+        for line, target, target_extra_fields, target_names, group_names in parsed:
+            conflicts = []
+            row_names = {}
+            for name in [target.name] + target_names:
+                simple_name = Target.matches.simplify_name(name)
+                if next(existing_matches):
+                    conflicts.append(f'Target with name or alias similar to {name} already exists.')
+                elif simple_name in row_names:
+                    conflicts.append(f'{name} is too similar to {row_names[simple_name]}.')
+                elif simple_name in seen_names:
+                    conflicts.append(f'{name} is similar to a name on line {seen_names[simple_name]}.')
+                row_names[simple_name] = name
+            if conflicts:
+                chunk_errors.append((line, ' '.join(conflicts)))
+                continue
+            for simple_name in row_names:
+                seen_names[simple_name] = line
+            valid.append((target, target_extra_fields, target_names, group_names))
+        errors.extend('Error on line {0}: {1}'.format(line, error) for line, error in sorted(chunk_errors))
+
+        if not dry_run and valid:
+            with transaction.atomic():
+                create_targets_in_bulk(valid, default_extras)
+
+                # Give access to the user and groups
+                missing_groups = {group for *_, group_names in valid for group in group_names} - set(groups)
+                groups.update({group.name: group for group in Group.objects.filter(name__in=missing_groups)})
+                targets_by_group = {}
+                for target, *_, group_names in valid:
+                    for group in group_names:
+                        if group in groups:
+                            targets_by_group.setdefault(groups[group], []).append(target)
+                if user is not None:
+                    targets_by_group[user] = [target for target, *_ in valid]
+                for user_or_group, group_targets in targets_by_group.items():
+                    for permission in ['view_target', 'change_target', 'delete_target']:
+                        assign_perm(f'{target_app_label}.{permission}', user_or_group, group_targets)
+                # django-guardian does not send signals when it assigns permissions in bulk
+                invalidate_target_permissions_cache()
+
+            if not Target._meta.parents:
+                # Custom Target models are saved one at a time, which already runs the hook
+                for target, *_ in valid:
+                    run_hook('target_post_save', target=target, created=True)
+
+        targets.extend(target for target, *_ in valid)
+        if progress is not None:
+            progress(rows_processed, len(targets), len(errors))
+
+    return {'targets': targets, 'errors': errors}
+
+
+def create_targets_in_bulk(rows, default_extras):
+    """
+    Inserts validated targets and their extras and aliases with ``bulk_create``. Used by ``bulk_import_targets``.
+
+    Custom Target models, which ``bulk_create`` does not support, are saved one at a time with their own ``save``
+    instead, which also creates their extras and aliases and runs the ``target_post_save`` hook.
+
+    :param rows: List of tuples of an unsaved target, its extras (list of key/value tuples), its aliases (list) and its
+        group names (list)
+    :type rows: list
+
+    :param default_extras: Default values of the extras configured in ``settings.EXTRA_FIELDS``, by name
+    :type default_extras: dict
+    """
+    if Target._meta.parents:
+        # bulk_create does not support multi-table inherited models
+        for target, target_extra_fields, target_names, _ in rows:
+            target.save(extras=dict(target_extra_fields), names=target_names)
+        return
+
+    targets = [target for target, *_ in rows]
+    Target.objects.bulk_create(targets)
+    if any(target.pk is None for target in targets):
+        # Some databases do not return the primary keys of bulk created objects
+        target_ids = dict(Target.objects.filter(name__in=[target.name for target in targets])
+                          .values_list('name', 'pk'))
+        for target in targets:
+            target.pk = target_ids[target.name]
+
+    extras = []
+    aliases = []
+    for target, target_extra_fields, target_names, _ in rows:
+        target_extras = dict(default_extras)
+        target_extras.update(target_extra_fields)
+        for key, value in target_extras.items():
+            extra = TargetExtra(target=target, key=key, value=value)
+            extra.set_typed_values()
+            extras.append(extra)
+        for name in target_names:
+            aliases.append(TargetName(target=target, name=name, simple_name=Target.matches.simplify_name(name)))
+    TargetExtra.objects.bulk_create(extras)
+    TargetName.objects.bulk_create(aliases)
+
+
 def cone_search_filter(queryset, ra, dec, radius):
     """
     Executes cone search by annotating each target with separation distance from the specified RA/Dec.
     Formula is from Wikipedia: https://en.wikipedia.org/wiki/Angular_distance
-    The result is converted to radians.
+    The result is converted to degrees.
 
-    Cone search is preceded by a square search to reduce the search radius before annotating the queryset, in
-    order to make the query faster.
+    Cone search is preceded by a search of the indexed sky pixels covering the cone to reduce the number of targets
+    before annotating the queryset, in order to make the query faster.
 
     :param queryset: Queryset of Target objects
     :type queryset: Target
@@ -140,17 +393,4 @@ def cone_search_filter(queryset, ra, dec, radius):
     dec = float(dec)
     radius = float(radius)
 
-    double_radius = radius * 2
-    queryset = queryset.filter(
-        ra__gte=ra - double_radius, ra__lte=ra + double_radius,
-        dec__gte=dec - double_radius, dec__lte=dec + double_radius
-    )
-
-    separation = ExpressionWrapper(
-            180 * ACos(
-                (Sin(radians(dec)) * Sin(Radians('dec'))) +
-                (Cos(radians(dec)) * Cos(Radians('dec')) * Cos(radians(ra) - Radians('ra')))
-            ) / Pi(), FloatField()
-        )
-
-    return queryset.annotate(separation=separation).filter(separation__lte=radius)
+    return cone_search(queryset, ra, dec, radius)
@@ -58,8 +58,8 @@ from tom_targets.models import Target, TargetList
 from tom_targets.persistent_sharing_serializers import PersistentShareSerializer
 from tom_targets.permissions import targets_for_user
 from tom_targets.templatetags.targets_extras import target_merge_fields, persistent_share_table
-from tom_targets.utils import import_targets, export_targets
-from tom_observations.utils import get_sidereal_visibility
+from tom_targets.utils import bulk_import_targets, export_targets
+from tom_observations.utils import get_sidereal_visibilities
 from tom_targets.seed import seed_messier_targets
 from tom_targets.tables import TargetTable, TargetGroupTable
 from tom_dataproducts.alertstreams.hermes import BuildHermesMessage, preload_to_hermes
@@ -570,22 +570,31 @@ class TargetImportView(LoginRequiredMixin, TemplateView):
 
     def post(self, request):
         """
-        Handles the POST requests to this view. Creates a StringIO object and passes it to ``import_targets``.
+        Handles the POST requests to this view. Creates a StringIO object and passes it to ``bulk_import_targets``,
+        which gives the requesting user access to the imported targets. If ``dry_run`` is checked, the targets are only
+        validated.
 
         :param request: the request object passed to this view
         :type request: HTTPRequest
         """
         csv_file = request.FILES['target_csv']
         csv_stream = StringIO(csv_file.read().decode('utf-8'), newline=None)
-        result = import_targets(csv_stream)
-        for target in result['targets']:
-            target.give_user_access(request.user)
-        messages.success(
-            request,
-            'Targets created: {}'.format(len(result['targets']))
-        )
+        dry_run = request.POST.get('dry_run') == 'on'
+        result = bulk_import_targets(csv_stream, user=request.user, dry_run=dry_run)
+        if dry_run:
+            messages.success(
+                request,
+                'Dry run, no targets were created. Targets that would be created: {}'.format(len(result['targets']))
+            )
+        else:
+            messages.success(
+                request,
+                'Targets created: {}'.format(len(result['targets']))
+            )
         for error in result['errors']:
             messages.warning(request, error)
+        if dry_run:
+            return redirect(reverse('tom_targets:import'))
         return redirect(reverse('tom_targets:list'))
 
 
@@ -604,10 +613,8 @@ class TargetExportView(TargetListView):
         :returns: response class with CSV
         :rtype: StreamingHttpResponse
         """
-        qs = context['filter'].qs.values()
-        file_buffer = export_targets(qs)
-        file_buffer.seek(0)  # goto the beginning of the buffer
-        response = StreamingHttpResponse(file_buffer, content_type="text/csv")
+        qs = context['filter'].qs
+        response = StreamingHttpResponse(export_targets(qs), content_type="text/csv")
         filename = "targets-{}.csv".format(slugify(datetime.utcnow()))
         response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
         return response
@@ -1056,20 +1063,33 @@ class TargetFacilitySelectionView(Raise403PermissionRequiredMixin, FormView):
         # visible at lower airmass than the limit from any site - if so the target is considered to be visible
         observable_targets = []
 
-        for target in targets_page:
-            window_end = window_start + timedelta(days=1)
-            visibility_data = get_sidereal_visibility(
-                target, window_start, window_end,
-                visibiliy_intervals, airmass_max,
-                facility_name=observatory
+        # Non-sidereal targets have no visibility data, so they are left out of the results
+        targets = [target for target in targets_page if target.type == Target.SIDEREAL]
+        window_end = window_start + timedelta(days=1)
+        times, visibility_data = get_sidereal_visibilities(
+            targets, window_start, window_end,
+            visibiliy_intervals, airmass_max,
+            facility_name=observatory
+        )
+
+        # Summarize the airmass of every target at each site at once: whether it is ever visible, its minimum
+        # airmass, and the indices of the first, last and minimum airmass times
+        site_summaries = {}
+        for site, airmass in visibility_data.items():
+            visible = ~np.isnan(airmass)
+            airmass = np.where(visible, airmass, np.inf)
+            site_summaries[site] = (
+                visible.any(axis=1),
+                airmass.min(axis=1),
+                visible.argmax(axis=1),
+                airmass.argmin(axis=1),
+                visible.shape[1] - 1 - visible[:, ::-1].argmax(axis=1)
             )
-            for site, vis_data in visibility_data.items():
-                airmass_data = np.array([[vis_data[0][i], x] for i, x in enumerate(vis_data[1]) if x])
 
-                if len(airmass_data) > 0:
-                    # Find the timestamp of the minimum airmass
-                    imin = np.where(airmass_data[:, 1] == airmass_data[:, 1].min())[0][0]
-                    duration = airmass_data[:, 0][-1] - airmass_data[:, 0][0]
+        for i, target in enumerate(targets):
+            for site, (any_visible, min_airmass, irise, imin, iset) in site_summaries.items():
+                if any_visible[i]:
+                    duration = times[iset[i]] - times[irise[i]]
 
                     # Target entry includes:
                     # PK, name, site, minimum airmass, time of minimum airmass, rise time, set time
@@ -1077,10 +1097,10 @@ class TargetFacilitySelectionView(Raise403PermissionRequiredMixin, FormView):
                         target.id,
                         target.name,
                         site,
-                        round(airmass_data[:, 1].min(), 1),
-                        airmass_data[:, 0][0].time().strftime("%H:%M:%S"),
-                        airmass_data[:, 0][imin].time().strftime("%H:%M:%S"),
-                        airmass_data[:, 0][-1].time().strftime("%H:%M:%S"),
+                        round(float(min_airmass[i]), 1),
+                        times[irise[i]].time().strftime("%H:%M:%S"),
+                        times[imin[i]].time().strftime("%H:%M:%S"),
+                        times[iset[i]].time().strftime("%H:%M:%S"),
                         str(duration).split('.')[0]
                     ]
 